@@ -0,0 +1,291 @@
+import os
+import bisect
+import hashlib
+import subprocess
+import numpy as np
+
+from dedup import full_hash
+from writers import atomic_file
+
+# Audio helpers working on the decoded 16 kHz mono float32 audio that whisper uses
+
+SAMPLE_RATE = 16000
+HOP_LENGTH = 160  # samples per mel frame, the unit of the "seek" field of the segments
+
+# Energy based voice activity detection: frames louder than the noise floor by
+# vad_margin_db are speech. The noise floor is estimated as a low percentile of
+# the frame energies, so it adapts to every recording.
+vad_frame_seconds = 0.03
+vad_margin_db = 12.0
+vad_min_threshold_db = -55.0  # below this it is silence whatever the noise floor
+vad_padding_seconds = 0.3  # kept around every speech region, not to cut words
+vad_merge_gap_seconds = 1.0  # regions closer than this are one region, the pause between them kept
+vad_min_speech_seconds = 0.25  # shorter blips are ignored
+
+# Long files are split into windows of about window_seconds, cut at the quietest point
+# within silence_search_seconds of the nominal boundary; neighbouring windows overlap by
+# overlap_seconds so that no word is lost at a cut.
+window_seconds = 600
+overlap_seconds = 10
+silence_search_seconds = 30
+
+# Decoded audio is cached on disk as float32 .npy files named after the hash of the whole
+# content of the media file, and memory mapped when loaded again: rerunning with another model,
+# language or prompt does not run ffmpeg again. The hash is computed once per version of a file
+# and remembered under keys/, by path, size and mtime (the sampled fingerprint of the manifest
+# is not enough here: two recordings of the same length with silence at the same places would
+# share an entry). Least recently used files are evicted above audio_cache_max_bytes (an hour
+# of audio takes about 230 MB).
+audio_cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "whisper-transcribe", "audio")
+audio_cache_max_bytes = 20 * 1024**3
+
+# containers whose video stream is never decoded, only their audio stream is demuxed
+video_extensions = {".mp4", ".mkv", ".avi"}
+
+
+def frame_energies_db(audio, frame_samples):
+    # RMS energy in dB of consecutive non-overlapping frames
+    frames = len(audio) // frame_samples
+    if frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    framed = np.asarray(audio[:frames * frame_samples], dtype=np.float32).reshape(frames, frame_samples)
+    rms = np.sqrt(np.mean(framed * framed, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+def merge_regions(regions, gap_samples):
+    # merges the (start, end) regions closer than gap_samples
+    merged = []
+    for start, end in regions:
+        if merged and start - merged[-1][1] <= gap_samples:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def detect_speech_regions(audio, sample_rate=SAMPLE_RATE):
+    # Returns the (start, end) sample ranges of audio that contain speech
+    frame_samples = int(sample_rate * vad_frame_seconds)
+    energies = frame_energies_db(audio, frame_samples)
+    if len(energies) == 0:
+        return []
+    noise_floor = np.percentile(energies, 10)
+    if energies.max() - noise_floor < vad_margin_db:
+        # no quiet part to measure the noise floor on (continuous speech, or only silence):
+        # all of it is speech, if it is loud enough to be any
+        return [(0, len(audio))] if energies.max() > vad_min_threshold_db else []
+    threshold = max(noise_floor + vad_margin_db, vad_min_threshold_db)
+    speech = energies > threshold
+
+    # runs of speech frames
+    changes = np.flatnonzero(np.diff(speech.astype(np.int8)))
+    boundaries = np.concatenate(([0], changes + 1, [len(speech)]))
+    padding = int(vad_padding_seconds * sample_rate)
+    regions = []
+    for first, last in zip(boundaries[:-1], boundaries[1:]):
+        if not speech[first]:
+            continue
+        start = max(0, first * frame_samples - padding)
+        end = min(len(audio), last * frame_samples + padding)
+        regions.append((int(start), int(end)))
+
+    regions = merge_regions(regions, int(vad_merge_gap_seconds * sample_rate))
+    min_samples = int(vad_min_speech_seconds * sample_rate) + 2 * padding
+    return [(start, end) for start, end in regions if end - start >= min_samples]
+
+def speech_fraction(regions, total_samples):
+    if total_samples == 0:
+        return 0.0
+    return sum(end - start for start, end in regions) / total_samples
+
+
+def shift_segments(segments, offset_seconds, first_id=0):
+    # Moves the segments (and their words) by offset_seconds on the timeline, renumbering them
+    offset_frames = round(offset_seconds * SAMPLE_RATE / HOP_LENGTH)
+    shifted = []
+    for index, segment in enumerate(segments):
+        segment = dict(segment)
+        segment["id"] = first_id + index
+        segment["start"] = round(segment["start"] + offset_seconds, 3)
+        segment["end"] = round(segment["end"] + offset_seconds, 3)
+        if "seek" in segment:
+            segment["seek"] += offset_frames
+        if "words" in segment:
+            segment["words"] = [
+                dict(word, start=round(word["start"] + offset_seconds, 3), end=round(word["end"] + offset_seconds, 3))
+                for word in segment["words"]
+            ]
+        shifted.append(segment)
+    return shifted
+
+def stitch_results(parts, cuts=None, language=None):
+    # Builds one transcription result, in the same format model.transcribe returns, out of
+    # (offset_seconds, result) parts in timeline order. Parts that overlap are separated by
+    # cuts (in samples, one between every two parts): of the segments transcribed twice in
+    # an overlap only the ones on the right side of the cut are kept.
+    bounds = [0.0] + [cut / SAMPLE_RATE for cut in cuts or []]
+    segments = []
+    for index, (offset_seconds, part) in enumerate(parts):
+        for segment in shift_segments(part["segments"], offset_seconds):
+            if cuts:
+                middle = (segment["start"] + segment["end"]) / 2
+                if middle < bounds[index] or (index + 1 < len(bounds) and middle >= bounds[index + 1]):
+                    continue
+            segment["id"] = len(segments)
+            segments.append(segment)
+        language = language or part.get("language")
+    return {
+        "text": "".join(segment["text"] for segment in segments),
+        "segments": segments,
+        "language": language,
+    }
+
+def concatenate_regions(audio, regions):
+    # The audio of the regions one after the other, and where every region starts in it:
+    # (position in the concatenation, start in audio, length), in samples
+    offsets = []
+    position = 0
+    for start, end in regions:
+        offsets.append((position, start, end - start))
+        position += end - start
+    return np.concatenate([audio[start:end] for start, end in regions]), offsets
+
+def original_time(seconds, offsets, end=False):
+    # a time in the concatenated regions, as the same moment of the original audio; a time on the
+    # join of two regions is the start of the second one, or the end of the first one with end
+    sample = seconds * SAMPLE_RATE
+    positions = [position for position, _, _ in offsets]
+    index = (bisect.bisect_left if end else bisect.bisect_right)(positions, sample) - 1
+    position, start, length = offsets[max(0, index)]
+    return round((start + min(max(sample - position, 0), length)) / SAMPLE_RATE, 3)
+
+def transcribe_speech_regions(model, audio, regions, language=None, **transcribe_options):
+    # Transcribes only the given regions of audio and maps the results back on the original timeline.
+    # The regions are joined and transcribed in one go: whisper fills every 30 second window with
+    # speech, and every window is conditioned on the text of the previous one.
+    speech, offsets = concatenate_regions(audio, regions)
+    result = model.transcribe(speech, language=language, **transcribe_options)
+    segments = []
+    for segment in result["segments"]:
+        segment = dict(segment)
+        if "seek" in segment:
+            segment["seek"] = round(original_time(segment["seek"] * HOP_LENGTH / SAMPLE_RATE, offsets) * SAMPLE_RATE / HOP_LENGTH)
+        segment["start"] = original_time(segment["start"], offsets)
+        segment["end"] = original_time(segment["end"], offsets, end=True)
+        if "words" in segment:
+            segment["words"] = [dict(word, start=original_time(word["start"], offsets), end=original_time(word["end"], offsets, end=True))
+                                for word in segment["words"]]
+        segments.append(segment)
+    return {"text": result["text"], "segments": segments, "language": result.get("language") or language}
+
+def split_into_windows(audio, sample_rate=SAMPLE_RATE):
+    # Returns the overlapping (start, end) windows of a long recording and the cuts between them,
+    # in samples. Recordings shorter than one and a half windows are a single window.
+    total = len(audio)
+    window = int(window_seconds * sample_rate)
+    if total <= window * 1.5:
+        return [(0, total)], []
+
+    frame_samples = int(sample_rate * vad_frame_seconds)
+    energies = frame_energies_db(audio, frame_samples)
+    search = int(silence_search_seconds * sample_rate) // frame_samples
+    cuts = []
+    position = 0
+    while total - position > window * 1.5:
+        nominal = (position + window) // frame_samples
+        low = max(nominal - search, position // frame_samples + 1)
+        high = min(nominal + search, len(energies))
+        quietest = low + int(np.argmin(energies[low:high]))
+        position = quietest * frame_samples + frame_samples // 2
+        cuts.append(position)
+
+    half_overlap = int(overlap_seconds * sample_rate) // 2
+    bounds = [0] + cuts + [total]
+    windows = [(max(0, start - half_overlap), min(total, end + half_overlap)) for start, end in zip(bounds[:-1], bounds[1:])]
+    return windows, cuts
+
+
+def decode_audio(file_path, sample_rate=SAMPLE_RATE, seconds=None):
+    # Same as whisper.load_audio, but for videos only the first audio stream is read
+    # (and with seconds, only the beginning of the audio)
+    command = ["ffmpeg", "-nostdin", "-threads", "0", "-i", file_path]
+    if seconds is not None:
+        command += ["-t", str(seconds)]
+    if os.path.splitext(file_path)[1].lower() in video_extensions:
+        command += ["-map", "0:a:0", "-vn", "-sn", "-dn"]
+    command += ["-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sample_rate), "-"]
+    try:
+        output = subprocess.run(command, capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as error:
+        raise RuntimeError(f"Failed to load audio: {error.stderr.decode()}") from error
+    return np.frombuffer(output, np.int16).astype(np.float32) / 32768.0
+
+def audio_cache_key(file_path, cache_dir):
+    # the hash of the whole content of file_path, read again only when the file changes
+    stat = os.stat(file_path)
+    version = f"{os.path.abspath(file_path)}\0{stat.st_size}\0{stat.st_mtime_ns}"
+    key_file = os.path.join(cache_dir, "keys", hashlib.blake2b(version.encode(), digest_size=16).hexdigest())
+    try:
+        with open(key_file) as f:
+            key = f.read()
+        os.utime(key_file)  # recently used
+        return key
+    except FileNotFoundError:
+        pass
+    key = full_hash(file_path)
+    os.makedirs(os.path.dirname(key_file), exist_ok=True)
+    with atomic_file(key_file) as f:
+        f.write(key)
+    return key
+
+def evict_audio_cache(cache_dir, max_bytes):
+    # removes the least recently used cached files until the cache fits in max_bytes, with
+    # the keys last used before them (at worst a file is hashed again)
+    cached = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".npy"):
+            stat = entry.stat()
+            cached.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in cached)
+    evicted_until = None
+    for used, size, path in sorted(cached):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        evicted_until = used
+    if evicted_until is None:
+        return
+    for entry in os.scandir(os.path.join(cache_dir, "keys")):
+        try:
+            if entry.stat().st_mtime <= evicted_until:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+def load_audio_cached(file_path, cache_dir=None, max_bytes=None):
+    # Returns the decoded audio of file_path, memory mapped from the cache (decoding it
+    # the first time). The mapping is copy-on-write: nothing is copied, and whoever
+    # modifies the array does not modify the cache.
+    cache_dir = cache_dir or audio_cache_dir
+    max_bytes = audio_cache_max_bytes if max_bytes is None else max_bytes
+    cache_file = os.path.join(cache_dir, f"{audio_cache_key(file_path, cache_dir)}-{SAMPLE_RATE}.npy")
+    try:
+        audio = np.load(cache_file, mmap_mode="c")
+        os.utime(cache_file)  # recently used
+        return audio
+    except (FileNotFoundError, ValueError):
+        pass
+
+    audio = decode_audio(file_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    # written aside and renamed, so that concurrent workers never map a half written file
+    with atomic_file(cache_file, "wb") as f:
+        np.save(f, audio)
+    evict_audio_cache(cache_dir, max_bytes)
+    try:
+        return np.load(cache_file, mmap_mode="c")
+    except FileNotFoundError:
+        return audio  # larger than the whole cache
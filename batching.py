@@ -0,0 +1,136 @@
+# Batched transcription of short clips: clips that fit in one whisper window (30 seconds)
+# are padded to the same length and go through the encoder and the greedy decoder
+# together, instead of one model.transcribe call (with its own mel computation,
+# language detection and decoding loop) per clip. whisper, torch and numpy are
+# imported only when a batch is actually transcribed.
+
+SAMPLE_RATE = 16000
+
+batch_max_seconds = 30  # only clips fitting in a single window are batched
+batch_group_batches = 4  # clips are sorted by length over this many batches before being split into batches
+
+# the thresholds model.transcribe uses to retry a window at a higher temperature: the clips
+# failing them are transcribed again on their own
+compression_ratio_threshold = 2.4
+logprob_threshold = -1.0
+no_speech_threshold = 0.6
+
+
+def group_by_length(clips, batch_size):
+    # Splits the (file, audio) clips into batches of batch_size clips of similar length, so
+    # that the clips of a batch need about as many decoding steps
+    clips = sorted(clips, key=lambda clip: len(clip[1]))
+    return [clips[start:start + batch_size] for start in range(0, len(clips), batch_size)]
+
+def split_segments(tokens, timestamp_begin, duration, time_precision=0.02):
+    # Splits the tokens decoded for a single window into (start, end, tokens) segments at the
+    # pairs of consecutive timestamp tokens, as model.transcribe does
+    is_timestamp = [token >= timestamp_begin for token in tokens]
+    single_timestamp_ending = is_timestamp[-2:] == [False, True]
+    slices = [index + 1 for index in range(len(tokens) - 1) if is_timestamp[index] and is_timestamp[index + 1]]
+    if not slices:
+        timestamps = [token for token in tokens if token >= timestamp_begin]
+        if timestamps and timestamps[-1] != timestamp_begin:
+            duration = (timestamps[-1] - timestamp_begin) * time_precision
+        return [(0.0, duration, tokens)]
+
+    if single_timestamp_ending:
+        slices.append(len(tokens))
+    segments = []
+    last_slice = 0
+    for current_slice in slices:
+        sliced_tokens = tokens[last_slice:current_slice]
+        segments.append(((sliced_tokens[0] - timestamp_begin) * time_precision,
+                         (sliced_tokens[-1] - timestamp_begin) * time_precision, sliced_tokens))
+        last_slice = current_slice
+    if last_slice < len(tokens) and not single_timestamp_ending:
+        # model.transcribe would decode the unfinished tail again in the next window, here
+        # it runs up to the end of the clip
+        sliced_tokens = tokens[last_slice:]
+        segments.append(((sliced_tokens[0] - timestamp_begin) * time_precision, duration, sliced_tokens))
+    return segments
+
+def is_silence(result):
+    # model.transcribe skips such a window
+    return result.no_speech_prob > no_speech_threshold and result.avg_logprob <= logprob_threshold
+
+def needs_fallback(result):
+    # True if model.transcribe would have decoded the window again at a higher temperature
+    return result.compression_ratio > compression_ratio_threshold or result.avg_logprob < logprob_threshold
+
+def log_mel_batch(audios, n_mels, device):
+    # The log-mel spectrograms of the clips, one (n_mels, 3000) window each, computed in one
+    # batch. Same values as whisper.log_mel_spectrogram clip by clip: the level every clip is
+    # normalized to is taken per clip, not over the batch.
+    import numpy as np
+    import torch
+    from whisper.audio import N_FFT, HOP_LENGTH, N_FRAMES, N_SAMPLES, mel_filters, pad_or_trim
+
+    length = max(len(audio) for audio in audios) + N_SAMPLES
+    padded = np.zeros((len(audios), length), dtype=np.float32)
+    for index, audio in enumerate(audios):
+        padded[index, :len(audio)] = audio
+    samples = torch.from_numpy(padded).to(device)
+    window = torch.hann_window(N_FFT).to(device)
+    stft = torch.stft(samples, N_FFT, HOP_LENGTH, window=window, return_complex=True)
+    magnitudes = stft[..., :-1].abs() ** 2
+    log_spec = torch.clamp(mel_filters(device, n_mels) @ magnitudes, min=1e-10).log10()
+    log_spec = torch.maximum(log_spec, log_spec.amax(dim=(-2, -1), keepdim=True) - 8.0)
+    log_spec = (log_spec + 4.0) / 4.0
+    # like model.transcribe, the content frames of a clip padded to a whole window
+    return torch.stack([pad_or_trim(log_spec[index, :, :len(audio) // HOP_LENGTH], N_FRAMES)
+                        for index, audio in enumerate(audios)])
+
+def transcribe_batch(model, audios, language=None, prompt="", fp16=False, word_timestamps=True):
+    # Transcribes clips of at most batch_max_seconds together. Returns a result per clip in
+    # the format of model.transcribe, or None for the clips to transcribe again on their own.
+    import torch
+    from whisper.audio import HOP_LENGTH, SAMPLE_RATE
+    from whisper.decoding import DecodingOptions, decode
+    from whisper.timing import add_word_timestamps
+    from whisper.tokenizer import get_tokenizer
+
+    if not model.is_multilingual:
+        language = "en"
+    dtype = torch.float16 if fp16 else torch.float32
+    mel = log_mel_batch(audios, model.dims.n_mels, model.device).to(dtype)
+    options = DecodingOptions(task="transcribe", language=language, temperature=0.0, fp16=fp16,
+                              prompt=prompt or None)
+    with torch.no_grad():
+        decoded = decode(model, mel, options)
+
+    results = []
+    for index, (audio, result) in enumerate(zip(audios, decoded)):
+        if is_silence(result):
+            results.append({"text": "", "segments": [], "language": result.language})
+            continue
+        if needs_fallback(result):
+            results.append(None)
+            continue
+        tokenizer = get_tokenizer(model.is_multilingual, num_languages=model.num_languages,
+                                  language=result.language, task="transcribe")
+        if not any(token < tokenizer.eot for token in result.tokens):
+            results.append({"text": "", "segments": [], "language": result.language})
+            continue
+        frames = len(audio) // HOP_LENGTH
+        segments = []
+        for start, end, tokens in split_segments(result.tokens, tokenizer.timestamp_begin, len(audio) / SAMPLE_RATE):
+            segments.append({
+                "seek": 0, "start": start, "end": end,
+                "text": tokenizer.decode([token for token in tokens if token < tokenizer.eot]),
+                "tokens": list(tokens), "temperature": result.temperature, "avg_logprob": result.avg_logprob,
+                "compression_ratio": result.compression_ratio, "no_speech_prob": result.no_speech_prob,
+            })
+        if word_timestamps:
+            add_word_timestamps(segments=segments, model=model, tokenizer=tokenizer, mel=mel[index],
+                                num_frames=frames, last_speech_timestamp=0.0)
+        for segment in segments:
+            # instantaneous or empty segments are cleared, as model.transcribe does
+            if segment["start"] == segment["end"] or segment["text"].strip() == "":
+                segment.update(text="", tokens=[], words=[])
+        results.append({
+            "text": tokenizer.decode([token for segment in segments for token in segment["tokens"]]),
+            "segments": [dict(id=position, **segment) for position, segment in enumerate(segments)],
+            "language": result.language,
+        })
+    return results
@@ -0,0 +1,82 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+# Throughput of short clips on the CPU: one model.transcribe call per clip against the batched
+# decoding of batching.py at several batch sizes. Real recordings give meaningful numbers
+# (pass a directory of clips); the synthetic clips (noise bursts) mostly measure the encoder.
+# Run with: python benchmarks/batching.py [--model tiny] [--clips DIRECTORY] [--batch-sizes 1,4,8,16]
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import batching
+from discovery import list_transcribable_files
+
+
+def synthetic_clips(count, seed=0):
+    import numpy as np
+    generator = np.random.default_rng(seed)
+    clips = []
+    for _ in range(count):
+        seconds = generator.uniform(5, 30)
+        samples = int(seconds * batching.SAMPLE_RATE)
+        envelope = (np.sin(np.linspace(0, seconds * 3, samples)) > 0).astype(np.float32)
+        clips.append((generator.standard_normal(samples) * 0.1 * envelope).astype(np.float32))
+    return clips
+
+def load_clips(directory, count):
+    from whisper import load_audio
+    clips = [load_audio(file) for file in list_transcribable_files(directory)]
+    return [clip for clip in clips if len(clip) <= batching.batch_max_seconds * batching.SAMPLE_RATE][:count]
+
+
+def run(transcribe_clips, clips):
+    start = time.perf_counter()
+    transcribe_clips(clips)
+    elapsed = time.perf_counter() - start
+    audio_seconds = sum(len(clip) for clip in clips) / batching.SAMPLE_RATE
+    return {"seconds": elapsed, "clips_per_second": len(clips) / elapsed, "realtime_factor": elapsed / audio_seconds}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="tiny")
+    parser.add_argument("--clips", help="directory of clips of up to 30 seconds (default: synthetic clips)")
+    parser.add_argument("--count", type=int, default=32)
+    parser.add_argument("--batch-sizes", default="1,4,8,16")
+    parser.add_argument("--language", default="en")
+    arguments = parser.parse_args(argv)
+
+    import torch
+    import whisper
+    torch.set_num_threads(os.cpu_count() or 1)
+    model = whisper.load_model(arguments.model, device="cpu")
+    clips = load_clips(arguments.clips, arguments.count) if arguments.clips else synthetic_clips(arguments.count)
+    options = dict(language=arguments.language, verbose=None, word_timestamps=True, fp16=False)
+    model.transcribe(clips[0], **options)  # warm up
+
+    def one_by_one(clips):
+        for clip in clips:
+            model.transcribe(clip, **options)
+
+    def batched(batch_size):
+        def transcribe_clips(clips):
+            for batch in batching.group_by_length(list(enumerate(clips)), batch_size):
+                results = batching.transcribe_batch(model, [clip for _, clip in batch], arguments.language)
+                for (_, clip), result in zip(batch, results):
+                    if result is None:
+                        model.transcribe(clip, **options)
+        return transcribe_clips
+
+    report = {"model": arguments.model, "clips": len(clips), "threads": torch.get_num_threads(),
+              "transcribe_per_clip": run(one_by_one, clips)}
+    for batch_size in (int(size) for size in arguments.batch_sizes.split(",")):
+        report[f"batch_{batch_size}"] = run(batched(batch_size), clips)
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import os
+import json
+import wave
+
+# Deterministic synthetic corpora for the benchmarks: directory trees of WAV files (tones, noise,
+# silence) generated from a seed, with no network. The same arguments always give the same files,
+# byte for byte, so that timings taken on different commits are taken on the same input.
+# Run with: python benchmarks/corpus.py DIRECTORY [files] [shape]
+
+SAMPLE_RATE = 16000
+
+signal_kinds = ["tone", "noise", "silence"]
+
+# how the files are spread over directories
+#   flat: all in the root
+#   wide: 100 files per directory, one level
+#   deep: ten subdirectories per directory, four levels, ten files in each leaf
+shapes = ["flat", "wide", "deep"]
+
+
+def synthesize(kind, seconds, seed, sample_rate=SAMPLE_RATE):
+    # 16 bit mono samples of a signal
+    import numpy as np
+    generator = np.random.default_rng(seed)
+    samples = int(seconds * sample_rate)
+    if kind == "tone":
+        frequency = generator.uniform(100, 1000)
+        signal = 0.5 * np.sin(2 * np.pi * frequency * np.arange(samples) / sample_rate)
+    elif kind == "noise":
+        signal = generator.normal(0, 0.1, samples)
+    elif kind == "silence":
+        signal = np.zeros(samples)
+    else:
+        raise ValueError(f"Unknown signal {kind}, expected one of {signal_kinds}")
+    return (np.clip(signal, -1, 1) * 32767).astype("<i2")
+
+def write_wav(path, samples, sample_rate=SAMPLE_RATE):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.tobytes())
+
+def relative_path(index, shape):
+    if shape == "flat":
+        return f"clip{index:06d}.wav"
+    if shape == "wide":
+        return os.path.join(f"dir{index // 100:04d}", f"clip{index:06d}.wav")
+    if shape == "deep":
+        digits = f"{index // 10:04d}"
+        return os.path.join(*(f"d{digit}" for digit in digits), f"clip{index:06d}.wav")
+    raise ValueError(f"Unknown shape {shape}, expected one of {shapes}")
+
+def make_corpus(root, files, shape="wide", lengths=(0.01,), kinds=signal_kinds, seed=0):
+    # Writes files WAVs under root, cycling through the lengths (seconds) and kinds of signal,
+    # and returns their paths. Short lengths keep a corpus of 100k files small (0.01 s is 366 bytes).
+    paths = []
+    for index in range(files):
+        path = os.path.join(root, relative_path(index, shape))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_wav(path, synthesize(kinds[index % len(kinds)], lengths[index % len(lengths)], seed + index))
+        paths.append(path)
+    return paths
+
+
+def synthetic_result(seconds=10.0, segments=4, language="en"):
+    # a small transcription in the current json format
+    step = seconds / segments
+    result_segments = [{"id": index, "seek": 0, "start": index * step, "end": (index + 1) * step,
+                        "text": f" segment number {index} of the clip",
+                        "words": [{"word": f" segment{index}", "start": index * step, "end": (index + 1) * step, "probability": 0.9}]}
+                       for index in range(segments)]
+    return {"text": "".join(segment["text"] for segment in result_segments), "segments": result_segments, "language": language}
+
+def add_json_outputs(paths, result):
+    # the json written by an earlier run, next to every file
+    text = json.dumps(result)
+    for path in paths:
+        with open(os.path.splitext(path)[0] + ".json", "w") as f:
+            f.write(text)
+
+def add_old_outputs(paths, result):
+    # the outputs of the first versions of transcribe.py: a txt and a json holding only the segments
+    segments = json.dumps([{key: segment[key] for key in ("id", "start", "end", "text")} for segment in result["segments"]])
+    for path in paths:
+        base = os.path.splitext(path)[0]
+        with open(base + ".json", "w") as f:
+            f.write(segments)
+        with open(base + ".txt", "w") as f:
+            f.write(result["text"])
+
+
+if __name__ == "__main__":
+    import sys
+    directory = sys.argv[1]
+    files = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    made = make_corpus(directory, files, sys.argv[3] if len(sys.argv) > 3 else "wide")
+    print(f"{len(made)} files under {directory}")
@@ -0,0 +1,40 @@
+import os
+import sys
+import time
+import json
+import statistics
+import subprocess
+
+# Measures how long the command line takes to start: `transcribe.py --help` and a bare
+# `import transcribe`, and checks that no heavy module is imported before real work begins.
+# Run with: python benchmarks/startup.py [runs]
+
+repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+heavy_modules = ["torch", "whisper", "numpy", "tkinter", "langdetect"]
+
+
+def time_command(command, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=repository, check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return {"median_seconds": statistics.median(timings), "min_seconds": min(timings), "runs": runs}
+
+
+def main(runs=10):
+    check = f"import sys, transcribe; print([m for m in {heavy_modules!r} if m in sys.modules])"
+    imported = subprocess.run([sys.executable, "-c", check], cwd=repository, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    report = {
+        "python": time_command([sys.executable, "-c", "pass"], runs),
+        "help": time_command([sys.executable, "transcribe.py", "--help"], runs),
+        "import": time_command([sys.executable, "-c", "import transcribe"], runs),
+        "heavy_modules_imported": json.loads(imported.replace("'", '"')),
+    }
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
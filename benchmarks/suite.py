@@ -0,0 +1,188 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import platform
+import argparse
+import statistics
+import contextlib
+import subprocess
+
+# Benchmarks of the parts of a run that do not depend on the model, over the synthetic corpora of
+# corpus.py, plus an end-to-end run with the tiny model when its checkpoint is already on disk:
+#   discovery:     list_transcribable_files over the corpus
+#   write_files:   writing every output format of every file
+#   json_probe:    a run over files that all have their outputs, without the manifest (every json is read)
+#   manifest_skip: the same run with a manifest filled by an earlier run
+#   migration:     a run over files with the outputs of the first versions (old json and txt), migrated
+#   end_to_end:    transcription of tones, noise and silence of several lengths with tiny
+# The report (JSON) holds the commit, the machine and the parameters; --compare prints how each
+# benchmark changed against a report of another commit.
+# Run with: python benchmarks/suite.py [--files 100000] [--shape wide] [--output report.json] [--compare baseline.json]
+
+repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repository)  # before benchmarks/, whose writers.py is not the writers module
+
+import corpus
+import transcribe
+from discovery import list_transcribable_files
+
+formats = transcribe.output_formats
+options = transcribe.format_options(formats, {"srt": 35, "vtt": 35})
+end_to_end_lengths = (1, 5, 30, 90)  # seconds, each as a tone, noise and silence
+
+
+def commit():
+    try:
+        head = subprocess.run(["git", "rev-parse", "HEAD"], cwd=repository, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repository,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return head + ("-dirty" if dirty else "")
+
+def remove_outputs(paths):
+    for path in paths:
+        base = os.path.splitext(path)[0]
+        for extension in [".txt", ".srt", ".vtt", ".tsv", ".json", ".json.old"]:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(base + extension)
+
+def not_transcribed(file, *args, **kwargs):
+    raise AssertionError(f"{file} should not be transcribed by this benchmark")
+
+def quiet_run(directory, model="tiny", **settings):
+    # a run without its output, which at this scale would take longer than the run itself
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        transcribe.perform_transcription(directory, model, options, formats, "", "en", **settings)
+
+
+def measure(run, setup=None, runs=3, files=None, audio_seconds=None):
+    # runs setup (not timed) then run, runs times
+    timings = []
+    for _ in range(runs):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    measured = {"median_seconds": statistics.median(timings), "min_seconds": min(timings), "runs": runs}
+    if files:
+        measured["files_per_second"] = files / measured["median_seconds"]
+    if audio_seconds:
+        measured["realtime_factor"] = measured["median_seconds"] / audio_seconds
+    return measured
+
+def benchmark_corpus(directory, files, shape, runs):
+    paths = corpus.make_corpus(directory, files, shape)
+    result = corpus.synthetic_result()
+    report = {}
+    report["discovery"] = measure(lambda: list_transcribable_files(directory), runs=runs, files=files)
+
+    def write_all():
+        for path in paths:
+            transcribe.write_files(path, result, os.path.dirname(path), options, formats)
+    report["write_files"] = measure(write_all, setup=lambda: remove_outputs(paths), runs=runs, files=files)
+
+    original_transcribe_file = transcribe.transcribe_file
+    transcribe.transcribe_file = not_transcribed
+    try:
+        report["json_probe"] = measure(lambda: quiet_run(directory, use_manifest=False), runs=runs, files=files)
+        quiet_run(directory)  # fills the manifest
+        report["manifest_skip"] = measure(lambda: quiet_run(directory), runs=runs, files=files)
+
+        def old_outputs():
+            remove_outputs(paths)
+            corpus.add_old_outputs(paths, result)
+        try:
+            import langdetect  # the migration detects the language of the old transcripts
+            report["migration"] = measure(lambda: quiet_run(directory, use_manifest=False), setup=old_outputs, runs=runs, files=files)
+        except ImportError:
+            report["migration"] = "langdetect is not installed"
+    finally:
+        transcribe.transcribe_file = original_transcribe_file
+    return report
+
+def tiny_checkpoint(checkpoint=None):
+    # the path of the tiny checkpoint if it is on disk: the benchmarks never download anything
+    if checkpoint:
+        return checkpoint if os.path.exists(checkpoint) else None
+    cache = os.path.join(os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")), "whisper", "tiny.pt")
+    return cache if os.path.exists(cache) else None
+
+def benchmark_end_to_end(directory, checkpoint, runs):
+    try:
+        import whisper  # noqa: F401
+    except ImportError:
+        return "whisper is not installed"
+    if shutil.which("ffmpeg") is None:
+        return "ffmpeg is not installed"
+    paths = []
+    for index, seconds in enumerate(end_to_end_lengths):
+        paths += corpus.make_corpus(os.path.join(directory, f"{seconds}s"), len(corpus.signal_kinds), "flat",
+                                    lengths=(seconds,), seed=index * 100)
+    audio_seconds = len(corpus.signal_kinds) * sum(end_to_end_lengths)
+    measured = measure(lambda: quiet_run(directory, checkpoint, use_manifest=False, deduplicate=False),
+                       setup=lambda: remove_outputs(paths), runs=runs, files=len(paths), audio_seconds=audio_seconds)
+    measured["checkpoint"] = checkpoint
+    return measured
+
+
+def compare(report, baseline):
+    # the ratio of every median against the baseline (below 1 is faster)
+    ratios = {}
+    for name, measured in report["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if isinstance(measured, dict) and isinstance(before, dict) and before.get("median_seconds"):
+            ratios[name] = measured["median_seconds"] / before["median_seconds"]
+    return ratios
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=10000, help="files in the corpus (default: %(default)s)")
+    parser.add_argument("--shape", default="wide", choices=corpus.shapes)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--checkpoint", help="path of the tiny checkpoint (default: whisper's download cache)")
+    parser.add_argument("--skip-end-to-end", action="store_true")
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--compare", metavar="REPORT", help="a report of another commit to compare with")
+    arguments = parser.parse_args(argv)
+
+    report = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "machine": {"system": platform.system(), "processor": platform.machine(), "cpus": os.cpu_count()},
+        "parameters": {"files": arguments.files, "shape": arguments.shape, "runs": arguments.runs},
+        "results": {},
+    }
+    directory = tempfile.mkdtemp(prefix="whisper-transcribe-benchmark-")
+    try:
+        report["results"].update(benchmark_corpus(os.path.join(directory, "corpus"), arguments.files, arguments.shape, arguments.runs))
+        checkpoint = tiny_checkpoint(arguments.checkpoint)
+        if arguments.skip_end_to_end:
+            pass
+        elif checkpoint is None:
+            report["results"]["end_to_end"] = "no tiny checkpoint on disk"
+        else:
+            report["results"]["end_to_end"] = benchmark_end_to_end(os.path.join(directory, "end_to_end"), checkpoint, arguments.runs)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    if arguments.compare:
+        with open(arguments.compare) as f:
+            baseline = json.load(f)
+        report["compared_with"] = {"commit": baseline.get("commit"), "ratios": compare(report, baseline)}
+        if baseline.get("parameters") != report["parameters"] or baseline.get("machine") != report["machine"]:
+            report["compared_with"]["warning"] = "measured with other parameters or on another machine"
+    text = json.dumps(report, indent=2)
+    print(text)
+    if arguments.output:
+        with open(arguments.output, "w") as f:
+            f.write(text + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    main()
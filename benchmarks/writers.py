@@ -0,0 +1,111 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import statistics
+
+# Compares writing all five output formats of a large transcription with whisper's writers
+# (one get_writer and one pass over the result per format, as transcribe.py used to do)
+# and with the single pass engine of writers.py, and checks that both produce the same bytes.
+# Run with: python benchmarks/writers.py [segments] [runs]
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import writers
+
+options = {
+    "txt": {}, "tsv": {}, "json": {},
+    "srt": {"max_words_per_line": 35, "highlight_words": False, "max_line_count": 1},
+    "vtt": {"max_words_per_line": 35, "highlight_words": False, "max_line_count": 1},
+}
+
+
+def synthetic_result(segments, words_per_segment=20, seed=0):
+    # about 8 seconds of speech per segment, with word timestamps
+    generator = random.Random(seed)
+    vocabulary = ["the", "quick", "brown", "fox", "jumps", "over", "lazy", "dog", "ciao", "mondo"]
+    result_segments = []
+    position = 0.0
+    for index in range(segments):
+        words = []
+        for _ in range(words_per_segment):
+            start = position + generator.uniform(0.0, 0.1)
+            end = start + generator.uniform(0.1, 0.5)
+            words.append({"word": " " + generator.choice(vocabulary), "start": round(start, 2),
+                          "end": round(end, 2), "probability": 0.9})
+            position = end
+        result_segments.append({"id": index, "seek": 0, "start": words[0]["start"], "end": words[-1]["end"],
+                                "text": "".join(word["word"] for word in words), "tokens": list(range(words_per_segment)),
+                                "temperature": 0.0, "avg_logprob": -0.2, "compression_ratio": 1.5,
+                                "no_speech_prob": 0.01, "words": words})
+    return {"text": "".join(segment["text"] for segment in result_segments), "segments": result_segments, "language": "en"}
+
+
+def whisper_writers(audio, result, directory):
+    from whisper.utils import get_writer
+    for fmt in writers.output_formats:
+        path = writers.output_path(audio, fmt, directory)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            continue
+        get_writer(fmt, directory)(result, audio, options[fmt])
+
+def single_pass(audio, result, directory):
+    writers.write_outputs(audio, result, options, writers.output_formats, directory)
+
+def single_pass_without_fsync(audio, result, directory):
+    writers.fsync_outputs = False
+    try:
+        single_pass(audio, result, directory)
+    finally:
+        writers.fsync_outputs = True
+
+
+def time_writer(write, result, runs):
+    timings = []
+    for _ in range(runs):
+        directory = tempfile.mkdtemp()
+        try:
+            start = time.perf_counter()
+            write(os.path.join(directory, "talk.mp3"), result, directory)
+            timings.append(time.perf_counter() - start)
+        finally:
+            shutil.rmtree(directory)
+    return {"median_seconds": statistics.median(timings), "min_seconds": min(timings), "runs": runs}
+
+def same_outputs(result):
+    first, second = tempfile.mkdtemp(), tempfile.mkdtemp()
+    try:
+        whisper_writers(os.path.join(first, "talk.mp3"), result, first)
+        single_pass(os.path.join(second, "talk.mp3"), result, second)
+        for fmt in writers.output_formats:
+            with open(os.path.join(first, "talk." + fmt), "rb") as a, open(os.path.join(second, "talk." + fmt), "rb") as b:
+                if a.read() != b.read():
+                    return False
+        return True
+    finally:
+        shutil.rmtree(first)
+        shutil.rmtree(second)
+
+
+def main(segments=5000, runs=5):
+    result = synthetic_result(segments)
+    report = {
+        "segments": segments,
+        "audio_hours": result["segments"][-1]["end"] / 3600,
+        "single_pass": time_writer(single_pass, result, runs),
+        "single_pass_without_fsync": time_writer(single_pass_without_fsync, result, runs),
+    }
+    try:
+        report["whisper_writers"] = time_writer(whisper_writers, result, runs)
+        report["identical_outputs"] = same_outputs(result)
+    except ImportError:
+        report["whisper_writers"] = "whisper is not installed"
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main(*(int(argument) for argument in sys.argv[1:3]))
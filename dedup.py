@@ -0,0 +1,170 @@
+import os
+import hashlib
+
+from manifest import fingerprint_file, fingerprint_block_size
+
+# Finds the files whose content was already transcribed (the same lecture copied into several
+# course folders), so that they are transcribed once and the copies get their outputs from the
+# first one's result. The files are compared in steps, each one only for the files the previous
+# one matched:
+#   the size and a hash of a few sampled blocks (manifest.fingerprint_file), read for every file,
+#   a hash of the whole content, only when the sampled fingerprints collide,
+#   optionally a fingerprint of the decoded audio, which also matches the same recording encoded
+#   differently (a .mp4 and the .m4a extracted from it). It runs ffmpeg on every new file, so it
+#   is off by default.
+
+full_hash_block_size = 1024 * 1024
+
+# The audio fingerprint gives every audio_frame_seconds of audio 16 bits: whether the energy
+# difference between neighbouring frequency bands (over audio_window_seconds, the windows
+# overlap so that a small offset hardly changes them) grew since the previous frame. These survive
+# lossy encoding, resampling and volume changes; two recordings are the same if at most
+# audio_match_bit_errors of their bits differ, allowing them to be shifted by up to
+# audio_max_shift_frames (an extraction that starts a little later).
+audio_frame_seconds = 0.1
+audio_window_seconds = 0.4
+audio_band_edges_hz = (300, 3000)
+audio_bands = 17  # 16 differences, 2 bytes per frame
+audio_match_bit_errors = 0.3  # unrelated recordings differ in about half of them
+audio_max_shift_frames = 10
+audio_min_set_bits = 0.1  # silence (or a constant tone) sets almost no bits and would match anything
+
+
+def full_hash(file_path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        while True:
+            block = f.read(full_hash_block_size)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+def audio_fingerprint(audio, sample_rate=16000):
+    # the fingerprint (bytes) of decoded mono audio, None if it is too uniform to tell recordings apart
+    import numpy as np
+    hop = int(sample_rate * audio_frame_seconds)
+    frame_samples = int(sample_rate * audio_window_seconds)
+    audio = np.asarray(audio, dtype=np.float32)
+    frames = (len(audio) - frame_samples) // hop + 1
+    if frames < 2:
+        return None
+    frequencies = np.fft.rfftfreq(frame_samples, 1 / sample_rate)
+    edges = np.geomspace(audio_band_edges_hz[0], audio_band_edges_hz[1], audio_bands + 1)
+    band_of_bin = np.digitize(frequencies, edges) - 1
+    bands = np.zeros((len(frequencies), audio_bands), dtype=np.float32)
+    inside = (band_of_bin >= 0) & (band_of_bin < audio_bands)
+    bands[np.nonzero(inside)[0], band_of_bin[inside]] = 1.0
+    window = np.hanning(frame_samples).astype(np.float32)
+    framed = np.lib.stride_tricks.sliding_window_view(audio, frame_samples)[::hop]
+    energies = np.empty((frames, audio_bands), dtype=np.float32)
+    chunk_frames = 1024  # an hour of audio at once would take GBs of spectrum
+    for start in range(0, frames, chunk_frames):
+        power = np.abs(np.fft.rfft(framed[start:start + chunk_frames] * window, axis=1)) ** 2
+        energies[start:start + chunk_frames] = power.astype(np.float32) @ bands
+    levels = np.log(energies + 1e-10)
+    differences = levels[:, :-1] - levels[:, 1:]
+    bits = differences[1:] > differences[:-1]
+    if bits.mean() < audio_min_set_bits:
+        return None
+    return np.packbits(bits, axis=1).tobytes()
+
+def audio_fingerprints_match(first, second):
+    import numpy as np
+    first = np.unpackbits(np.frombuffer(first, np.uint8)).reshape(-1, audio_bands - 1)
+    second = np.unpackbits(np.frombuffer(second, np.uint8)).reshape(-1, audio_bands - 1)
+    if abs(len(first) - len(second)) > 2 * audio_max_shift_frames:
+        return False
+    for shift in range(-audio_max_shift_frames, audio_max_shift_frames + 1):
+        a = first[max(0, shift):]
+        b = second[max(0, -shift):]
+        overlap = min(len(a), len(b))
+        if overlap < max(len(first), len(second)) / 2:
+            continue
+        if np.mean(a[:overlap] != b[:overlap]) <= audio_match_bit_errors:
+            return True
+    return False
+
+
+class Deduplicator:
+    # original(file) returns an earlier file with the same content: one added during this run
+    # (with add) or, with a manifest, one recorded by an earlier run. Full hashes and audio
+    # fingerprints are cached in the manifest, an original is hashed once for all its copies.
+
+    def __init__(self, manifest=None, audio=False, read_audio=None):
+        self.manifest = manifest
+        self.audio = audio
+        self.read_audio = read_audio  # file -> decoded 16 kHz audio, for the audio fingerprints
+        self.contents = {}  # (size, sampled fingerprint): files added in this run
+        self.recordings = []  # (file, audio fingerprint) of the files added in this run
+        self.computed = {}  # file: (size, mtime_ns, {"full_hash", "audio_fingerprint"})
+
+    def cached(self, file_path, stat):
+        computed = self.computed.get(file_path)
+        if computed is not None and computed[:2] == (stat.st_size, stat.st_mtime_ns):
+            return computed[2]
+        values = (self.manifest.cached_content(file_path, stat) if self.manifest is not None else None) or {}
+        self.computed[file_path] = (stat.st_size, stat.st_mtime_ns, values)
+        return values
+
+    def compute(self, file_path, stat, name, function):
+        values = self.cached(file_path, stat)
+        if values.get(name) is None:
+            values[name] = function(file_path)
+            if self.manifest is not None and values[name] is not None:
+                self.manifest.record_content(file_path, stat, **{name: values[name]})
+        return values[name]
+
+    def full_hash(self, file_path, stat):
+        if stat.st_size <= 3 * fingerprint_block_size:
+            return None  # the sampled fingerprint already covers the whole file
+        return self.compute(file_path, stat, "full_hash", full_hash)
+
+    def audio_fingerprint(self, file_path, stat):
+        def fingerprint(file_path):
+            try:
+                return audio_fingerprint(self.read_audio(file_path))
+            except RuntimeError as error:  # ffmpeg cannot decode it, transcription will say why
+                print(f"Cannot fingerprint the audio of {file_path}: {error}")
+                return None
+        return self.compute(file_path, stat, "audio_fingerprint", fingerprint)
+
+    def original(self, file_path, stat=None):
+        stat = stat or os.stat(file_path)
+        fingerprint = fingerprint_file(file_path, stat.st_size)
+        candidates = list(self.contents.get((stat.st_size, fingerprint), []))
+        if self.manifest is not None:
+            candidates += [candidate for candidate in self.manifest.files_with_fingerprint(stat.st_size, fingerprint)
+                           if candidate not in candidates]
+        for candidate in candidates:
+            if candidate == file_path:
+                continue
+            try:
+                candidate_stat = os.stat(candidate)
+            except OSError:
+                continue
+            if self.full_hash(candidate, candidate_stat) == self.full_hash(file_path, stat):
+                return candidate
+
+        if not self.audio:
+            return None
+        recording = self.audio_fingerprint(file_path, stat)
+        if recording is None:
+            return None
+        candidates = list(self.recordings)
+        if self.manifest is not None:
+            margin = 2 * audio_max_shift_frames * (audio_bands - 1) // 8
+            candidates += self.manifest.audio_fingerprints(len(recording) - margin, len(recording) + margin)
+        for candidate, candidate_recording in candidates:
+            if candidate != file_path and audio_fingerprints_match(recording, candidate_recording):
+                return candidate
+        return None
+
+    def add(self, file_path, stat=None):
+        # file_path is (being) transcribed: the next files with the same content are its copies
+        stat = stat or os.stat(file_path)
+        self.contents.setdefault((stat.st_size, fingerprint_file(file_path, stat.st_size)), []).append(file_path)
+        if self.audio:
+            recording = self.audio_fingerprint(file_path, stat)
+            if recording is not None:
+                self.recordings.append((file_path, recording))
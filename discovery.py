@@ -0,0 +1,102 @@
+import os
+import queue
+import threading
+
+# Define a list of transcribable file extensions
+transcribable_extensions = ['.mp3', '.wav', '.m4a', '.mp4', '.mkv', '.avi']
+transcribable_extension_set = frozenset(transcribable_extensions)
+
+# directories that are never descended into (hidden directories are skipped too)
+ignored_directories = {"__pycache__", "node_modules", "$RECYCLE.BIN", "System Volume Information", "@eaDir"}
+
+
+def is_transcribable(name):
+    return not name.startswith('.') and os.path.splitext(name)[1].lower() in transcribable_extension_set
+
+def iter_transcribable_files(directory):
+    # Yields the transcribable files under directory as they are found, in the same
+    # top-down order as os.walk, reading every directory with a single os.scandir
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = os.scandir(current)
+        except OSError as error:
+            print(f"Cannot read {current}: {error}")
+            continue
+        subdirectories = []
+        with entries:
+            for entry in entries:
+                try:
+                    is_directory = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if is_directory:
+                    if not entry.name.startswith('.') and entry.name not in ignored_directories:
+                        subdirectories.append(entry.path)
+                elif is_transcribable(entry.name):
+                    yield entry.path
+        stack.extend(reversed(subdirectories))
+
+# Function to list transcribable files in a directory
+def list_transcribable_files(directory):
+    return list(iter_transcribable_files(directory))
+
+
+class Discovery:
+    # Walks the tree on a background thread and hands the files over through a bounded
+    # queue, so transcription starts with the first file found instead of after the walk.
+    # found is the number of files discovered so far, done tells whether it is final.
+
+    finished = object()
+
+    def __init__(self, directory, maxsize=1000):
+        self.directory = directory
+        self.queue = queue.Queue(maxsize)
+        self.found = 0
+        self.done = False
+        self.error = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.walk, daemon=True)
+        self.thread.start()
+
+    def walk(self):
+        try:
+            for file in iter_transcribable_files(self.directory):
+                self.found += 1
+                while not self.stopped.is_set():
+                    try:
+                        self.queue.put(file, timeout=0.5)
+                        break
+                    except queue.Full:
+                        pass
+                if self.stopped.is_set():
+                    return
+        except BaseException as error:
+            self.error = error
+        finally:
+            self.done = True
+            if not self.stopped.is_set():
+                self.queue.put(self.finished)
+
+    def __iter__(self):
+        while True:
+            file = self.queue.get()
+            if file is self.finished:
+                break
+            yield file
+        if self.error is not None:
+            raise self.error
+
+    def progress(self):
+        # e.g. "12/340" once the walk is over, "12/57+" while it is still going
+        return f"{self.found}" + ("" if self.done else "+")
+
+    def stop(self):
+        self.stopped.set()
+        # unblock the walker if it is waiting on a full queue
+        try:
+            while True:
+                self.queue.get_nowait()
+        except queue.Empty:
+            pass
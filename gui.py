@@ -0,0 +1,308 @@
+import os
+import queue
+import threading
+import tkinter as tk
+from tkinter import filedialog, ttk
+from transcribe import LANGUAGES, LANGUAGES_CODES, precisions, schedule_policies, format_options, perform_transcription, TranscriptionControl
+
+# Graphical front end over perform_transcription, started by transcribe.py without arguments.
+# The transcription runs on a background thread: its progress events go through a queue
+# that the Tk loop polls every poll_interval milliseconds, so the window never freezes.
+
+poll_interval = 200
+
+
+def choose_directory():
+    # Initialize the Tkinter root element
+    desktop_path = os.path.join(os.path.expanduser('~'), 'Desktop')
+    root = tk.Tk()
+    root.withdraw()  # Hide the main window
+    # Open a dialog window for choosing a directory
+    directory_path = filedialog.askdirectory(initialdir=desktop_path)
+    return directory_path
+
+
+def format_seconds(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def start_ui():
+    def open_directory_selector():
+        selected_directory = filedialog.askdirectory()  # Apre il dialogo di selezione directory
+        if selected_directory:  # Se l'utente seleziona una directory
+            directory_path.set(selected_directory)  # Aggiorna la variabile legata all'edit box
+            directory_entry.delete(0, tk.END)  # Rimuove il testo attuale dall'edit box
+            directory_entry.insert(tk.END, selected_directory)  # Inserisce il nuovo percorso nella edit box 
+            transcription_button.config(state=tk.NORMAL)  # Enable the transcription button
+  
+
+    def start_transcription():
+        # Logica per iniziare la trascrizione
+        print("Inizio trascrizione...")
+
+        chosen_model = selected_model.get()
+        print("Selected model:", chosen_model)
+
+        if chosen_model[-3:] == ".en":      selected_language = "english"
+        else:                               selected_language = language.get()
+        selected_language_code=LANGUAGES_CODES[selected_language]
+        print(f"language {selected_language_code} ({selected_language}) with the model: {selected_model.get()}")
+
+        selected_formats = [fmt for fmt, var in format_vars.items() if var.get()]
+        print("selected_formats:", selected_formats)
+
+        directory_to_check = directory_entry.get()
+        print("directory_to_check:", directory_to_check)
+
+        prompt_to_send = prompt_entry.get()
+        print("prompt_to_send:", prompt_to_send)            
+        # Gather options for each selected format
+        options = format_options(selected_formats, {fmt: entry.get() for fmt, entry in max_line_width_entries.items()})
+
+        # Print the options for debugging
+        print("Options:", options)
+        workers = max(1, int(workers_entry.get()))
+        print("workers:", workers)
+
+        precision = precision_var.get()
+        budget_text = budget_entry.get().strip()
+        model_cache_budget = int(float(budget_text) * 1024**3) if budget_text else None
+        print("precision:", precision, "model memory budget:", model_cache_budget)
+        vad = vad_var.get()
+        split_long_files = split_var.get()
+        audio_cache = audio_cache_var.get()
+        print("skip silence:", vad, "split long files:", split_long_files, "cache decoded audio:", audio_cache)
+        batch_size = max(1, int(batch_entry.get()))
+        print("batch size:", batch_size)
+        schedule_policy = schedule_var.get()
+        priorities = [directory.strip() for directory in priority_entry.get().split(",") if directory.strip()]
+        print("order:", schedule_policy, "priorities:", priorities)
+
+        control = TranscriptionControl()
+        running["control"] = control
+
+        def run():
+            try:
+                perform_transcription(directory_to_check, chosen_model, options, selected_formats,prompt_to_send,selected_language_code, workers,
+                                      precision=precision, model_cache_budget=model_cache_budget, vad=vad, split_long_files=split_long_files,
+                                      audio_cache=audio_cache, progress=events.put, control=control, batch_size=batch_size,
+                                      schedule_policy=schedule_policy, priorities=priorities)
+            except BaseException as error:
+                events.put({"event": "error", "error": f"{type(error).__name__}: {error}"})
+            finally:
+                events.put({"event": "stopped"})
+
+        threading.Thread(target=run, daemon=True).start()
+        transcription_button.config(state=tk.DISABLED)
+        pause_button.config(state=tk.NORMAL, text="Pausa")
+        cancel_button.config(state=tk.NORMAL)
+        status_text.set("Inizio trascrizione...")
+
+    def toggle_pause():
+        control = running.get("control")
+        if control is None:
+            return
+        if control.is_paused():
+            control.resume()
+            pause_button.config(text="Pausa")
+            status_text.set("Ripresa")
+        else:
+            control.pause()
+            pause_button.config(text="Riprendi")
+            status_text.set("In pausa dopo il segmento corrente...")
+
+    def cancel_transcription():
+        control = running.get("control")
+        if control is not None:
+            control.cancel()
+            cancel_button.config(state=tk.DISABLED)
+            pause_button.config(state=tk.DISABLED)
+            status_text.set("Annullamento dopo il segmento corrente...")
+
+    def show(line):
+        feedback_text.insert(tk.END, line + "\n")
+        feedback_text.see(tk.END)
+
+    def poll_events():
+        try:
+            while True:
+                handle_event(events.get_nowait())
+        except queue.Empty:
+            pass
+        root.after(poll_interval, poll_events)
+
+    def handle_event(event):
+        kind = event["event"]
+        if kind == "estimate":
+            show(f"{event['files']} file da trascrivere, {format_seconds(event['audio_seconds'])} di audio"
+                 + (f", tempo previsto {format_seconds(event['eta'])}" if event["eta"] is not None else ""))
+        elif kind == "file":
+            show(f"[{event['index']}/{event['found']}] {event['file']}")
+        elif kind == "audio":
+            status = f"{os.path.basename(event['file'])}: {event['percent']:.0f}%"
+            if event["realtime_factor"]:
+                status += f", {1 / event['realtime_factor']:.1f}x tempo reale"
+            if event["eta"] is not None:
+                status += f", ETA {format_seconds(event['eta'])}"
+            status_text.set(status)
+        elif kind == "done":
+            show(f"Trascritto {event['file']} ({format_seconds(event['audio_seconds'])} di audio)")
+        elif kind in ("finished", "cancelled"):
+            show(f"{'Trascrizione completata' if kind == 'finished' else 'Trascrizione annullata'}: "
+                 f"{format_seconds(event['audio_seconds'])} di audio in {format_seconds(event['seconds'])}")
+            status_text.set("")
+        elif kind == "error":
+            show(f"Errore: {event['error']}")
+            status_text.set("")
+        elif kind == "stopped":
+            running.pop("control", None)
+            transcription_button.config(state=tk.NORMAL)
+            pause_button.config(state=tk.DISABLED, text="Pausa")
+            cancel_button.config(state=tk.DISABLED)
+
+        
+    # Inizializza l'interfaccia grafica principale
+    root = tk.Tk()
+    root.title("Trascrittore Whisper")
+
+    # Directory frame
+    directory_frame = tk.Frame(root)
+    directory_frame.pack(pady=10)
+    directory_path = tk.StringVar()
+    tk.Label(directory_frame, text="Directory:").pack(side=tk.LEFT)
+    directory_entry = tk.Entry(directory_frame, textvariable=directory_path, width=50)
+    directory_entry.pack(side=tk.LEFT)
+    tk.Button(directory_frame, text="Sfoglia", command=open_directory_selector).pack(side=tk.LEFT)
+
+    # Model frame
+    model_frame = tk.Frame(root)
+    model_frame.pack(pady=10)
+    selected_model = tk.StringVar(value="medium.en")
+
+    standard_models_frame = tk.LabelFrame(model_frame, text="Standard models")
+    standard_models_frame.pack(side=tk.LEFT, padx=10)
+    english_models_frame = tk.LabelFrame(model_frame, text="English models")
+    english_models_frame.pack(side=tk.LEFT, padx=10)
+
+    models = [("tiny", standard_models_frame), ("small", standard_models_frame), 
+              ("base", standard_models_frame), ("medium", standard_models_frame), 
+              ("large", standard_models_frame), ("tiny.en", english_models_frame), 
+              ("small.en", english_models_frame), ("base.en", english_models_frame), 
+              ("medium.en", english_models_frame)]
+    
+    for model, frame in models:
+        tk.Radiobutton(frame, text=model, variable=selected_model, value=model).pack(anchor=tk.W)
+
+
+    # Elenco delle lingue supportate
+
+    selected_language = tk.StringVar()
+
+
+    # Menu a discesa per la selezione della lingua
+    language_frame = tk.Frame(standard_models_frame)
+    language_frame.pack(fill=tk.X, expand=True)
+    #    tk.Label(language_frame, text="Language:").pack(side=tk.LEFT)
+    language = tk.StringVar()
+    language_combobox = ttk.Combobox(language_frame, textvariable=language, state="readonly")
+    # Usa i nomi completi delle lingue come valori nel menu a discesa
+    language_combobox['values'] = list(LANGUAGES.values())
+    language_combobox.pack(side=tk.LEFT, fill=tk.X, expand=True)
+    language_combobox.set('italian')  # Imposta un valore predefinito, se necessario
+
+    # Format frame
+    format_frame = tk.LabelFrame(root, text="Output Formats")
+    format_frame.pack(pady=10)
+    formats = ["txt", "srt", "vtt", "tsv", "json"]
+    format_vars = {fmt: tk.BooleanVar(value=True) for fmt in formats}
+    max_line_width_entries = {}  # Dictionary to hold max line width entry widgets
+
+    feedback_frame = tk.Frame(root)
+    feedback_frame.pack(pady=10, fill=tk.BOTH, expand=True)
+    feedback_text = tk.Text(feedback_frame, height=10)
+    feedback_text.pack(fill=tk.BOTH, expand=True)
+
+    for fmt in formats:
+        checkbox_frame = tk.Frame(format_frame)
+        checkbox_frame.pack(anchor=tk.W)
+
+        checkbox = tk.Checkbutton(checkbox_frame, text=fmt.upper(), variable=format_vars[fmt])
+        checkbox.pack(side=tk.LEFT)
+
+        if fmt in ["srt","vtt"]:
+            max_line_width_var = tk.StringVar(value="35")  # Default max line width
+            tk.Label(checkbox_frame, text="Max words per line:").pack(side=tk.LEFT)
+            max_line_width_entry = tk.Entry(checkbox_frame, textvariable=max_line_width_var, width=5)
+            max_line_width_entry.pack(side=tk.LEFT)
+            max_line_width_entries[fmt] = max_line_width_entry  # Store entry widget in dictionary
+
+    #feedback_frame.pack(pady=10, fill=tk.BOTH, expand=True)
+    #feedback_text = tk.Text(feedback_frame, height=10)
+    #feedback_text.pack(fill=tk.BOTH, expand=True)
+
+    # Prompt frame
+    prompt_frame = tk.Frame(root)
+    prompt_frame.pack(pady=10)
+    prompt_text = tk.StringVar()
+    tk.Label(prompt_frame, text="Prompt:").pack(side=tk.LEFT)
+    prompt_entry = tk.Entry(prompt_frame, textvariable=prompt_text, width=50)
+    prompt_entry.pack(side=tk.LEFT)
+
+    # Workers frame
+    workers_frame = tk.Frame(root)
+    workers_frame.pack(pady=10)
+    workers_text = tk.StringVar(value="1")
+    tk.Label(workers_frame, text="Worker processes:").pack(side=tk.LEFT)
+    workers_entry = tk.Entry(workers_frame, textvariable=workers_text, width=5)
+    workers_entry.pack(side=tk.LEFT)
+    precision_var = tk.StringVar(value="fp32")
+    tk.Label(workers_frame, text="Precision:").pack(side=tk.LEFT)
+    ttk.Combobox(workers_frame, textvariable=precision_var, values=precisions, state="readonly", width=6).pack(side=tk.LEFT)
+    budget_text = tk.StringVar(value="")
+    tk.Label(workers_frame, text="Model memory (GB, empty = no limit):").pack(side=tk.LEFT)
+    budget_entry = tk.Entry(workers_frame, textvariable=budget_text, width=5)
+    budget_entry.pack(side=tk.LEFT)
+    vad_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(workers_frame, text="Skip silence", variable=vad_var).pack(side=tk.LEFT)
+    split_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(workers_frame, text="Split each file across workers", variable=split_var).pack(side=tk.LEFT)
+    audio_cache_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(workers_frame, text="Cache decoded audio", variable=audio_cache_var).pack(side=tk.LEFT)
+    batch_text = tk.StringVar(value="1")
+    tk.Label(workers_frame, text="Short clips per batch:").pack(side=tk.LEFT)
+    batch_entry = tk.Entry(workers_frame, textvariable=batch_text, width=5)
+    batch_entry.pack(side=tk.LEFT)
+
+    # Schedule frame
+    schedule_frame = tk.Frame(root)
+    schedule_frame.pack(pady=10)
+    schedule_var = tk.StringVar(value="walk")
+    tk.Label(schedule_frame, text="Order:").pack(side=tk.LEFT)
+    ttk.Combobox(schedule_frame, textvariable=schedule_var, values=schedule_policies, state="readonly", width=9).pack(side=tk.LEFT)
+    priority_text = tk.StringVar(value="")
+    tk.Label(schedule_frame, text="Priority subdirectories (comma separated):").pack(side=tk.LEFT)
+    priority_entry = tk.Entry(schedule_frame, textvariable=priority_text, width=30)
+    priority_entry.pack(side=tk.LEFT)
+
+    # Transcription buttons
+    buttons_frame = tk.Frame(root)
+    buttons_frame.pack(pady=10)
+    transcription_button = tk.Button(buttons_frame, text="Start Transcription", command=start_transcription)
+    transcription_button.pack(side=tk.LEFT)
+    transcription_button.config(state=tk.DISABLED)  # Disable the transcription button initially
+    pause_button = tk.Button(buttons_frame, text="Pausa", command=toggle_pause, state=tk.DISABLED)
+    pause_button.pack(side=tk.LEFT, padx=5)
+    cancel_button = tk.Button(buttons_frame, text="Annulla", command=cancel_transcription, state=tk.DISABLED)
+    cancel_button.pack(side=tk.LEFT)
+    status_text = tk.StringVar()
+    tk.Label(root, textvariable=status_text).pack()
+
+    events = queue.Queue()
+    running = {}  # the TranscriptionControl of the transcription in progress
+    root.after(poll_interval, poll_events)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    start_ui()
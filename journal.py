@@ -0,0 +1,99 @@
+import os
+import json
+
+from manifest import fingerprint_file
+
+# Crash-safe progress of long transcriptions. A file longer than one and a half windows (see
+# audio.split_into_windows) is transcribed window by window, and every window is appended to
+# <file>.journal as soon as it is done: its result, with the word timestamps, and the text the
+# next window is conditioned on. A run that finds the journal of an earlier run that died, for
+# the same content and settings, transcribes only the windows missing from it; the windows are
+# then stitched together exactly as if they had all been transcribed in one go. The journal is
+# removed once the outputs are written.
+#
+# Every line is flushed to disk before the next window starts; a line cut short by a crash is
+# dropped when the journal is read again.
+
+journal_version = 1
+context_words = 100  # of the text of a window, given as the prompt of the next one
+
+
+def journal_path(file_path):
+    return file_path + ".journal"
+
+def remove_journal(file_path):
+    try:
+        os.remove(journal_path(file_path))
+    except FileNotFoundError:
+        pass
+
+def window_context(transcription_result):
+    # the end of the text of a window, which the next window continues
+    return " ".join(transcription_result.get("text", "").split()[-context_words:])
+
+
+class Journal:
+    # settings: everything the transcription of the windows depends on (model, precision,
+    # language, prompt, vad, the windows themselves); a journal written with other settings,
+    # or for another content of the file, is started over
+
+    def __init__(self, file_path, settings):
+        self.file_path = file_path
+        self.path = journal_path(file_path)
+        # as it reads back from json (tuples become lists)
+        self.header = json.loads(json.dumps({"journal": journal_version, "fingerprint": fingerprint_file(file_path), "settings": settings}))
+        self.windows = {}  # index: (result, context) of the windows done
+        self.handle = None
+
+    def open(self):
+        # reads what an earlier run left, returns the number of windows done
+        good_bytes = 0
+        try:
+            with open(self.path, "rb") as f:
+                lines = f.read().split(b"\n")
+        except FileNotFoundError:
+            lines = []
+        windows = {}
+        for number, line in enumerate(lines[:-1]):  # the last piece has no newline: complete or not, it is cut off
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if number == 0:
+                if record != self.header:
+                    windows = None
+                    break
+            else:
+                windows[record["window"]] = (record["result"], record["context"])
+            good_bytes += len(line) + 1
+        if windows is None or good_bytes == 0:
+            self.handle = open(self.path, "w", encoding="utf-8")
+            self.write(self.header)
+            windows = {}
+        else:
+            self.handle = open(self.path, "r+", encoding="utf-8")
+            self.handle.truncate(good_bytes)
+            self.handle.seek(good_bytes)
+        self.windows = windows
+        return len(windows)
+
+    def write(self, record):
+        self.handle.write(json.dumps(record) + "\n")
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+
+    def append(self, index, transcription_result, context=None):
+        self.windows[index] = (transcription_result, context)
+        self.write({"window": index, "result": transcription_result, "context": context})
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
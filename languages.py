@@ -0,0 +1,106 @@
+import os
+import time
+
+import metrics
+from quantization import inference_context
+
+# Language of every file, when none is chosen. Left to whisper, the language is detected again by
+# every transcription of a file: by every rerun (with the same model after a failure, or with
+# another one), and by every window of a file split over the workers, where windows could even end
+# up in different languages. Here it is detected once per file, before transcribing it, from
+# sample_seconds of its audio starting where the speech starts, with the model of the run (already
+# in the model cache; with several worker processes, that of the worker transcribing the file),
+# and remembered in the manifest for the same content, whatever the model.
+# Knowing the language also lets the files in english go to an english-only model.
+
+sample_seconds = 30  # whisper detects the language from its first 30 second window
+sample_search_seconds = 120  # decoded to find where the speech starts
+
+
+def language_sample(audio):
+    # sample_seconds of audio from the first speech, None if there is none: a silent start would
+    # be detected as whatever language whisper guesses for silence
+    from audio import SAMPLE_RATE, detect_speech_regions
+    regions = detect_speech_regions(audio)
+    if not regions:
+        return None
+    start = regions[0][0]
+    return audio[start:start + sample_seconds * SAMPLE_RATE]
+
+def read_language_sample(file_path):
+    # only the beginning of the file is decoded
+    from audio import decode_audio
+    return language_sample(decode_audio(file_path, seconds=sample_search_seconds))
+
+def detect_language(model, sample, precision="fp32"):
+    # (language code, probability) of the audio sample according to a multilingual model
+    import whisper
+    mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(sample), model.dims.n_mels).to(model.device)
+    if precision == "fp16":
+        mel = mel.half()
+    with inference_context(precision, model.device):
+        _, probabilities = model.detect_language(mel)
+    language = max(probabilities, key=probabilities.get)
+    return language, float(probabilities[language])
+
+def detect_file_language(file_path, get_model, precision="fp32", read_sample=read_language_sample):
+    # (language code, probability) of a file, (None, None) if it has no speech to detect it from;
+    # raises RuntimeError if ffmpeg cannot decode it. get_model is only called if there is speech.
+    sample = read_sample(file_path)
+    if sample is None:
+        return None, None
+    return detect_language(get_model(), sample, precision)
+
+
+class LanguageResolver:
+    # language(file) returns the language code of a file, None if it has no speech to detect it
+    # from (whisper is then left to its own detection). get_model returns the multilingual model
+    # to detect with, only called when there is something to detect. detect, if given, detects
+    # instead (file -> (language, probability), e.g. in a worker process). When the workers detect
+    # the languages of the files they transcribe, the parent only looks for the earlier detections
+    # (cached) and records the new ones (record).
+
+    def __init__(self, get_model, manifest=None, precision="fp32", read_sample=read_language_sample, detect=None):
+        self.manifest = manifest
+        self.detect = detect or (lambda file_path: detect_file_language(file_path, get_model, precision, read_sample))
+        self.detected = 0
+        self.reused = 0  # detected by an earlier run
+        self.seconds = 0.0  # spent detecting
+        self.languages = {}  # language: files
+
+    def language(self, file_path, stat=None):
+        stat = stat or os.stat(file_path)
+        cached = self.cached(file_path, stat)
+        if cached is not None:
+            return cached["language"]
+        start = time.perf_counter()
+        with metrics.stage("language", file_path):
+            try:
+                language, probability = self.detect(file_path)
+            except (RuntimeError, OSError) as error:  # ffmpeg cannot decode it, transcription will say why
+                print(f"Cannot detect the language of {file_path}: {error}")
+                return None
+        self.record(file_path, stat, language, probability, time.perf_counter() - start)
+        return language
+
+    def cached(self, file_path, stat=None):
+        # the detection of an earlier run ({"language", "probability"}), None if there is none
+        if self.manifest is None:
+            return None
+        cached = self.manifest.cached_language(file_path, stat or os.stat(file_path))
+        if cached is not None:
+            self.reused += 1
+            self.languages[cached["language"]] = self.languages.get(cached["language"], 0) + 1
+        return cached
+
+    def record(self, file_path, stat, language, probability, seconds):
+        # a detection made here or by a worker process
+        self.seconds += seconds
+        self.detected += 1
+        if language is None:
+            print(f"No speech at the start of {file_path} to detect its language from")
+        else:
+            print(f"Detected language {language} ({probability:.0%}) in {file_path}")
+        if self.manifest is not None:
+            self.manifest.record_language(file_path, stat or os.stat(file_path), language, probability)
+        self.languages[language] = self.languages.get(language, 0) + 1
@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import socket
+import threading
+import uuid
+
+# A lease is a "<media file>.lock" file next to the media file, created atomically
+# with O_EXCL, holding the host and pid of the node transcribing the file.
+# The holder renews it (by touching it) every heartbeat_interval seconds; a lease
+# that has not been renewed for lease_timeout seconds belongs to a crashed node
+# and can be reclaimed. lease_timeout must be much larger than the clock skew
+# between the nodes sharing the filesystem.
+lease_timeout = 300
+heartbeat_interval = 60
+
+def node_identity():
+    # Identifies the pid namespace we run in: the boot id of the kernel plus the pid namespace
+    # inode. Containers can share a host name while having separate pid namespaces, so the
+    # host name alone does not tell whether a pid in a lease can be checked locally.
+    # None where this cannot be known (then only the timeout is used).
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            boot_id = f.read().strip()
+        return boot_id + "/" + os.readlink("/proc/self/ns/pid")
+    except OSError:
+        return None
+
+# host name written in the leases, for the humans reading them
+lease_host = socket.gethostname()
+lease_node = node_identity()
+
+
+def lock_path(file_path):
+    return file_path + ".lock"
+
+def read_lease(file_path):
+    # Returns the lease on file_path, {} if the lock exists but cannot be parsed
+    # (e.g. it is being written right now) and None if there is no lock
+    try:
+        with open(lock_path(file_path)) as f:
+            content = f.read()
+    except FileNotFoundError:
+        return None
+    try:
+        return json.loads(content)
+    except ValueError:
+        return {}
+
+def lease_age(file_path):
+    return time.time() - os.path.getmtime(lock_path(file_path))
+
+def process_is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # it exists, it just belongs to somebody else
+    return True
+
+def lease_is_stale(file_path, lease):
+    try:
+        if lease_age(file_path) > lease_timeout:
+            return True  # the holder stopped renewing it
+    except FileNotFoundError:
+        return True
+    # in our own pid namespace we do not need to wait for the timeout to know the holder died
+    if lease_node and lease.get("node") == lease_node and lease.get("pid") and not process_is_alive(lease["pid"]):
+        return True
+    return False
+
+def is_file_locked(file_path):
+    # True if another process holds a live lease on the file
+    lease = read_lease(file_path)
+    if lease is None:
+        return False
+    return not lease_is_stale(file_path, lease)
+
+def describe_lease(lease):
+    if not lease:
+        return "unknown holder"
+    return f"{lease.get('host')}:{lease.get('pid')}"
+
+def reclaim_stale_lease(file_path):
+    # Removes the lock on file_path if its lease is stale. Returns True if the file
+    # is free to be claimed again. Reclaiming is serialized through a second O_EXCL
+    # lock, so two nodes cannot both break the same lease and one of them then
+    # delete the fresh lease the other has just created.
+    reclaim_file = lock_path(file_path) + ".reclaim"
+    try:
+        fd = os.open(reclaim_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        # a node that crashed while reclaiming would otherwise block the file forever
+        try:
+            if time.time() - os.path.getmtime(reclaim_file) > lease_timeout:
+                os.remove(reclaim_file)
+        except FileNotFoundError:
+            pass
+        return False
+    os.close(fd)
+    try:
+        # check again now that nobody else can reclaim it
+        lease = read_lease(file_path)
+        if lease is None:
+            return True
+        if not lease_is_stale(file_path, lease):
+            return False
+        print(f"Reclaiming stale lease of {describe_lease(lease)} on {file_path}")
+        try:
+            os.remove(lock_path(file_path))
+        except FileNotFoundError:
+            pass
+        return True
+    finally:
+        os.remove(reclaim_file)
+
+def claim_file(file_path):
+    # Atomically claims file_path for this process. Returns the lease, or None
+    # if another live process holds it.
+    lease = {
+        "host": lease_host,
+        "node": lease_node,
+        "pid": os.getpid(),
+        "token": uuid.uuid4().hex,
+        "acquired": time.time(),
+    }
+    for attempt in range(2):
+        try:
+            fd = os.open(lock_path(file_path), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            if attempt == 0 and reclaim_stale_lease(file_path):
+                continue
+            return None
+        with os.fdopen(fd, "w") as f:
+            json.dump(lease, f)
+        return lease
+    return None
+
+def renew_lease(file_path, lease):
+    # Heartbeat: returns False if the lease was lost (reclaimed by another node). A lease that
+    # went unrenewed past the timeout (e.g. the process was suspended) counts as lost even if
+    # nobody has reclaimed it yet: another node may be reclaiming it right now.
+    current = read_lease(file_path)
+    if not current or current.get("token") != lease["token"]:
+        return False
+    try:
+        if lease_age(file_path) > lease_timeout:
+            return False
+        os.utime(lock_path(file_path))
+    except FileNotFoundError:
+        return False
+    return True
+
+def unlock_file(file_path, lease=None):
+    # Removes the lock. With a lease, only if the lock still belongs to it.
+    if lease is not None:
+        current = read_lease(file_path)
+        if not current or current.get("token") != lease["token"]:
+            return
+    try:
+        os.remove(lock_path(file_path))  # Remove the lock file
+    except FileNotFoundError:
+        pass
+
+
+class LeaseKeeper:
+    # Holds the leases of this process and renews them from a background thread
+
+    def __init__(self, interval=None):
+        self.interval = interval
+        self.leases = {}
+        self.lost = set()
+        self.mutex = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.heartbeat, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        for file_path in list(self.leases):
+            self.release(file_path)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def heartbeat(self):
+        while not self.stopped.wait(self.interval or heartbeat_interval):
+            with self.mutex:
+                leases = list(self.leases.items())
+            for file_path, lease in leases:
+                try:
+                    renewed = renew_lease(file_path, lease)
+                except OSError as error:
+                    # e.g. a stale NFS handle: try again at the next beat, holds() checks
+                    # the lease on disk before anything is written
+                    print(f"Could not renew the lease on {file_path}: {error}")
+                    continue
+                if not renewed:
+                    print(f"Lost the lease on {file_path}")
+                    with self.mutex:
+                        self.lost.add(file_path)
+
+    def claim(self, file_path):
+        lease = claim_file(file_path)
+        if lease is None:
+            return False
+        with self.mutex:
+            self.leases[file_path] = lease
+            self.lost.discard(file_path)
+        return True
+
+    def holds(self, file_path):
+        # Checks the lease on disk (and renews it), call it right before writing results
+        with self.mutex:
+            lease = self.leases.get(file_path)
+            if lease is None or file_path in self.lost:
+                return False
+        try:
+            renewed = renew_lease(file_path, lease)
+        except OSError as error:
+            print(f"Could not check the lease on {file_path}: {error}")
+            renewed = False
+        if not renewed:
+            with self.mutex:
+                self.lost.add(file_path)
+        return renewed
+
+    def release(self, file_path):
+        with self.mutex:
+            lease = self.leases.pop(file_path, None)
+            self.lost.discard(file_path)
+        if lease is not None:
+            unlock_file(file_path, lease)
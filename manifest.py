@@ -0,0 +1,232 @@
+import os
+import time
+import sqlite3
+import hashlib
+
+# Per-root record of what has already been done: for every media file its size,
+# mtime and content fingerprint, the model and language used and the output
+# formats that exist. A rerun then needs one os.stat and one indexed lookup per
+# file instead of probing every output format and decoding every json.
+#
+# Every change is committed right away, so no write transaction stays open while
+# files are being transcribed and several processes can share the manifest.
+# SQLite relies on the file locks of the filesystem: on network filesystems (NFS
+# in particular) these are often unreliable, so nodes sharing a tree over the
+# network should not all use the manifest at the same time (use_manifest=False
+# in perform_transcription) unless the share is known to lock correctly.
+
+manifest_name = ".whisper_manifest.sqlite"
+
+# blocks hashed by fingerprint_file, at the start, middle and end of the file
+fingerprint_block_size = 64 * 1024
+
+
+def fingerprint_file(file_path, size=None):
+    # Fast content fingerprint: the size plus a hash of a few sampled blocks
+    if size is None:
+        size = os.path.getsize(file_path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(file_path, "rb") as f:
+        if size <= 3 * fingerprint_block_size:
+            digest.update(f.read())
+        else:
+            for offset in (0, (size - fingerprint_block_size) // 2, size - fingerprint_block_size):
+                f.seek(offset)
+                digest.update(f.read(fingerprint_block_size))
+    return digest.hexdigest()
+
+
+class Manifest:
+
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, manifest_name)
+        # the database can live on a network share used by several nodes, be patient with their locks
+        self.connection = sqlite3.connect(self.path, timeout=60)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                fingerprint TEXT,
+                model TEXT,
+                language TEXT,
+                formats TEXT,
+                updated REAL,
+                full_hash TEXT
+            )""")
+        if "full_hash" not in [column["name"] for column in self.connection.execute("PRAGMA table_info(files)")]:
+            # manifests written before the full hash was recorded
+            self.connection.execute("ALTER TABLE files ADD COLUMN full_hash TEXT")
+        # media durations probed by the scheduler (see scheduling.py)
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS durations (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                duration REAL
+            )""")
+        # full content hashes and audio fingerprints computed by the deduplication (see dedup.py)
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS contents (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                full_hash TEXT,
+                audio_fingerprint BLOB
+            )""")
+        # languages detected before transcribing (see languages.py)
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS languages (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                language TEXT,
+                probability REAL
+            )""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS files_fingerprint ON files (fingerprint)")
+        self.connection.commit()
+
+    def key(self, file_path):
+        return os.path.relpath(file_path, self.root)
+
+    def full_path(self, key):
+        return os.path.join(self.root, key)
+
+    def lookup(self, file_path):
+        row = self.connection.execute("SELECT * FROM files WHERE path = ?", (self.key(file_path),)).fetchone()
+        if row is None:
+            return None
+        entry = dict(row)
+        entry["formats"] = set(filter(None, (entry["formats"] or "").split(",")))
+        return entry
+
+    def content_hash(self, file_path, stat):
+        # hash of the whole content, None for the files the sampled fingerprint already covers whole
+        if stat.st_size <= 3 * fingerprint_block_size:
+            return None
+        cached = self.cached_content(file_path, stat)
+        if cached is not None and cached["full_hash"] is not None:
+            return cached["full_hash"]
+        from dedup import full_hash
+        content_hash = full_hash(file_path)
+        self.record_content(file_path, stat, full_hash=content_hash)
+        return content_hash
+
+    def check(self, file_path, stat, selected_formats):
+        # Returns (state, entry) where state is one of
+        #   "new":        never seen, the outputs on disk must be probed
+        #   "complete":   unchanged and every selected format exists
+        #   "incomplete": unchanged but some selected formats are missing
+        #   "changed":    the media content changed, its outputs are stale
+        entry = self.lookup(file_path)
+        if entry is None:
+            return "new", None
+        if entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+            # touched or copied without changing the content? The sampled blocks can be the same for a
+            # file rewritten with the same size (e.g. silence at the same places), the whole content decides
+            if entry["size"] != stat.st_size or entry["fingerprint"] != fingerprint_file(file_path, stat.st_size):
+                return "changed", entry
+            if stat.st_size > 3 * fingerprint_block_size and \
+                    (entry["full_hash"] is None or entry["full_hash"] != self.content_hash(file_path, stat)):
+                return "changed", entry
+            self.connection.execute("UPDATE files SET mtime_ns = ? WHERE path = ?", (stat.st_mtime_ns, self.key(file_path)))
+            self.connection.commit()
+        if set(selected_formats) <= entry["formats"]:
+            return "complete", entry
+        return "incomplete", entry
+
+    def record(self, file_path, stat, formats, model=None, language=None, fingerprint=None):
+        # Records that the given formats exist for file_path (in addition to the ones already recorded
+        # for the same content)
+        entry = self.lookup(file_path)
+        content_hash = None
+        if entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            fingerprint = fingerprint or entry["fingerprint"]
+            content_hash = entry["full_hash"]
+        elif fingerprint is None:
+            fingerprint = fingerprint_file(file_path, stat.st_size)
+        if content_hash is None:
+            # kept to tell a touch from a rewrite later on (see check)
+            content_hash = self.content_hash(file_path, stat)
+        if entry is not None and entry["fingerprint"] == fingerprint:
+            formats = set(formats) | entry["formats"]
+            model = model or entry["model"]
+            language = language or entry["language"]
+        self.connection.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, fingerprint, model, language, formats, updated, full_hash) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.key(file_path), stat.st_size, stat.st_mtime_ns, fingerprint, model, language,
+             ",".join(sorted(formats)), time.time(), content_hash))
+        self.connection.commit()
+
+    def cached_duration(self, file_path, stat):
+        # the probed duration, None if the file was never probed or changed since
+        row = self.connection.execute("SELECT size, mtime_ns, duration FROM durations WHERE path = ?", (self.key(file_path),)).fetchone()
+        if row is None or row["size"] != stat.st_size or row["mtime_ns"] != stat.st_mtime_ns:
+            return None
+        return row["duration"]
+
+    def record_durations(self, probed):
+        # probed: (file_path, stat, duration) triples, recorded in one transaction
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO durations (path, size, mtime_ns, duration) VALUES (?, ?, ?, ?)",
+            [(self.key(file_path), stat.st_size, stat.st_mtime_ns, duration) for file_path, stat, duration in probed])
+        self.connection.commit()
+
+    def files_with_fingerprint(self, size, fingerprint):
+        # the recorded files of that size and sampled fingerprint, unchanged since they were recorded
+        rows = self.connection.execute("SELECT path, mtime_ns FROM files WHERE fingerprint = ? AND size = ?", (fingerprint, size)).fetchall()
+        files = []
+        for row in rows:
+            file_path = self.full_path(row["path"])
+            try:
+                if os.stat(file_path).st_mtime_ns == row["mtime_ns"]:
+                    files.append(file_path)
+            except OSError:
+                continue
+        return files
+
+    def cached_content(self, file_path, stat):
+        # {"full_hash", "audio_fingerprint"} computed for the current content, None if never computed
+        row = self.connection.execute("SELECT * FROM contents WHERE path = ?", (self.key(file_path),)).fetchone()
+        if row is None or row["size"] != stat.st_size or row["mtime_ns"] != stat.st_mtime_ns:
+            return None
+        return {"full_hash": row["full_hash"], "audio_fingerprint": row["audio_fingerprint"]}
+
+    def record_content(self, file_path, stat, full_hash=None, audio_fingerprint=None):
+        # keeps what was already computed for the same content
+        cached = self.cached_content(file_path, stat) or {}
+        self.connection.execute(
+            "INSERT OR REPLACE INTO contents (path, size, mtime_ns, full_hash, audio_fingerprint) VALUES (?, ?, ?, ?, ?)",
+            (self.key(file_path), stat.st_size, stat.st_mtime_ns, full_hash or cached.get("full_hash"),
+             audio_fingerprint if audio_fingerprint is not None else cached.get("audio_fingerprint")))
+        self.connection.commit()
+
+    def audio_fingerprints(self, min_length, max_length):
+        # (file, audio fingerprint) of the recorded files, unchanged since, whose fingerprint is
+        # between min_length and max_length bytes long (i.e. of about the same duration)
+        rows = self.connection.execute(
+            "SELECT contents.path, audio_fingerprint FROM contents JOIN files ON files.path = contents.path "
+            "WHERE audio_fingerprint IS NOT NULL AND length(audio_fingerprint) BETWEEN ? AND ? "
+            "AND contents.size = files.size AND contents.mtime_ns = files.mtime_ns",
+            (min_length, max_length)).fetchall()
+        return [(self.full_path(row["path"]), row["audio_fingerprint"]) for row in rows]
+
+    def cached_language(self, file_path, stat):
+        # {"language", "probability"} detected for the current content, None if never detected
+        # (language is None if there was no speech to detect it from)
+        row = self.connection.execute("SELECT * FROM languages WHERE path = ?", (self.key(file_path),)).fetchone()
+        if row is None or row["size"] != stat.st_size or row["mtime_ns"] != stat.st_mtime_ns:
+            return None
+        return {"language": row["language"], "probability": row["probability"]}
+
+    def record_language(self, file_path, stat, language, probability=None):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO languages (path, size, mtime_ns, language, probability) VALUES (?, ?, ?, ?, ?)",
+            (self.key(file_path), stat.st_size, stat.st_mtime_ns, language, probability))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -1,11 +1,30 @@
 import os
-import markdown
-import tkinter as tk
-from tkinter import filedialog, ttk
+import json
+import shutil
+import argparse
 
+from discovery import ignored_directories
+from writers import atomic_file
+
+# Unisce le trascrizioni (.txt e .md) di ogni directory in un file unione.md nella stessa
+# directory, una sezione "## nome" per file, in ordine alfabetico. L'albero viene letto una
+# volta sola con os.scandir, ogni unione viene scritta da un unico handle bufferizzato
+# copiando i file a blocchi, senza tenerli in memoria.
+#
+# Le unioni sono incrementali: accanto a unione.md, .unione.json ricorda dimensione e mtime
+# di ogni file unito e dove sta la sua sezione. Una directory in cui nulla è cambiato non
+# viene riscritta; se qualcosa è cambiato, le sezioni dei file invariati vengono copiate
+# dall'unione precedente invece di riaprire i file uno per uno, e se i file nuovi vengono
+# tutti dopo gli altri le loro sezioni vengono solo aggiunte in fondo.
+
+output_name = "unione.md"
+index_name = ".unione.json"
+chunk_size = 1024 * 1024
 
 
 def choose_directory():
+    import tkinter as tk
+    from tkinter import filedialog
     # Initialize the Tkinter root element
     desktop_path = os.path.join(os.path.expanduser('~'), 'Desktop')
     root = tk.Tk()
@@ -15,41 +34,169 @@ def choose_directory():
     return directory_path
 
 
-def merge_text_files(directory):
+def is_source(name, subdirectories):
+    # le unioni (anche quelle delle versioni precedenti, scritte come <sottodirectory>.md
+    # accanto alla sottodirectory) non vengono unite di nuovo
+    if name.startswith(".") or name == output_name:
+        return False
+    if name.endswith(".txt"):
+        return True
+    return name.endswith(".md") and name[:-3] not in subdirectories
+
+def section_title(name):
+    return f"## {os.path.splitext(name)[0]}\n\n".encode("utf-8")
+
+def read_index(directory):
+    try:
+        with open(os.path.join(directory, index_name), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_index(directory, sections, output_path):
+    stat = os.stat(output_path)
+    index = {"output": [stat.st_size, stat.st_mtime_ns], "sections": sections}
+    with open(os.path.join(directory, index_name), "w", encoding="utf-8") as f:
+        json.dump(index, f)
+
+def copy_range(source, output, offset, length):
+    source.seek(offset)
+    while length > 0:
+        block = source.read(min(chunk_size, length))
+        if not block:
+            break
+        output.write(block)
+        length -= len(block)
+
+def write_section(output, directory, name):
+    # titolo e contenuto di un file, ritorna la lunghezza della sezione
+    title = section_title(name)
+    output.write(title)
+    length = len(title)
+    with open(os.path.join(directory, name), "rb") as source:
+        while True:
+            block = source.read(chunk_size)
+            if not block:
+                break
+            output.write(block)
+            length += len(block)
+    output.write(b"\n\n")
+    return length + 2
+
+def merge_directory(directory, sources, full=False):
+    # sources: (nome, dimensione, mtime_ns) dei file da unire, in ordine.
+    # Ritorna "unchanged", "appended", "rewritten" o "removed".
+    output_path = os.path.join(directory, output_name)
+    index = None if full else read_index(directory)
+    if index is not None:
+        try:
+            stat = os.stat(output_path)
+            if [stat.st_size, stat.st_mtime_ns] != index["output"]:
+                index = None  # unione.md è stata modificata a mano: si riparte da zero
+        except OSError:
+            index = None
+
+    if not sources:
+        if index is None:
+            return "unchanged"
+        for path in (output_path, os.path.join(directory, index_name)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return "removed"
+
+    previous = {} if index is None else {section["name"]: section for section in index["sections"]}
+    unchanged = [name in previous and [size, mtime_ns] == [previous[name]["size"], previous[name]["mtime_ns"]]
+                 for name, size, mtime_ns in sources]
+    kept = len(previous) if index is not None else 0
+    if index is not None and kept <= len(sources) and all(unchanged[:kept]) and \
+            [name for name, _, _ in sources[:kept]] == [section["name"] for section in index["sections"]]:
+        if kept == len(sources):
+            return "unchanged"
+        # solo file nuovi, tutti in fondo: vengono aggiunti
+        sections = index["sections"]
+        offset = index["output"][0]
+        with open(output_path, "ab") as output:
+            for name, size, mtime_ns in sources[kept:]:
+                length = write_section(output, directory, name)
+                sections.append({"name": name, "size": size, "mtime_ns": mtime_ns, "offset": offset, "length": length})
+                offset += length
+        write_index(directory, sections, output_path)
+        return "appended"
+
+    # riscritta accanto e rinominata, così un'interruzione non lascia un'unione a metà
+    sections = []
+    offset = 0
+    with atomic_file(output_path, "wb") as output, \
+            (open(output_path, "rb") if previous else open(os.devnull, "rb")) as old_output:
+        for (name, size, mtime_ns), same in zip(sources, unchanged):
+            if same:
+                length = previous[name]["length"]
+                copy_range(old_output, output, previous[name]["offset"], length)
+            else:
+                length = write_section(output, directory, name)
+            sections.append({"name": name, "size": size, "mtime_ns": mtime_ns, "offset": offset, "length": length})
+            offset += length
+    write_index(directory, sections, output_path)
+    return "rewritten"
+
+
+def merge_text_files(directory, full=False):
     """
-    Unisce tutti i file .txt in un unico file .md nella directory specificata.
+    Unisce i file .txt e .md di ogni directory dell'albero in un unico unione.md per directory.
 
     Args:
         directory (str): Percorso alla directory da analizzare.
-    """
-
-    # Crea un file markdown vuoto
-    with open(os.path.join(directory, "unione.md"), "w") as f:
-        f.write("")
+        full (bool): Riscrive tutte le unioni, anche quelle delle directory invariate.
 
-    # Per ogni file nella directory
-    for file in os.listdir(directory):
-        # Se è un file .txt
-        if file.endswith(".txt") or file.endswith(".md"):
-        # Leggi il contenuto del file
-            with open(os.path.join(directory, file), "r") as f:
-                contenuto_file = f.read()
-
-        # Crea un titolo markdown con il nome del file
-            if file.endswith(".txt"):     titolo_md = f"## {file[:-4]}"
-            else:                         titolo_md = f"## {file[:-3]}"
+    Returns:
+        dict: Quante directory sono rimaste invariate, aggiornate in fondo, riscritte o svuotate.
+    """
+    counts = {"unchanged": 0, "appended": 0, "rewritten": 0, "removed": 0}
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        files = []
+        subdirectories = []
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not entry.name.startswith(".") and entry.name not in ignored_directories:
+                                subdirectories.append(entry.name)
+                        elif entry.is_file():
+                            files.append(entry)
+                    except OSError:
+                        continue
+        except OSError as error:
+            print(f"Impossibile leggere {current}: {error}")
+            continue
+        names = set(subdirectories)
+        sources = []
+        for entry in sorted(files, key=lambda entry: entry.name):
+            if is_source(entry.name, names):
+                stat = entry.stat()
+                sources.append((entry.name, stat.st_size, stat.st_mtime_ns))
+        counts[merge_directory(current, sources, full)] += 1
+        stack.extend(os.path.join(current, name) for name in sorted(subdirectories, reverse=True))
+    return counts
 
-            # Aggiungi il titolo e il contenuto del file al file markdown
-            with open(os.path.join(directory, f"{directory}.md"), "a") as f:
-                f.write(titolo_md + "\n\n" + contenuto_file + "\n\n")
 
-    # Controlla se ci sono sottodirectory
-    for subdir in os.listdir(directory):
-        if os.path.isdir(os.path.join(directory, subdir)):
-        # Ricorsivamente unisci i file nella sottodirectory
-            merge_text_files(os.path.join(directory, subdir))
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Unisce le trascrizioni di ogni directory in un unione.md")
+    parser.add_argument("directory", nargs="?", help="directory da unire (senza, viene chiesta con una finestra)")
+    parser.add_argument("--full", action="store_true", help="riscrive tutte le unioni")
+    arguments = parser.parse_args(argv)
+    directory = arguments.directory or choose_directory()
+    if not directory:
+        return
+    counts = merge_text_files(directory, arguments.full)
+    print(f"{counts['rewritten']} unioni riscritte, {counts['appended']} aggiornate, "
+          f"{counts['unchanged']} invariate, {counts['removed']} rimosse")
 
-# Esegui la funzione nella directory specificata
-      
 
-merge_text_files(choose_directory())
+# Esegui la funzione nella directory specificata (solo come script: importarlo non apre finestre)
+if __name__ == "__main__":
+    main()
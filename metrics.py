@@ -0,0 +1,201 @@
+import os
+import sys
+import json
+import time
+import fnmatch
+import threading
+import contextlib
+
+# Per-stage instrumentation of a run. While a Metrics is active (see start), the stages of the
+# run (discovery, probe, migration, decode, model_load, encoder, decoder, render:<format>,
+# write:<format>) are timed and written as JSON lines to a log, one line per stage run plus a
+# line per transcribed file (audio duration, real-time factor, peak RSS), and summed up at the
+# end. When no Metrics is active, stage() returns the same empty context every time: the cost
+# is a function call and a global lookup.
+#
+# Only the main process is instrumented: files transcribed by the worker pool get their file
+# line, the stages inside the workers are not seen.
+#
+# profile_pattern (a file name pattern) runs the transcription of the matching files under
+# cProfile, or pyinstrument if it is installed and asked for; the profiles are saved next to the
+# log (in the current directory without a log).
+
+active = None
+no_stage = contextlib.nullcontext()
+profilers = ["cprofile", "pyinstrument"]
+
+
+def peak_rss_bytes():
+    # the peak resident memory of this process and of its finished children (the workers), None
+    # where resource does not exist (Windows)
+    try:
+        import resource
+    except ImportError:
+        return None
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is in bytes on macOS, in KB elsewhere
+    return {"self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale}
+
+
+class Metrics:
+
+    def __init__(self, path=None, profile_pattern=None, profiler="cprofile"):
+        if profiler not in profilers:
+            raise ValueError(f"Unknown profiler {profiler}, expected one of {profilers}")
+        self.path = path
+        self.profile_pattern = profile_pattern
+        self.profiler = profiler
+        self.log = open(path, "a", encoding="utf-8") if path else None
+        self.mutex = threading.Lock()  # the outputs are written on another thread
+        self.stages = {}  # name: [runs, seconds]
+        self.files = 0
+        self.audio_seconds = 0.0
+        self.file_seconds = 0.0
+        self.start_time = time.perf_counter()
+
+    def write(self, record):
+        if self.log is not None:
+            self.log.write(json.dumps(record) + "\n")
+
+    @contextlib.contextmanager
+    def stage(self, name, file=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self.mutex:
+                totals = self.stages.setdefault(name, [0, 0.0])
+                totals[0] += 1
+                totals[1] += seconds
+                self.write({"event": "stage", "stage": name, "file": file, "seconds": seconds})
+
+    def file_done(self, file, audio_seconds, seconds=None):
+        # seconds is None when the file was transcribed by the worker pool
+        with self.mutex:
+            self.files += 1
+            self.audio_seconds += audio_seconds
+            if seconds is not None:
+                self.file_seconds += seconds
+            self.write({"event": "file", "file": file, "audio_seconds": audio_seconds, "seconds": seconds,
+                        "realtime_factor": seconds / audio_seconds if seconds is not None and audio_seconds else None,
+                        "peak_rss_bytes": peak_rss_bytes()})
+
+    def profiling(self, file):
+        # the context to transcribe file in: a profiler if it matches profile_pattern
+        if not self.profile_pattern or not (fnmatch.fnmatch(os.path.basename(file), self.profile_pattern)
+                                            or fnmatch.fnmatch(file, self.profile_pattern)):
+            return no_stage
+        base = os.path.join(os.path.dirname(self.path) if self.path else ".", "profile-" + os.path.basename(file))
+        if self.profiler == "pyinstrument":
+            return self.pyinstrument_profile(base + ".html")
+        return self.cprofile_profile(base + ".prof")
+
+    @contextlib.contextmanager
+    def cprofile_profile(self, path):
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            print(f"Profile written to {path} (python -m pstats {path})")
+
+    @contextlib.contextmanager
+    def pyinstrument_profile(self, path):
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+            print(f"Profile written to {path}")
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start_time
+        return {"event": "summary", "seconds": elapsed, "files": self.files, "audio_seconds": self.audio_seconds,
+                "realtime_factor": self.file_seconds / self.audio_seconds if self.file_seconds and self.audio_seconds else None,
+                "stages": {name: {"runs": runs, "seconds": seconds} for name, (runs, seconds) in sorted(self.stages.items())},
+                "peak_rss_bytes": peak_rss_bytes()}
+
+    def print_summary(self, summary=None):
+        summary = summary or self.summary()
+        print(f"Run metrics: {summary['files']} files, {summary['audio_seconds'] / 3600:.2f} audio hours in {summary['seconds']:.1f}s"
+              + (f", real-time factor {summary['realtime_factor']:.3f}" if summary["realtime_factor"] else ""))
+        for name, totals in sorted(summary["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            print(f"  {name:<14} {totals['seconds']:10.2f}s  {totals['runs']:7d} runs")
+        if summary["peak_rss_bytes"]:
+            print(f"  peak RSS {summary['peak_rss_bytes']['self'] / 1024**2:.0f} MB"
+                  f" (workers {summary['peak_rss_bytes']['children'] / 1024**2:.0f} MB)")
+
+    def close(self):
+        summary = self.summary()
+        with self.mutex:
+            self.write(summary)
+            if self.log is not None:
+                self.log.close()
+                self.log = None
+        self.print_summary(summary)
+        return summary
+
+
+def start(path=None, profile_pattern=None, profiler="cprofile"):
+    global active
+    active = Metrics(path, profile_pattern, profiler)
+    return active
+
+def stop():
+    # returns the summary of the run
+    global active
+    metrics, active = active, None
+    return metrics.close() if metrics is not None else None
+
+def stage(name, file=None):
+    if active is None:
+        return no_stage
+    return active.stage(name, file)
+
+def file_done(file, audio_seconds, seconds=None):
+    if active is not None:
+        active.file_done(file, audio_seconds, seconds)
+
+def profiling(file):
+    if active is None:
+        return no_stage
+    return active.profiling(file)
+
+
+def instrument_model(model):
+    # Times the encoder and decoder forward passes of a whisper model (once per model). They are
+    # summed up but not logged one by one: the decoder runs once per token. On a GPU the times
+    # are those of queuing the work, unless CUDA_LAUNCH_BLOCKING=1.
+    if getattr(model, "_stage_hooks", None):
+        return
+    started = threading.local()
+
+    def hooks(name):
+        def before(module, inputs):
+            if active is not None:
+                started.__dict__[name] = time.perf_counter()
+
+        def after(module, inputs, output):
+            start = started.__dict__.pop(name, None)
+            if start is not None and active is not None:
+                seconds = time.perf_counter() - start
+                with active.mutex:
+                    totals = active.stages.setdefault(name, [0, 0.0])
+                    totals[0] += 1
+                    totals[1] += seconds
+        return before, after
+
+    handles = []
+    for name in ("encoder", "decoder"):
+        before, after = hooks(name)
+        module = getattr(model, name)
+        handles += [module.register_forward_pre_hook(before), module.register_forward_hook(after)]
+    model._stage_hooks = handles
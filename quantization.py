@@ -0,0 +1,105 @@
+import os
+import re
+import time
+import contextlib
+
+from writers import atomic_file
+
+# Reduced precision inference, mostly for CPUs:
+#   bf16: the weights stay in fp32 and the matrix products run in bfloat16 under autocast,
+#         only where the hardware supports bfloat16 (recent x86 CPUs, Ampere and newer GPUs)
+#   int8: the linear layers (most of the weights) are quantized to int8 with dynamic
+#         activation quantization, CPU only. Quantizing takes a while and a lot of memory,
+#         so the quantized model is saved under quantized_model_dir and loaded from there.
+
+quantized_model_dir = os.path.join(os.path.expanduser("~"), ".cache", "whisper-transcribe", "models")
+
+
+def bf16_supported(device):
+    import torch
+    if str(device).startswith("cuda"):
+        return torch.cuda.is_available() and torch.cuda.is_bf16_supported()
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+def inference_context(precision, device):
+    # the context every model call of a given precision runs in
+    if precision != "bf16":
+        return contextlib.nullcontext()
+    import torch
+    return torch.autocast(device_type="cuda" if str(device).startswith("cuda") else "cpu", dtype=torch.bfloat16)
+
+
+def quantize_linear_layers(model):
+    # Replaces the linear layers of a (CPU, fp32) whisper model with int8 dynamically quantized ones
+    import torch
+    from whisper.model import Linear
+    for module in model.modules():
+        if type(module) is Linear:
+            # whisper's Linear only casts its weights to the input dtype: with fp32 inputs it is a
+            # plain nn.Linear, which is what quantize_dynamic knows how to convert
+            module.__class__ = torch.nn.Linear
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def checkpoint_id(model_name):
+    # the checkpoint a model name stands for: the hash in the download url of the official models
+    import whisper
+    url = whisper._MODELS.get(model_name)
+    if url:
+        return url.split("/")[-2][:16]
+    from manifest import fingerprint_file
+    return fingerprint_file(model_name)
+
+def quantized_model_path(model_name, cache_dir=None):
+    # the saved model is a pickle of torch modules: it is only reused by the same torch version
+    import torch
+    name = re.sub(r"[^\w.-]", "_", os.path.basename(model_name))
+    version = re.sub(r"[^\w.]", "_", torch.__version__)
+    return os.path.join(cache_dir or quantized_model_dir, f"{name}-{checkpoint_id(model_name)}-int8-torch{version}.pt")
+
+def load_quantized_model(model_name, cache_dir=None):
+    # The int8 model, quantized the first time and loaded from the disk cache afterwards
+    import torch
+    from whisper import load_model
+    path = quantized_model_path(model_name, cache_dir)
+    try:
+        model = torch.load(path, map_location="cpu", weights_only=False)
+        model.eval()
+        return model
+    except FileNotFoundError:
+        pass
+    except Exception as error:
+        print(f"Cannot load the quantized model {path} ({error}), quantizing it again")
+
+    start = time.perf_counter()
+    model = quantize_linear_layers(load_model(model_name, device="cpu"))
+    print(f"Quantized {model_name} to int8 in {time.perf_counter() - start:.0f}s")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # written aside and renamed, so that concurrent workers never load a half written model
+    with atomic_file(path, "wb") as f:
+        torch.save(model, f)
+    return model
+
+
+def normalize_words(text):
+    return re.findall(r"\w+(?:'\w+)?", text.lower())
+
+def word_errors(reference, hypothesis):
+    # (substitutions + deletions + insertions, words of the reference), on lowercased words
+    reference, hypothesis = normalize_words(reference), normalize_words(hypothesis)
+    previous = list(range(len(hypothesis) + 1))
+    for i, reference_word in enumerate(reference, start=1):
+        current = [i]
+        for j, hypothesis_word in enumerate(hypothesis, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (reference_word != hypothesis_word)))
+        previous = current
+    return previous[-1], len(reference)
+
+def word_error_rate(reference, hypothesis):
+    errors, words = word_errors(reference, hypothesis)
+    if not words:
+        return 0.0 if not errors else 1.0
+    return errors / words
@@ -0,0 +1,124 @@
+import os
+import json
+import wave
+import fnmatch
+import subprocess
+import concurrent.futures
+
+from writers import atomic_file, exclusive_lock
+
+# Orders the files of a run before they are transcribed. The durations are read from the
+# container metadata (the header of wav files, ffprobe for the rest: nothing is decoded),
+# cached in the manifest, and used by the policies:
+#   walk:     the order of the walk, transcription starts with the first file found (default)
+#   shortest: shortest first, the many short files people wait for are not stuck behind a long one
+#   longest:  longest first, so that a pool of workers does not end the run waiting for one long file
+#   priority: the files under the subdirectories listed first come first, shortest first among equals
+schedule_policies = ["walk", "shortest", "longest", "priority"]
+
+probe_threads = 8  # ffprobe runs are mostly waiting on the disk
+
+# Measured real-time factors (seconds of computation per second of audio, per worker process)
+# of every model and precision on this machine, updated at the end of every run
+realtime_factors_path = os.path.join(os.path.expanduser("~"), ".cache", "whisper-transcribe", "realtime_factors.json")
+min_measured_seconds = 60  # shorter runs are too noisy to learn from
+
+
+def probe_duration(file_path):
+    # Duration in seconds from the container metadata, None if it cannot be read
+    if file_path.lower().endswith(".wav"):
+        try:
+            with wave.open(file_path) as f:
+                return f.getnframes() / f.getframerate()
+        except (wave.Error, EOFError, OSError):
+            pass  # e.g. a compressed wav, ffprobe knows better
+    command = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", file_path]
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        return float(output.strip())
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+
+def probe_durations(files, manifest=None):
+    # {file: duration} of the files, from the manifest when the file did not change since it was probed
+    durations = {}
+    to_probe = []
+    for file in files:
+        stat = os.stat(file)
+        duration = manifest.cached_duration(file, stat) if manifest is not None else None
+        if duration is None:
+            to_probe.append((file, stat))
+        else:
+            durations[file] = duration
+    with concurrent.futures.ThreadPoolExecutor(probe_threads) as executor:
+        probed = list(executor.map(probe_duration, [file for file, stat in to_probe]))
+    for (file, stat), duration in zip(to_probe, probed):
+        durations[file] = duration
+    if manifest is not None:
+        manifest.record_durations([(file, stat, duration) for (file, stat), duration in zip(to_probe, probed) if duration is not None])
+    return durations
+
+
+def priority_rank(file, root, priorities):
+    # index of the first pattern matching a directory the file is in, len(priorities) if none does
+    directory = os.path.relpath(os.path.dirname(file), root).replace(os.sep, "/")
+    parents = [directory]
+    while "/" in parents[-1]:
+        parents.append(parents[-1].rsplit("/", 1)[0])
+    for rank, pattern in enumerate(priorities):
+        if any(fnmatch.fnmatch(parent, pattern.strip("/")) for parent in parents):
+            return rank
+    return len(priorities)
+
+def schedule(files, policy, durations, root="", priorities=()):
+    # Returns the files in the order of the policy. Files whose duration is unknown go last.
+    if policy not in schedule_policies:
+        raise ValueError(f"Unknown schedule {policy}, expected one of {schedule_policies}")
+    if policy == "walk":
+        return list(files)
+    unknown = float("inf")
+    if policy == "shortest":
+        key = lambda file: durations.get(file) if durations.get(file) is not None else unknown
+    elif policy == "longest":
+        key = lambda file: (durations.get(file) is None, -(durations.get(file) or 0))
+    else:
+        key = lambda file: (priority_rank(file, root, priorities),
+                            durations.get(file) if durations.get(file) is not None else unknown)
+    return sorted(files, key=key)  # stable: the walk order among equals
+
+
+def load_realtime_factors(path=None):
+    try:
+        with open(path or realtime_factors_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def realtime_factor(model_name, precision, path=None):
+    measured = load_realtime_factors(path).get(f"{model_name}/{precision}")
+    if not measured or not measured["audio_seconds"]:
+        return None
+    return measured["compute_seconds"] / measured["audio_seconds"]
+
+def record_realtime_factor(model_name, precision, audio_seconds, compute_seconds, path=None):
+    # adds a run to the measurements; several runs can end together, so the file is locked
+    # from reading it to replacing it (or one of the runs would be lost)
+    if audio_seconds < min_measured_seconds:
+        return
+    path = path or realtime_factors_path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with exclusive_lock(path):
+        factors = load_realtime_factors(path)
+        measured = factors.setdefault(f"{model_name}/{precision}", {"audio_seconds": 0.0, "compute_seconds": 0.0})
+        measured["audio_seconds"] += audio_seconds
+        measured["compute_seconds"] += compute_seconds
+        with atomic_file(path) as f:
+            json.dump(factors, f, indent=1)
+
+def estimate(durations, model_name, precision, workers=1, path=None):
+    # (audio seconds, expected wall-clock seconds or None when this model was never measured here)
+    audio_seconds = sum(duration for duration in durations if duration)
+    factor = realtime_factor(model_name, precision, path)
+    if factor is None:
+        return audio_seconds, None
+    return audio_seconds, audio_seconds * factor / max(1, workers)
@@ -0,0 +1,220 @@
+import os
+import json
+import sqlite3
+import argparse
+
+from discovery import ignored_directories, transcribable_extension_set
+
+# Full-text index of the transcripts of a tree, with the timing of every segment: instead of
+# grepping thousands of .txt files, a query returns the segments where something was said with
+# their start and end in milliseconds. The index lives at the root, next to the manifest, and
+# holds every segment of every json output (one row per segment, the text indexed by SQLite's
+# FTS5). perform_transcription adds the transcripts it writes; update() catches up with the
+# json files written or changed otherwise, reading only the ones whose size or mtime changed.
+# Run with: python search.py DIRECTORY "what was said" [--language it] [--limit 20] [--update]
+
+index_name = ".whisper_search.sqlite"
+commit_every = 500  # transcripts per transaction while updating
+
+
+def segment_rows(result):
+    # (start_ms, end_ms, text) of the segments with text
+    for segment in result.get("segments") or []:
+        if isinstance(segment, dict) and segment.get("text", "").strip():
+            yield round(segment["start"] * 1000), round(segment["end"] * 1000), segment["text"].strip()
+
+def fts_query(query, phrase=False):
+    # the words of query, all of them required, quoted so that punctuation is not FTS5 syntax
+    if phrase:
+        return '"' + query.replace('"', '""') + '"'
+    return " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+def format_milliseconds(milliseconds):
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
+
+
+class SearchIndex:
+
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, index_name)
+        # like the manifest, it can live on a share used by several nodes
+        self.connection = sqlite3.connect(self.path, timeout=60)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(
+            """CREATE TABLE IF NOT EXISTS transcripts (
+                id INTEGER PRIMARY KEY,
+                path TEXT UNIQUE,
+                media TEXT,
+                size INTEGER,
+                mtime_ns INTEGER,
+                language TEXT
+            );
+            CREATE TABLE IF NOT EXISTS segments (
+                id INTEGER PRIMARY KEY,
+                transcript INTEGER,
+                start_ms INTEGER,
+                end_ms INTEGER,
+                text TEXT
+            );
+            CREATE INDEX IF NOT EXISTS segments_transcript ON segments (transcript);
+            CREATE VIRTUAL TABLE IF NOT EXISTS segments_text USING fts5(
+                text, content='segments', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+            );
+            CREATE TRIGGER IF NOT EXISTS segments_added AFTER INSERT ON segments BEGIN
+                INSERT INTO segments_text (rowid, text) VALUES (new.id, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS segments_removed AFTER DELETE ON segments BEGIN
+                INSERT INTO segments_text (segments_text, rowid, text) VALUES ('delete', old.id, old.text);
+            END;""")
+        self.connection.commit()
+
+    def key(self, file_path):
+        return os.path.relpath(file_path, self.root)
+
+    def remove(self, json_path, commit=True):
+        row = self.connection.execute("SELECT id FROM transcripts WHERE path = ?", (self.key(json_path),)).fetchone()
+        if row is not None:
+            self.connection.execute("DELETE FROM segments WHERE transcript = ?", (row["id"],))
+            self.connection.execute("DELETE FROM transcripts WHERE id = ?", (row["id"],))
+        if commit:
+            self.connection.commit()
+
+    def add(self, json_path, result=None, media=None, stat=None, commit=True):
+        # indexes the transcript in json_path (result is its content, read from it if not given),
+        # replacing what was indexed for it before
+        stat = stat or os.stat(json_path)
+        if result is None:
+            with open(json_path, encoding="utf-8") as f:
+                result = json.load(f)
+        if not isinstance(result, dict):
+            # the format of the first versions: recorded without segments, so that it is read again
+            # only once it has been migrated (when the directory is transcribed again)
+            result = {}
+        self.remove(json_path, commit=False)
+        cursor = self.connection.execute(
+            "INSERT INTO transcripts (path, media, size, mtime_ns, language) VALUES (?, ?, ?, ?, ?)",
+            (self.key(json_path), self.key(media) if media else None, stat.st_size, stat.st_mtime_ns, result.get("language")))
+        self.connection.executemany(
+            "INSERT INTO segments (transcript, start_ms, end_ms, text) VALUES (?, ?, ?, ?)",
+            [(cursor.lastrowid, start, end, text) for start, end, text in segment_rows(result)])
+        if commit:
+            self.connection.commit()
+
+    def add_outputs(self, media, result):
+        # after the outputs of media were written: indexes its json if it has one
+        json_path = os.path.splitext(media)[0] + ".json"
+        try:
+            stat = os.stat(json_path)
+        except FileNotFoundError:
+            return
+        self.add(json_path, result, media, stat)
+
+    def update(self):
+        # Indexes the json files under the root that are new or changed since they were indexed and
+        # forgets the ones that are gone. Returns (indexed, removed).
+        known = {row["path"]: (row["size"], row["mtime_ns"])
+                 for row in self.connection.execute("SELECT path, size, mtime_ns FROM transcripts")}
+        seen = set()
+        indexed = 0
+        stack = [self.root]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    listing = list(entries)
+            except OSError as error:
+                print(f"Cannot read {directory}: {error}")
+                continue
+            media = {}
+            for entry in listing:
+                base, extension = os.path.splitext(entry.name)
+                if extension.lower() in transcribable_extension_set:
+                    media[base] = entry.path
+            for entry in listing:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith(".") and entry.name not in ignored_directories:
+                            stack.append(entry.path)
+                        continue
+                    if not entry.name.endswith(".json") or entry.name.startswith("."):
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                key = self.key(entry.path)
+                seen.add(key)
+                if known.get(key) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                try:
+                    self.add(entry.path, media=media.get(entry.name[:-5]), stat=stat, commit=False)
+                except (OSError, ValueError, KeyError, TypeError) as error:
+                    print(f"Cannot index {entry.path}: {error}")
+                    continue
+                indexed += 1
+                if indexed % commit_every == 0:
+                    self.connection.commit()
+        removed = [path for path in known if path not in seen]
+        for path in removed:
+            self.remove(os.path.join(self.root, path), commit=False)
+        self.connection.commit()
+        return indexed, len(removed)
+
+    def search(self, query, limit=50, language=None, phrase=False):
+        # the best matching segments: {"file", "transcript", "start_ms", "end_ms", "text", "language"}
+        if not query.strip():
+            raise ValueError("The query is empty")  # MATCH '' is an SQLite error, not "no matches"
+        sql = ("SELECT transcripts.path AS transcript, transcripts.media, transcripts.language, "
+               "segments.start_ms, segments.end_ms, segments.text FROM segments_text "
+               "JOIN segments ON segments.id = segments_text.rowid "
+               "JOIN transcripts ON transcripts.id = segments.transcript "
+               "WHERE segments_text MATCH ?")
+        parameters = [fts_query(query, phrase)]
+        if language:
+            sql += " AND transcripts.language = ?"
+            parameters.append(language)
+        sql += " ORDER BY segments_text.rank LIMIT ?"
+        parameters.append(limit)
+        return [{"file": os.path.join(self.root, row["media"] or row["transcript"]),
+                 "transcript": os.path.join(self.root, row["transcript"]),
+                 "start_ms": row["start_ms"], "end_ms": row["end_ms"], "text": row["text"], "language": row["language"]}
+                for row in self.connection.execute(sql, parameters)]
+
+    def close(self):
+        self.connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Searches the transcripts of a directory")
+    parser.add_argument("directory")
+    parser.add_argument("query")
+    parser.add_argument("--language", help="only the transcripts in this language (code, e.g. it)")
+    parser.add_argument("--limit", type=int, default=20, help="(default: %(default)s)")
+    parser.add_argument("--phrase", action="store_true", help="the words in this order, one after the other")
+    parser.add_argument("--update", action="store_true", help="index the transcripts written or changed since the last update first")
+    parser.add_argument("--json", action="store_true", help="print the matches as JSON lines")
+    arguments = parser.parse_args(argv)
+    if not arguments.query.strip():
+        parser.error("the query is empty")
+
+    index = SearchIndex(arguments.directory)
+    try:
+        if arguments.update:
+            indexed, removed = index.update()
+            print(f"Indexed {indexed} transcripts, forgot {removed}")
+        matches = index.search(arguments.query, arguments.limit, arguments.language, arguments.phrase)
+    finally:
+        index.close()
+    for match in matches:
+        if arguments.json:
+            print(json.dumps(match))
+        else:
+            print(f"{match['file']} [{format_milliseconds(match['start_ms'])} --> {format_milliseconds(match['end_ms'])}] {match['text']}")
+    return matches
+
+
+if __name__ == "__main__":
+    main()
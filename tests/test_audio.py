@@ -0,0 +1,227 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from audio import SAMPLE_RATE, detect_speech_regions, speech_fraction, shift_segments, transcribe_speech_regions
+
+
+def synthetic_audio(layout, seed=0):
+    # layout: list of (seconds, is_speech); "speech" is a loud modulated tone, silence is faint noise
+    random = np.random.default_rng(seed)
+    pieces = []
+    for seconds, is_speech in layout:
+        samples = int(seconds * SAMPLE_RATE)
+        t = np.arange(samples) / SAMPLE_RATE
+        if is_speech:
+            pieces.append(0.3 * np.sin(2 * np.pi * 220 * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 3 * t)))
+        else:
+            pieces.append(0.001 * random.standard_normal(samples))
+    return np.concatenate(pieces).astype(np.float32)
+
+
+def test_speech_regions_are_found():
+    audio = synthetic_audio([(5, False), (3, True), (10, False), (2, True), (4, False)])
+    regions = detect_speech_regions(audio)
+    assert len(regions) == 2
+    (first_start, first_end), (second_start, second_end) = regions
+    assert abs(first_start / SAMPLE_RATE - 5) < 0.5 and abs(first_end / SAMPLE_RATE - 8) < 0.5
+    assert abs(second_start / SAMPLE_RATE - 18) < 0.5 and abs(second_end / SAMPLE_RATE - 20) < 0.5
+    assert 0.15 < speech_fraction(regions, len(audio)) < 0.3
+
+
+def test_close_regions_are_merged_and_blips_dropped():
+    audio = synthetic_audio([(2, False), (1, True), (0.5, False), (1, True), (5, False), (0.05, True), (5, False)])
+    regions = detect_speech_regions(audio)
+    assert len(regions) == 1
+    assert abs(regions[0][0] / SAMPLE_RATE - 2) < 0.5 and abs(regions[0][1] / SAMPLE_RATE - 4.5) < 0.5
+
+
+def test_silence_has_no_regions():
+    assert detect_speech_regions(synthetic_audio([(10, False)])) == []
+    assert detect_speech_regions(np.zeros(0, dtype=np.float32)) == []
+
+
+def test_continuous_speech_is_all_speech():
+    # no quiet frame to take the noise floor from: the loudness stays within a few dB
+    random = np.random.default_rng(0)
+    envelope = np.repeat(random.uniform(0.5, 1.0, 60 * 5), SAMPLE_RATE // 5)
+    audio = (0.2 * random.standard_normal(60 * SAMPLE_RATE) * envelope).astype(np.float32)
+    assert detect_speech_regions(audio) == [(0, len(audio))]
+
+
+def test_shift_segments():
+    segments = [{"id": 0, "seek": 0, "start": 1.0, "end": 2.5, "text": " hi",
+                 "words": [{"word": " hi", "start": 1.0, "end": 2.5}]}]
+    shifted, = shift_segments(segments, 10.0, first_id=4)
+    assert (shifted["id"], shifted["seek"], shifted["start"], shifted["end"]) == (4, 1000, 11.0, 12.5)
+    assert shifted["words"][0]["start"] == 11.0
+    assert segments[0]["start"] == 1.0  # the original is untouched
+
+
+class FakeModel:
+    # returns one segment covering every piece of audio it is given
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, audio, language=None, **options):
+        self.calls.append((len(audio), language))
+        seconds = len(audio) / SAMPLE_RATE
+        text = f" piece{len(self.calls)}"
+        return {"text": text, "language": language or "it",
+                "segments": [{"id": 0, "seek": 0, "start": 0.0, "end": seconds, "text": text,
+                              "words": [{"word": text, "start": 0.0, "end": seconds}]}]}
+
+
+class JoinedModel:
+    # one segment per region it is given (joined one after the other), and one spanning the first join
+    def __init__(self, lengths):
+        self.lengths = lengths
+        self.calls = []
+
+    def transcribe(self, audio, language=None, **options):
+        self.calls.append((len(audio), language))
+        segments = []
+        position = 0.0
+        for index, length in enumerate(self.lengths):
+            start, end = position, position + length / SAMPLE_RATE
+            segments.append({"id": index, "seek": 0, "start": start, "end": end, "text": f" region{index}",
+                             "words": [{"word": f" region{index}", "start": start, "end": end}]})
+            position = end
+        first_join = self.lengths[0] / SAMPLE_RATE
+        segments.append({"id": len(segments), "seek": 0, "start": first_join - 0.5, "end": first_join + 0.5, "text": " across"})
+        return {"text": "".join(segment["text"] for segment in segments), "language": language or "it", "segments": segments}
+
+
+def test_regions_are_transcribed_together_and_mapped_back():
+    audio = synthetic_audio([(5, False), (3, True), (10, False), (2, True), (4, False), (3, True), (2, False)])
+    regions = detect_speech_regions(audio)
+    assert len(regions) == 3
+    model = JoinedModel([end - start for start, end in regions])
+    result = transcribe_speech_regions(model, audio, regions, word_timestamps=True)
+    # one whisper call for all the speech, not one per region
+    assert model.calls == [(sum(end - start for start, end in regions), None)]
+    assert result["language"] == "it"
+    for segment, (start, end) in zip(result["segments"], regions):
+        assert segment["start"] == pytest.approx(start / SAMPLE_RATE, abs=1e-3)
+        assert segment["end"] == pytest.approx(end / SAMPLE_RATE, abs=1e-3)
+        assert segment["words"][0]["start"] == segment["start"] and segment["words"][0]["end"] == segment["end"]
+    # a segment across a join starts in the first region and ends in the second one
+    across = result["segments"][-1]
+    assert across["start"] == pytest.approx(regions[0][1] / SAMPLE_RATE - 0.5, abs=1e-3)
+    assert across["end"] == pytest.approx(regions[1][0] / SAMPLE_RATE + 0.5, abs=1e-3)
+
+
+def test_long_audio_is_split_at_silences(monkeypatch):
+    import audio
+    monkeypatch.setattr(audio, "window_seconds", 10)
+    monkeypatch.setattr(audio, "overlap_seconds", 2)
+    monkeypatch.setattr(audio, "silence_search_seconds", 3)
+    # speech everywhere except short pauses around 11s and 22s
+    recording = synthetic_audio([(11, True), (0.5, False), (10.5, True), (0.5, False), (12, True)])
+    windows, cuts = audio.split_into_windows(recording)
+    assert len(windows) == 3 and len(cuts) == 2
+    assert abs(cuts[0] / SAMPLE_RATE - 11.25) < 0.3 and abs(cuts[1] / SAMPLE_RATE - 22.25) < 0.3
+    assert windows[0][0] == 0 and windows[-1][1] == len(recording)
+    for (start, end), cut in zip(windows[1:], cuts):
+        assert start == cut - SAMPLE_RATE  # half of the overlap on each side of the cut
+    assert audio.split_into_windows(recording[:SAMPLE_RATE * 14]) == ([(0, SAMPLE_RATE * 14)], [])
+
+
+def test_overlapping_windows_are_stitched_without_duplicates():
+    from audio import stitch_results
+
+    def window(*segments):
+        return {"text": "".join(text for _, _, text in segments), "language": "en",
+                "segments": [{"id": i, "seek": 0, "start": start, "end": end, "text": text,
+                              "words": [{"word": text, "start": start, "end": end}]}
+                             for i, (start, end, text) in enumerate(segments)]}
+
+    # cut at 10s, windows overlap between 9s and 11s
+    first = window((0.0, 4.0, " one"), (4.5, 8.5, " two"), (9.2, 9.8, " three"))
+    second = window((0.2, 0.8, " three"), (2.5, 6.0, " four"))
+    result = stitch_results([(0.0, first), (9.0, second)], [10 * SAMPLE_RATE])
+    assert result["text"] == " one two three four"
+    assert [segment["id"] for segment in result["segments"]] == [0, 1, 2, 3]
+    assert result["segments"][3]["start"] == 11.5 and result["segments"][3]["words"][0]["end"] == 15.0
+    assert result["language"] == "en"
+
+
+def test_decoded_audio_is_cached_and_memory_mapped(tmp_path, monkeypatch):
+    import audio
+    decoded = []
+
+    def fake_decode(file_path, sample_rate=SAMPLE_RATE):
+        decoded.append(file_path)
+        return np.full(SAMPLE_RATE, len(decoded), dtype=np.float32)
+
+    monkeypatch.setattr(audio, "decode_audio", fake_decode)
+    media = tmp_path / "a.mp4"
+    media.write_bytes(b"a video")
+    cache_dir = str(tmp_path / "cache")
+
+    first = audio.load_audio_cached(str(media), cache_dir)
+    second = audio.load_audio_cached(str(media), cache_dir)
+    assert decoded == [str(media)]
+    assert isinstance(second, np.memmap) and np.array_equal(first, second)
+    # copy-on-write: changing the array does not change the cache
+    second[0] = 42
+    assert audio.load_audio_cached(str(media), cache_dir)[0] == 1
+
+    # same content elsewhere is the same cache entry
+    copy = tmp_path / "copy.mp4"
+    copy.write_bytes(b"a video")
+    audio.load_audio_cached(str(copy), cache_dir)
+    assert len(decoded) == 1
+
+
+def test_audio_cache_evicts_least_recently_used(tmp_path, monkeypatch):
+    import os
+    import audio
+    monkeypatch.setattr(audio, "decode_audio", lambda file_path, sample_rate=SAMPLE_RATE: np.zeros(1000, dtype=np.float32))
+    cache_dir = str(tmp_path / "cache")
+    entry_size = 4000 + 128  # data plus the .npy header
+    for index, name in enumerate(["a", "b", "c"]):
+        media = tmp_path / f"{name}.wav"
+        media.write_bytes(name.encode())
+        audio.load_audio_cached(str(media), cache_dir, max_bytes=2 * entry_size)
+        if name == "b":
+            # a was used again, so b is now the least recently used
+            old = os.path.getmtime(next(p for p in os.scandir(cache_dir))) - 100
+            for path in os.scandir(cache_dir):
+                os.utime(path.path, (old, old))
+            audio.load_audio_cached(str(tmp_path / "a.wav"), cache_dir)
+    remaining = sorted(name for name in os.listdir(cache_dir) if name.endswith(".npy"))
+    assert len(remaining) == 2
+    assert audio.full_hash(str(tmp_path / "b.wav")) + "-16000.npy" not in remaining
+
+
+def test_same_sampled_blocks_are_different_cache_entries(tmp_path, monkeypatch):
+    import audio
+    from manifest import fingerprint_block_size, fingerprint_file
+    decoded = []
+    monkeypatch.setattr(audio, "decode_audio", lambda file_path, sample_rate=SAMPLE_RATE: decoded.append(file_path) or np.full(10, decoded.count(file_path), dtype=np.float32))
+    monkeypatch.setattr(audio, "full_hash", lambda file_path, real=audio.full_hash: decoded.append("hash") or real(file_path))
+    # two recordings of the same length, silent where the fingerprint samples them
+    first, second = tmp_path / "first.wav", tmp_path / "second.wav"
+    content = bytearray(10 * fingerprint_block_size)
+    content[fingerprint_block_size + 1] = 1
+    first.write_bytes(content)
+    content[fingerprint_block_size + 1] = 2
+    second.write_bytes(content)
+    assert fingerprint_file(str(first)) == fingerprint_file(str(second))
+
+    cache_dir = str(tmp_path / "cache")
+    assert audio.load_audio_cached(str(first), cache_dir)[0] == 1
+    assert audio.load_audio_cached(str(second), cache_dir)[0] == 1
+    # the content is hashed once per version of the file
+    audio.load_audio_cached(str(first), cache_dir)
+    assert decoded == ["hash", str(first), "hash", str(second)]
+
+
+def test_audio_without_speech_regions_is_transcribed_whole():
+    import transcribe
+    model = FakeModel()
+    audio = np.zeros(10 * SAMPLE_RATE, dtype=np.float32)
+    result = transcribe.transcribe_audio_without_silence(model, audio, None, {})
+    assert model.calls == [(len(audio), None)]
+    assert result["text"] == " piece1"
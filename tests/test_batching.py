@@ -0,0 +1,63 @@
+import batching
+import transcribe
+
+timestamp_begin = 1000  # stands for <|0.00|>, every following token is 20 ms later
+
+
+def timestamp(seconds):
+    return timestamp_begin + round(seconds / 0.02)
+
+
+def test_clips_are_batched_by_length():
+    clips = [(name, [0.0] * length) for name, length in [("a", 5), ("b", 1), ("c", 4), ("d", 2), ("e", 3)]]
+    batches = batching.group_by_length(clips, 2)
+    assert [[name for name, audio in batch] for batch in batches] == [["b", "d"], ["e", "c"], ["a"]]
+
+
+def test_tokens_are_split_at_consecutive_timestamps():
+    tokens = [timestamp(0), 1, 2, timestamp(2.5), timestamp(2.5), 3, timestamp(4), timestamp(4.2), 4, 5, timestamp(7)]
+    segments = batching.split_segments(tokens, timestamp_begin, duration=9.0)
+    assert [(start, end) for start, end, _ in segments] == [(0.0, 2.5), (2.5, 4.0), (4.2, 7.0)]
+    assert segments[1][2] == [timestamp(2.5), 3, timestamp(4)]
+
+
+def test_unfinished_tail_runs_to_the_end_of_the_clip():
+    tokens = [timestamp(0), 1, timestamp(2), timestamp(2), 2, 3]
+    segments = batching.split_segments(tokens, timestamp_begin, duration=6.0)
+    assert [(start, end, tokens) for start, end, tokens in segments] == [(0.0, 2.0, [timestamp(0), 1, timestamp(2)]),
+                                                                         (2.0, 6.0, [timestamp(2), 2, 3])]
+
+
+def test_tokens_without_timestamp_pairs_make_one_segment():
+    assert batching.split_segments([timestamp(0), 1, 2, timestamp(3)], timestamp_begin, 8.0) == [(0.0, 3.0, [timestamp(0), 1, 2, timestamp(3)])]
+    assert batching.split_segments([1, 2], timestamp_begin, 8.0) == [(0.0, 8.0, [1, 2])]
+
+
+def test_short_clips_are_decoded_in_batches_and_failures_alone(monkeypatch):
+    lengths = {"long.wav": 45, "a.wav": 10, "b.wav": 5, "c.wav": 20, "bad.wav": 8}
+    monkeypatch.setattr(transcribe, "read_audio", lambda file, audio_cache=False: [0.0] * (lengths[file] * batching.SAMPLE_RATE))
+    alone = []
+
+    class Model:
+        device = "cpu"
+
+        def transcribe(self, audio, **options):
+            alone.append(len(audio) // batching.SAMPLE_RATE)
+            return {"text": " alone", "segments": [], "language": "en"}
+
+    monkeypatch.setattr(transcribe, "get_model", lambda *args, **kwargs: Model())
+    batches = []
+
+    def transcribe_batch(model, audios, *args, **kwargs):
+        seconds = [len(audio) // batching.SAMPLE_RATE for audio in audios]
+        batches.append(seconds)
+        return [None if second == 8 else {"text": f" {second}", "segments": [], "language": "en"} for second in seconds]
+
+    monkeypatch.setattr(batching, "transcribe_batch", transcribe_batch)
+
+    results = dict(transcribe.transcribe_in_batches(list(lengths), "tiny", "", "en", batch_size=2))
+
+    assert batches == [[5, 8], [10, 20]]
+    assert alone == [45, 8]
+    assert {file: result["text"] for file, result in results.items()} == {
+        "long.wav": " alone", "a.wav": " 10", "b.wav": " 5", "c.wav": " 20", "bad.wav": " alone"}
@@ -0,0 +1,38 @@
+import os
+import sys
+import json
+import hashlib
+
+# after the repository root: benchmarks/writers.py must not hide the writers module
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import corpus
+import suite
+
+
+def digest(paths):
+    content = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            content.update(f.read())
+    return content.hexdigest()
+
+
+def test_corpora_are_reproducible(tmp_path):
+    first = corpus.make_corpus(str(tmp_path / "first"), 30, "deep")
+    second = corpus.make_corpus(str(tmp_path / "second"), 30, "deep")
+    assert [os.path.relpath(path, tmp_path / "first") for path in first] == [os.path.relpath(path, tmp_path / "second") for path in second]
+    assert digest(first) == digest(second)
+    assert os.path.relpath(first[25], tmp_path / "first") == os.path.join("d0", "d0", "d0", "d2", "clip000025.wav")
+
+
+def test_suite_reports_every_benchmark(tmp_path, capsys):
+    output = tmp_path / "report.json"
+    report = suite.main(["--files", "20", "--runs", "1", "--skip-end-to-end", "--output", str(output)])
+    assert json.loads(output.read_text()) == json.loads(json.dumps(report))
+    for name in ("discovery", "write_files", "json_probe", "manifest_skip"):
+        assert report["results"][name]["files_per_second"] > 0
+
+    compared = suite.main(["--files", "20", "--runs", "1", "--skip-end-to-end", "--compare", str(output)])
+    assert set(compared["compared_with"]["ratios"]) >= {"discovery", "write_files"}
+    assert "warning" not in compared["compared_with"]
@@ -0,0 +1,50 @@
+import sys
+import subprocess
+
+import pytest
+
+import transcribe
+
+
+def test_importing_does_not_load_heavy_modules():
+    check = "import sys, transcribe; print(sorted(m for m in ('torch', 'whisper', 'numpy', 'tkinter', 'langdetect') if m in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", check], cwd=transcribe.os.path.dirname(transcribe.__file__),
+                            check=True, capture_output=True, text=True).stdout
+    assert output.strip() == "[]"
+
+
+def test_arguments(tmp_path):
+    arguments = transcribe.parse_arguments([str(tmp_path), "--model", "small", "--language", "italian",
+                                            "--formats", "srt,txt", "--srt-max-words-per-line", "7", "--workers", "4"])
+    assert arguments.language_code == "it"
+    assert arguments.selected_formats == ["srt", "txt"]
+    assert arguments.options == {"srt": {"max_words_per_line": 7, "highlight_words": False, "max_line_count": 1}, "txt": {}}
+    assert arguments.workers == 4
+
+
+def test_defaults_match_the_interface(tmp_path):
+    arguments = transcribe.parse_arguments([str(tmp_path)])
+    assert arguments.model == "medium.en"
+    assert arguments.language_code == "en"  # the .en models only do english
+    assert arguments.selected_formats == transcribe.output_formats
+    assert arguments.options["vtt"]["max_words_per_line"] == 35
+
+
+@pytest.mark.parametrize("language, code", [("auto", "None"), ("de", "de"), ("German", "de"), ("find out automatically", "None")])
+def test_language_codes(language, code):
+    assert transcribe.language_code(language, "medium") == code
+
+
+@pytest.mark.parametrize("argv", [["--formats", "txt,doc"], ["--language", "klingon", "--model", "small"]])
+def test_bad_arguments(tmp_path, argv):
+    with pytest.raises(SystemExit):
+        transcribe.parse_arguments([str(tmp_path)] + argv)
+
+
+def test_main_runs_the_transcription(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(transcribe, "perform_transcription", lambda *args, **kwargs: calls.append((args, kwargs)))
+    transcribe.main([str(tmp_path), "--model", "tiny", "--language", "fr", "--vad", "--model-memory", "2"])
+    (args, kwargs), = calls
+    assert args[:2] == (str(tmp_path), "tiny") and args[5] == "fr"
+    assert kwargs["vad"] and kwargs["model_cache_budget"] == 2 * 1024**3
@@ -0,0 +1,115 @@
+import os
+import contextlib
+
+import numpy as np
+
+import dedup
+import transcribe
+from dedup import Deduplicator, audio_fingerprint, audio_fingerprints_match
+from manifest import Manifest, fingerprint_block_size
+
+
+def fake_result(text=" hello"):
+    return {"text": text, "language": "en",
+            "segments": [{"id": 0, "start": 0.0, "end": 2.0, "text": text,
+                          "words": [{"word": text, "start": 0.0, "end": 2.0}]}]}
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+    return str(path)
+
+
+def recording(seconds=20, seed=0):
+    # voice-like: a pitch with its harmonics, changing every 200 ms, with varying loudness
+    generator = np.random.default_rng(seed)
+    steps = int(seconds * 5)
+    pitches = np.repeat(generator.uniform(100, 250, steps), 3200)
+    envelope = np.repeat(generator.uniform(0.1, 1.0, steps), 3200)
+    phase = np.cumsum(2 * np.pi * pitches / 16000)
+    harmonics = sum(np.sin(harmonic * phase) * generator.uniform(0, 1 / harmonic, len(phase) // 3200).repeat(3200)
+                    for harmonic in range(1, 30))
+    return (harmonics * envelope * 0.3).astype(np.float32)
+
+
+def test_audio_fingerprint_survives_noise_volume_and_a_shift():
+    audio = recording()
+    reencoded = 0.5 * audio[800:] + np.random.default_rng(1).normal(0, 0.01, len(audio) - 800).astype(np.float32)
+    assert audio_fingerprints_match(audio_fingerprint(audio), audio_fingerprint(reencoded))
+    assert not audio_fingerprints_match(audio_fingerprint(audio), audio_fingerprint(recording(seed=2)))
+
+
+def test_silence_has_no_fingerprint():
+    assert audio_fingerprint(np.zeros(16000 * 10, dtype=np.float32)) is None
+
+
+def test_sampled_fingerprint_collision_is_settled_by_the_full_hash(tmp_path):
+    size = 4 * fingerprint_block_size
+    original = write(tmp_path / "a" / "lecture.mp3", b"x" * size)
+    copy = write(tmp_path / "b" / "lecture.mp3", b"x" * size)
+    # same size and same sampled blocks, different bytes in between
+    different = write(tmp_path / "c" / "lecture.mp3", b"x" * (size // 4 + 10) + b"y" + b"x" * (3 * size // 4 - 11))
+
+    records = Manifest(str(tmp_path))
+    deduplicator = Deduplicator(records)
+    assert deduplicator.original(original) is None
+    deduplicator.add(original)
+    assert deduplicator.original(copy) == original
+    assert deduplicator.original(different) is None
+    # the full hash of the original was computed once and cached in the manifest
+    assert records.cached_content(original, os.stat(original))["full_hash"] == dedup.full_hash(original)
+    records.close()
+
+
+def test_copies_are_transcribed_once(tmp_path, monkeypatch):
+    first = write(tmp_path / "course1" / "lecture.mp3", b"the same lecture")
+    second = write(tmp_path / "course2" / "lecture.mp3", b"the same lecture")
+    other = write(tmp_path / "course2" / "other.mp3", b"another lecture")
+    transcribed = []
+    monkeypatch.setattr(transcribe, "transcribe_file", lambda file, *args: transcribed.append(file) or fake_result())
+    monkeypatch.setattr(transcribe, "decoding_progress", lambda on_update: contextlib.nullcontext())
+    events = []
+
+    transcribe.perform_transcription(str(tmp_path), "tiny", {}, ["txt", "json"], "", "en", progress=events.append,
+                                     background_writes=False)
+
+    assert len(transcribed) == 2 and other in transcribed
+    for media in (first, second, other):
+        base = os.path.splitext(media)[0]
+        assert os.path.exists(base + ".txt") and os.path.exists(base + ".json")
+    assert events[-1]["deduplicated_seconds"] == 2.0
+
+    # a copy added later gets its outputs from the json of the first one
+    third = write(tmp_path / "course3" / "lecture.mp3", b"the same lecture")
+    transcribe.perform_transcription(str(tmp_path), "tiny", {}, ["txt", "srt", "json"], "", "en")
+    assert len(transcribed) == 2
+    assert open(os.path.splitext(third)[0] + ".txt").read().strip() == "hello"
+    assert os.path.exists(os.path.splitext(first)[0] + ".srt")
+
+
+def test_deduplication_can_be_turned_off(tmp_path, monkeypatch):
+    write(tmp_path / "a" / "lecture.mp3", b"the same lecture")
+    write(tmp_path / "b" / "lecture.mp3", b"the same lecture")
+    transcribed = []
+    monkeypatch.setattr(transcribe, "transcribe_file", lambda file, *args: transcribed.append(file) or fake_result())
+
+    transcribe.perform_transcription(str(tmp_path), "tiny", {}, ["txt"], "", "en", deduplicate=False)
+
+    assert len(transcribed) == 2
+
+
+def test_audio_copies_are_recognized(tmp_path, monkeypatch):
+    video = write(tmp_path / "video" / "lecture.mp4", b"video container")
+    extracted = write(tmp_path / "audio" / "lecture.m4a", b"audio container")
+    audio = recording()
+    decoded = {video: audio, extracted: 0.8 * audio}
+    monkeypatch.setattr(transcribe, "read_audio", lambda file, audio_cache=False: decoded[file])
+    transcribed = []
+    monkeypatch.setattr(transcribe, "transcribe_file", lambda file, *args: transcribed.append(file) or fake_result())
+
+    transcribe.perform_transcription(str(tmp_path), "tiny", {}, ["txt", "json"], "", "en", audio_dedup=True)
+
+    assert len(transcribed) == 1
+    assert os.path.exists(tmp_path / "video" / "lecture.txt") and os.path.exists(tmp_path / "audio" / "lecture.txt")
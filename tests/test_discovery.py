@@ -0,0 +1,60 @@
+import os
+import time
+
+import discovery
+from discovery import Discovery, iter_transcribable_files, list_transcribable_files
+
+
+def make_tree(root, paths):
+    for path in paths:
+        full_path = root / path
+        full_path.parent.mkdir(parents=True, exist_ok=True)
+        full_path.write_bytes(b"")
+
+
+def walk_like_before(directory):
+    # the os.walk based listing this replaces
+    found = []
+    for root, dirs, files in os.walk(directory):
+        for file in files:
+            if not file.startswith('.') and any(file.lower().endswith(ext) for ext in discovery.transcribable_extensions):
+                found.append(os.path.join(root, file))
+    return found
+
+
+def test_same_files_and_order_as_os_walk(tmp_path):
+    make_tree(tmp_path, ["a.mp3", "b.txt", "c.WAV", "sub/d.mkv", "sub/deeper/e.m4a", "sub2/f.avi", ".hidden.mp3", "sub/g.json"])
+    assert sorted(list_transcribable_files(str(tmp_path))) == sorted(walk_like_before(str(tmp_path)))
+    found = list_transcribable_files(str(tmp_path))
+    # the files of a directory come before the ones of its subdirectories
+    assert found.index(str(tmp_path / "a.mp3")) < found.index(str(tmp_path / "sub" / "d.mkv"))
+    assert found.index(str(tmp_path / "sub" / "d.mkv")) < found.index(str(tmp_path / "sub" / "deeper" / "e.m4a"))
+
+
+def test_ignored_and_hidden_directories_are_pruned(tmp_path):
+    make_tree(tmp_path, ["keep/a.mp3", ".git/b.mp3", "@eaDir/c.mp3", "__pycache__/d.wav"])
+    assert list_transcribable_files(str(tmp_path)) == [str(tmp_path / "keep" / "a.mp3")]
+
+
+def test_discovery_streams_through_a_bounded_queue(tmp_path):
+    make_tree(tmp_path, [f"dir{i}/file{j}.wav" for i in range(5) for j in range(10)])
+    files = Discovery(str(tmp_path), maxsize=3)
+    time.sleep(0.2)
+    # the walker waits for the consumer instead of listing everything up front
+    assert files.found <= 4 and not files.done
+    consumed = list(files)
+    assert len(consumed) == 50 and files.found == 50 and files.done
+    assert files.progress() == "50"
+
+
+def test_discovery_can_be_stopped_early(tmp_path):
+    make_tree(tmp_path, [f"file{j}.wav" for j in range(20)])
+    files = Discovery(str(tmp_path), maxsize=2)
+    next(iter(files))
+    files.stop()
+    files.thread.join(timeout=5)
+    assert not files.thread.is_alive()
+
+
+def test_missing_directory_yields_nothing(tmp_path):
+    assert list(iter_transcribable_files(str(tmp_path / "missing"))) == []
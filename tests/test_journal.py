@@ -0,0 +1,113 @@
+import os
+import json
+
+import numpy as np
+import pytest
+
+import audio
+import transcribe
+from journal import Journal, journal_path
+
+
+def result(text, seconds):
+    return {"text": text, "language": "en",
+            "segments": [{"id": 0, "seek": 0, "start": 0.0, "end": seconds, "text": text,
+                          "words": [{"word": text, "start": 0.0, "end": seconds, "probability": 0.9}]}]}
+
+
+def test_journal_keeps_the_complete_windows(tmp_path):
+    media = tmp_path / "long.wav"
+    media.write_bytes(b"a long recording")
+    settings = {"model": "tiny", "windows": [(0, 10), (8, 20)]}
+
+    with Journal(str(media), settings) as journal:
+        journal.append(0, result(" one", 1.0), "one")
+    with open(journal_path(str(media)), "a") as f:
+        f.write('{"window": 1, "result": {"te')  # the crash came in the middle of a line
+
+    with Journal(str(media), settings) as journal:
+        assert journal.windows == {0: (result(" one", 1.0), "one")}
+        journal.append(1, result(" two", 1.0), "two")
+    with Journal(str(media), settings) as journal:
+        assert sorted(journal.windows) == [0, 1]
+
+    # other settings start over
+    with Journal(str(media), dict(settings, model="base")) as journal:
+        assert journal.windows == {}
+
+
+class Model:
+    device = "cpu"
+
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+        self.calls = []
+
+    def transcribe(self, samples, language=None, initial_prompt=None, **options):
+        # a text per window telling where it starts, and the prompt it continues
+        self.calls.append(initial_prompt)
+        if len(self.calls) == self.fail_at:
+            raise RuntimeError("the process died")
+        first = int(samples[0])
+        return result(f" from {first} after [{initial_prompt or ''}]", len(samples) / audio.SAMPLE_RATE)
+
+
+def test_interrupted_transcription_resumes_where_it_stopped(tmp_path, monkeypatch):
+    monkeypatch.setattr(audio, "window_seconds", 10)
+    monkeypatch.setattr(audio, "overlap_seconds", 2)
+    monkeypatch.setattr(audio, "silence_search_seconds", 2)
+    samples = np.repeat(np.arange(50, dtype=np.float32), audio.SAMPLE_RATE)  # 50 s, the second as a value
+    monkeypatch.setattr(transcribe, "read_audio", lambda file, audio_cache=False: samples)
+    for name in ("crashed", "uninterrupted"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "long.wav").write_bytes(b"a long recording")
+
+    crashing = Model(fail_at=3)
+    monkeypatch.setattr(transcribe, "get_model", lambda *args, **kwargs: crashing)
+    try:
+        transcribe.perform_transcription(str(tmp_path / "crashed"), "tiny", {}, ["json"], "", "en")
+    except RuntimeError:
+        pass
+    assert os.path.exists(tmp_path / "crashed" / "long.wav.journal")
+
+    resumed = Model()
+    monkeypatch.setattr(transcribe, "get_model", lambda *args, **kwargs: resumed)
+    transcribe.perform_transcription(str(tmp_path / "crashed"), "tiny", {}, ["json"], "", "en")
+    # the two windows in the journal were not transcribed again, the third continues the second
+    assert len(resumed.calls) == 6 - 2
+    assert resumed.calls[0] == crashing.calls[2]
+    assert not os.path.exists(tmp_path / "crashed" / "long.wav.journal")
+
+    monkeypatch.setattr(transcribe, "get_model", lambda *args, **kwargs: Model())
+    transcribe.perform_transcription(str(tmp_path / "uninterrupted"), "tiny", {}, ["json"], "", "en")
+    with open(tmp_path / "crashed" / "long.json") as crashed, open(tmp_path / "uninterrupted" / "long.json") as uninterrupted:
+        assert json.load(crashed) == json.load(uninterrupted)
+
+
+class ProgressModel(Model):
+    def transcribe(self, samples, language=None, initial_prompt=None, **options):
+        # reports its progress to whisper's progress bar, in two steps, like model.transcribe
+        import whisper.transcribe
+        frames = len(samples) // audio.HOP_LENGTH
+        with whisper.transcribe.tqdm.tqdm(total=frames, unit="frames") as pbar:
+            pbar.update(frames // 2)
+            pbar.update(frames - frames // 2)
+        return super().transcribe(samples, language, initial_prompt, **options)
+
+
+def test_progress_goes_through_the_windows_once(tmp_path, monkeypatch):
+    pytest.importorskip("whisper")
+    monkeypatch.setattr(audio, "window_seconds", 10)
+    monkeypatch.setattr(audio, "overlap_seconds", 2)
+    monkeypatch.setattr(audio, "silence_search_seconds", 2)
+    samples = np.repeat(np.arange(50, dtype=np.float32), audio.SAMPLE_RATE)
+    monkeypatch.setattr(transcribe, "read_audio", lambda file, audio_cache=False: samples)
+    monkeypatch.setattr(transcribe, "get_model", lambda *args, **kwargs: ProgressModel())
+    (tmp_path / "long.wav").write_bytes(b"a long recording")
+    events = []
+
+    transcribe.perform_transcription(str(tmp_path), "tiny", {}, ["json"], "", "en", progress=events.append)
+    # one progress through the whole file, not one per window starting over from 0
+    percents = [event["percent"] for event in events if event["event"] == "audio"]
+    assert len(percents) == 2 * 6
+    assert percents == sorted(percents) and percents[0] < 20 and percents[-1] == 100.0
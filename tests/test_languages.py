@@ -0,0 +1,89 @@
+import os
+import contextlib
+
+import numpy as np
+
+import audio
+import languages
+import transcribe
+from languages import LanguageResolver, language_sample
+from manifest import Manifest
+
+
+def speech_after_silence(silence_seconds, loudness):
+    # noise whose loudness changes every 200 ms, as speech does, after some silence
+    generator = np.random.default_rng(0)
+    silence = np.zeros(int(silence_seconds * 16000), dtype=np.float32)
+    envelope = np.repeat(generator.uniform(0.05, 1.0, 60 * 5), 3200)
+    speech = (generator.normal(0, 0.1, 60 * 16000) * envelope * loudness).astype(np.float32)
+    return np.concatenate([silence, speech])
+
+
+def fake_detection(model, sample, precision="fp32"):
+    # the loud recordings are in english
+    return ("en", 0.9) if np.abs(sample).mean() > 0.03 else ("it", 0.8)
+
+
+def test_sample_starts_with_the_speech():
+    sample = language_sample(speech_after_silence(10, 1.0))
+    assert len(sample) == languages.sample_seconds * 16000
+    assert np.abs(sample[:16000]).mean() > 0.01  # the silence was skipped (but for the padding)
+    assert language_sample(np.zeros(16000 * 20, dtype=np.float32)) is None
+
+
+def test_language_is_detected_once_per_content(tmp_path, monkeypatch):
+    media = tmp_path / "lecture.mp3"
+    media.write_bytes(b"a lecture")
+    detected = []
+    monkeypatch.setattr(languages, "detect_language", lambda *args: detected.append(1) or fake_detection(*args))
+    read_sample = lambda file: language_sample(speech_after_silence(1, 0.2))
+
+    manifest = Manifest(str(tmp_path))
+    assert LanguageResolver(lambda: None, manifest, read_sample=read_sample).language(str(media)) == "it"
+    # a later run, with whatever model, reuses it
+    resolver = LanguageResolver(lambda: None, manifest, read_sample=read_sample)
+    assert resolver.language(str(media)) == "it"
+    assert len(detected) == 1 and resolver.reused == 1 and resolver.detected == 0
+
+    media.write_bytes(b"another lecture")
+    assert resolver.language(str(media)) == "it"
+    assert len(detected) == 2
+    manifest.close()
+
+
+def test_english_files_go_to_the_english_model(tmp_path, monkeypatch):
+    english = tmp_path / "english.mp3"
+    italian = tmp_path / "italiano.mp3"
+    english.write_bytes(b"a talk")
+    italian.write_bytes(b"una lezione")
+    monkeypatch.setattr(audio, "decode_audio", lambda file, seconds=None: speech_after_silence(2, 1.0 if os.path.basename(file).startswith("english") else 0.2))
+    monkeypatch.setattr(languages, "detect_language", fake_detection)
+    monkeypatch.setattr(transcribe, "get_model", lambda *args, **kwargs: None)
+    monkeypatch.setattr(transcribe, "decoding_progress", lambda on_update: contextlib.nullcontext())
+    transcribed = []
+
+    def transcribe_file(file, model, prompt, language, *args):
+        transcribed.append((os.path.basename(file), model, language))
+        return {"text": " hello", "language": language, "segments": [{"id": 0, "start": 0.0, "end": 1.0, "text": " hello"}]}
+    monkeypatch.setattr(transcribe, "transcribe_file", transcribe_file)
+    events = []
+
+    transcribe.perform_transcription(str(tmp_path), "base", {}, ["txt", "json"], "", "None", english_model="base.en",
+                                     background_writes=False, progress=events.append, search_index=False)
+    assert sorted(transcribed) == [("english.mp3", "base.en", "en"), ("italiano.mp3", "base", "it")]
+    assert events[-1]["language_seconds"] > 0
+    manifest = Manifest(str(tmp_path))
+    assert manifest.lookup(str(english))["model"] == "base.en"
+
+    # transcribed again with another model: the languages are not detected again
+    manifest.connection.execute("DELETE FROM files")
+    manifest.connection.commit()
+    manifest.close()
+    for name in ("english", "italiano"):
+        for extension in (".txt", ".json"):
+            os.remove(tmp_path / (name + extension))
+    transcribed.clear()
+    monkeypatch.setattr(languages, "detect_language", lambda *args: 1 / 0)
+    transcribe.perform_transcription(str(tmp_path), "small", {}, ["txt", "json"], "", "None", background_writes=False,
+                                     search_index=False)
+    assert sorted(transcribed) == [("english.mp3", "small", "en"), ("italiano.mp3", "small", "it")]
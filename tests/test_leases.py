@@ -0,0 +1,159 @@
+import os
+import time
+import multiprocessing
+
+import pytest
+
+import leases
+
+
+def age_lock(file_path, seconds):
+    old = time.time() - seconds
+    os.utime(leases.lock_path(file_path), (old, old))
+
+
+def as_other_node(monkeypatch, node="other-node"):
+    monkeypatch.setattr(leases, "lease_host", node)
+    monkeypatch.setattr(leases, "lease_node", node)
+
+
+def test_claim_is_exclusive(tmp_path):
+    file_path = str(tmp_path / "a.wav")
+    lease = leases.claim_file(file_path)
+    assert lease is not None
+    assert leases.claim_file(file_path) is None
+    assert leases.is_file_locked(file_path)
+    leases.unlock_file(file_path, lease)
+    assert not leases.is_file_locked(file_path)
+    assert leases.claim_file(file_path) is not None
+
+
+def test_stale_lease_is_reclaimed(tmp_path, monkeypatch):
+    file_path = str(tmp_path / "a.wav")
+    assert leases.claim_file(file_path) is not None
+    as_other_node(monkeypatch)
+    assert leases.claim_file(file_path) is None
+    age_lock(file_path, leases.lease_timeout + 1)
+    lease = leases.claim_file(file_path)
+    assert lease is not None and lease["host"] == "other-node"
+
+
+def test_renewed_lease_is_not_reclaimed(tmp_path, monkeypatch):
+    file_path = str(tmp_path / "a.wav")
+    lease = leases.claim_file(file_path)
+    age_lock(file_path, leases.lease_timeout - 1)
+    assert leases.renew_lease(file_path, lease)
+    as_other_node(monkeypatch)
+    assert leases.claim_file(file_path) is None
+
+
+def test_dead_pid_in_another_pid_namespace_is_not_reclaimed(tmp_path, monkeypatch):
+    # same host name, but the pid belongs to another container: only the timeout counts
+    file_path = str(tmp_path / "a.wav")
+    process = multiprocessing.get_context("spawn").Process(target=leases.claim_file, args=(file_path,))
+    process.start()
+    process.join()
+    assert leases.read_lease(file_path)["pid"] == process.pid
+    monkeypatch.setattr(leases, "lease_node", "another-namespace")
+    assert leases.is_file_locked(file_path)
+    monkeypatch.undo()
+    if leases.lease_node:
+        # in our own namespace the dead pid is enough
+        assert not leases.is_file_locked(file_path)
+
+
+def test_stalled_holder_does_not_keep_a_reclaimed_lease(tmp_path, monkeypatch):
+    file_path = str(tmp_path / "a.wav")
+    keeper = leases.LeaseKeeper(interval=3600)
+    assert keeper.claim(file_path)
+    assert keeper.holds(file_path)
+    # the holder is suspended, another node reclaims the file
+    age_lock(file_path, leases.lease_timeout + 1)
+    with monkeypatch.context() as patch:
+        as_other_node(patch)
+        assert leases.claim_file(file_path) is not None
+    assert not keeper.holds(file_path)
+    keeper.release(file_path)
+    assert leases.read_lease(file_path)["host"] == "other-node"
+
+
+def test_expired_lease_counts_as_lost_before_it_is_reclaimed(tmp_path):
+    file_path = str(tmp_path / "a.wav")
+    keeper = leases.LeaseKeeper(interval=3600)
+    assert keeper.claim(file_path)
+    age_lock(file_path, leases.lease_timeout + 1)
+    assert not keeper.holds(file_path)
+
+
+def test_heartbeat_survives_errors(tmp_path, monkeypatch):
+    file_path = str(tmp_path / "a.wav")
+    calls = []
+
+    def failing_renew(file_path, lease):
+        calls.append(file_path)
+        raise OSError("stale file handle")
+
+    monkeypatch.setattr(leases, "renew_lease", failing_renew)
+    with leases.LeaseKeeper(interval=0.01) as keeper:
+        assert keeper.claim(file_path)
+        time.sleep(0.1)
+        assert keeper.thread.is_alive()
+    assert len(calls) > 1
+
+
+def simulate_node(node, files, work_seconds, timeout, crash_after):
+    # one node of the simulation, running in its own process with its own identity
+    leases.lease_host = leases.lease_node = f"node{node}"
+    leases.lease_timeout = timeout
+    with leases.LeaseKeeper(interval=timeout / 5) as keeper:
+        done = 0
+        for file_path in files:
+            if not keeper.claim(file_path):
+                continue
+            if os.path.exists(file_path + ".done"):
+                keeper.release(file_path)
+                continue
+            if done == crash_after:
+                os._exit(3)  # dies holding the lease, without releasing it
+            time.sleep(work_seconds)
+            if keeper.holds(file_path):
+                with open(file_path + ".done", "w") as f:
+                    f.write(leases.lease_host)
+                with open(os.path.join(os.path.dirname(file_path), "completions.log"), "a") as f:
+                    f.write(f"{os.path.basename(file_path)} {leases.lease_host}\n")
+                done += 1
+            keeper.release(file_path)
+
+
+@pytest.mark.parametrize("nodes, files, work_seconds", [(4, 40, 0.02), (3, 9, 0.6)])
+def test_nodes_drain_a_directory_exactly_once(tmp_path, nodes, files, work_seconds):
+    # several nodes share a directory, one crashes while holding a lease; a second pass after
+    # the lease went stale (like a rerun from cron) completes its file. With work_seconds
+    # longer than the timeout the leases only survive thanks to the heartbeat.
+    timeout = 0.5
+    paths = [str(tmp_path / f"file{i:04d}.wav") for i in range(files)]
+    for path in paths:
+        open(path, "w").close()
+
+    context = multiprocessing.get_context("spawn")
+    for crash_node in (0, None):
+        processes = []
+        for node in range(nodes):
+            crash_after = 1 if node == crash_node else -1
+            order = paths[node * files // nodes:] + paths[:node * files // nodes]
+            process = context.Process(target=simulate_node, args=(node, order, work_seconds, timeout, crash_after))
+            process.start()
+            processes.append((node, process))
+        for node, process in processes:
+            process.join()
+            assert process.exitcode == (3 if node == crash_node else 0)
+        if crash_node is not None:
+            time.sleep(timeout * 1.5)
+
+    completions = {}
+    with open(tmp_path / "completions.log") as f:
+        for line in f:
+            name, host = line.split()
+            completions.setdefault(name, []).append(host)
+    assert {name: hosts for name, hosts in completions.items() if len(hosts) > 1} == {}
+    assert sorted(completions) == [os.path.basename(path) for path in paths]
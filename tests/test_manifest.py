@@ -0,0 +1,123 @@
+import os
+import sqlite3
+
+import manifest
+from manifest import Manifest, fingerprint_file
+
+
+def make_media(tmp_path, name="a.wav", content=b"some audio"):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_states(tmp_path):
+    media = make_media(tmp_path)
+    records = Manifest(str(tmp_path))
+
+    assert records.check(media, os.stat(media), ["txt"]) == ("new", None)
+
+    records.record(media, os.stat(media), ["txt", "json"], "tiny", "en")
+    state, entry = records.check(media, os.stat(media), ["txt", "json"])
+    assert state == "complete"
+    assert (entry["model"], entry["language"], entry["formats"]) == ("tiny", "en", {"json", "txt"})
+
+    assert records.check(media, os.stat(media), ["txt", "srt"])[0] == "incomplete"
+
+    # formats recorded later add up for the same content
+    records.record(media, os.stat(media), ["srt"])
+    state, entry = records.check(media, os.stat(media), ["txt", "srt", "json"])
+    assert state == "complete" and entry["model"] == "tiny"
+
+    with open(media, "wb") as f:
+        f.write(b"other audio")
+    assert records.check(media, os.stat(media), ["txt"])[0] == "changed"
+
+    # a new content replaces what was recorded for the old one
+    records.record(media, os.stat(media), ["txt"], "base", "it")
+    state, entry = records.check(media, os.stat(media), ["txt"])
+    assert state == "complete" and entry["formats"] == {"txt"} and entry["model"] == "base"
+    records.close()
+
+
+def test_touch_only_is_still_complete(tmp_path):
+    media = make_media(tmp_path)
+    records = Manifest(str(tmp_path))
+    records.record(media, os.stat(media), ["txt"])
+    stat = os.stat(media)
+    os.utime(media, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert records.check(media, os.stat(media), ["txt"])[0] == "complete"
+    assert records.lookup(media)["mtime_ns"] == os.stat(media).st_mtime_ns
+    records.close()
+
+
+def test_same_size_different_content_is_changed(tmp_path):
+    media = make_media(tmp_path, content=b"a" * 10)
+    records = Manifest(str(tmp_path))
+    records.record(media, os.stat(media), ["txt"])
+    stat = os.stat(media)
+    with open(media, "wb") as f:
+        f.write(b"b" * 10)
+    os.utime(media, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert records.check(media, os.stat(media), ["txt"])[0] == "changed"
+    records.close()
+
+
+def test_rewrite_with_the_same_sampled_blocks_is_changed(tmp_path, monkeypatch):
+    # same size, same start, middle and end: only the whole content tells them apart
+    monkeypatch.setattr(manifest, "fingerprint_block_size", 4)
+    media = make_media(tmp_path, content=b"0000" + b"speech here." + b"0000" + b"more speech" + b"0000")
+    records = Manifest(str(tmp_path))
+    records.record(media, os.stat(media), ["txt"])
+    before = fingerprint_file(media)
+    stat = os.stat(media)
+    with open(media, "wb") as f:
+        f.write(b"0000" + b"other words." + b"0000" + b"other words" + b"0000")
+    os.utime(media, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert fingerprint_file(media) == before
+    assert records.check(media, os.stat(media), ["txt"])[0] == "changed"
+
+    # only touched: confirmed by the whole content
+    records.record(media, os.stat(media), ["txt"])
+    stat = os.stat(media)
+    os.utime(media, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert records.check(media, os.stat(media), ["txt"])[0] == "complete"
+    records.close()
+
+
+def test_manifest_without_full_hashes_is_upgraded(tmp_path):
+    connection = sqlite3.connect(os.path.join(tmp_path, manifest.manifest_name))
+    connection.execute("CREATE TABLE files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, fingerprint TEXT, "
+                       "model TEXT, language TEXT, formats TEXT, updated REAL)")
+    connection.commit()
+    connection.close()
+    media = make_media(tmp_path)
+    records = Manifest(str(tmp_path))
+    records.record(media, os.stat(media), ["txt"])
+    assert records.check(media, os.stat(media), ["txt"])[0] == "complete"
+    records.close()
+
+
+def test_sampled_fingerprint_of_large_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(manifest, "fingerprint_block_size", 4)
+    media = make_media(tmp_path, content=b"0123456789abcdefghij")
+    before = fingerprint_file(media)
+    with open(media, "r+b") as f:
+        f.seek(8)
+        f.write(b"X")  # the middle block
+    assert fingerprint_file(media) != before
+
+
+def test_records_are_visible_to_other_processes_right_away(tmp_path):
+    # two nodes sharing the manifest: no write transaction stays open between records
+    first, second = make_media(tmp_path, "a.wav"), make_media(tmp_path, "b.wav")
+    node_a, node_b = Manifest(str(tmp_path)), Manifest(str(tmp_path))
+    node_b.connection.execute("PRAGMA busy_timeout = 0")
+
+    node_a.record(first, os.stat(first), ["txt"])
+    assert node_b.check(first, os.stat(first), ["txt"])[0] == "complete"
+    node_b.record(second, os.stat(second), ["txt"])
+    assert node_a.check(second, os.stat(second), ["txt"])[0] == "complete"
+    node_a.close()
+    node_b.close()
+    assert sqlite3.connect(os.path.join(tmp_path, manifest.manifest_name)).execute("SELECT COUNT(*) FROM files").fetchone() == (2,)
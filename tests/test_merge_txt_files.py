@@ -0,0 +1,68 @@
+import os
+
+import merge_txt_files
+from merge_txt_files import merge_text_files
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_every_directory_gets_its_own_merge(tmp_path):
+    write(tmp_path / "b.txt", "seconda")
+    write(tmp_path / "a.txt", "prima")
+    write(tmp_path / "note.md", "appunti")
+    write(tmp_path / "lezioni" / "uno.txt", "lezione uno")
+    write(tmp_path / "lezioni.md", "unione della versione precedente")
+    write(tmp_path / "audio.mp3", "non è testo")
+
+    counts = merge_text_files(str(tmp_path))
+
+    assert read(tmp_path / "unione.md") == "## a\n\nprima\n\n## b\n\nseconda\n\n## note\n\nappunti\n\n"
+    assert read(tmp_path / "lezioni" / "unione.md") == "## uno\n\nlezione uno\n\n"
+    assert counts["rewritten"] == 2
+
+    # the merges are not merged again
+    merge_text_files(str(tmp_path), full=True)
+    assert read(tmp_path / "unione.md") == "## a\n\nprima\n\n## b\n\nseconda\n\n## note\n\nappunti\n\n"
+
+
+def test_merges_are_incremental(tmp_path, monkeypatch):
+    write(tmp_path / "a.txt", "prima")
+    write(tmp_path / "c.txt", "terza")
+    write(tmp_path / "sotto" / "x.txt", "altra directory")
+    merge_text_files(str(tmp_path))
+    output = tmp_path / "unione.md"
+    before = os.stat(output).st_mtime_ns
+
+    assert merge_text_files(str(tmp_path)) == {"unchanged": 2, "appended": 0, "rewritten": 0, "removed": 0}
+    assert os.stat(output).st_mtime_ns == before
+
+    # a file sorted last is appended, the others are not read again
+    opened = []
+    real_write_section = merge_txt_files.write_section
+    monkeypatch.setattr(merge_txt_files, "write_section",
+                        lambda output, directory, name: opened.append(name) or real_write_section(output, directory, name))
+    write(tmp_path / "d.txt", "quarta")
+    assert merge_text_files(str(tmp_path))["appended"] == 1
+    assert opened == ["d.txt"]
+    assert read(output) == "## a\n\nprima\n\n## c\n\nterza\n\n## d\n\nquarta\n\n"
+
+    # one in the middle rewrites the merge, copying the unchanged sections from the previous one
+    opened.clear()
+    write(tmp_path / "b.txt", "seconda")
+    write(tmp_path / "c.txt", "terza, corretta")
+    assert merge_text_files(str(tmp_path))["rewritten"] == 1
+    assert sorted(opened) == ["b.txt", "c.txt"]
+    assert read(output) == "## a\n\nprima\n\n## b\n\nseconda\n\n## c\n\nterza, corretta\n\n## d\n\nquarta\n\n"
+
+    os.remove(tmp_path / "sotto" / "x.txt")
+    assert merge_text_files(str(tmp_path))["removed"] == 1
+    assert not os.path.exists(tmp_path / "sotto" / "unione.md")
@@ -0,0 +1,70 @@
+import os
+import contextlib
+import json
+
+import pytest
+
+import metrics
+import transcribe
+
+
+def fake_result(text=" hello"):
+    return {"text": text, "language": "en",
+            "segments": [{"id": 0, "start": 0.0, "end": 2.0, "text": text,
+                          "words": [{"word": text, "start": 0.0, "end": 2.0}]}]}
+
+
+def test_stages_cost_nothing_when_off():
+    assert metrics.active is None
+    assert metrics.stage("decode") is metrics.stage("write:txt") is metrics.no_stage
+    assert metrics.profiling("a.wav") is metrics.no_stage
+
+
+def test_run_is_logged_stage_by_stage(tmp_path, monkeypatch):
+    media = tmp_path / "media"
+    media.mkdir()
+    (media / "a.wav").write_bytes(b"first")
+    (media / "b.wav").write_bytes(b"second")
+    monkeypatch.setattr(transcribe, "transcribe_file", lambda file, *args: fake_result())
+    monkeypatch.setattr(transcribe, "decoding_progress", lambda on_update: contextlib.nullcontext())
+    log = tmp_path / "run.jsonl"
+    events = []
+
+    transcribe.perform_transcription(str(media), "tiny", {}, ["txt", "srt"], "", "en", metrics_path=str(log),
+                                     profile_pattern="b.*", progress=events.append,
+                                     background_writes=False)
+
+    records = [json.loads(line) for line in log.read_text().splitlines()]
+    stages = {record["stage"] for record in records if record["event"] == "stage"}
+    assert {"discovery", "probe", "dedup", "render:txt", "render:srt", "write:txt", "write:srt"} <= stages
+    files = [record for record in records if record["event"] == "file"]
+    assert len(files) == 2 and all(record["audio_seconds"] == 2.0 and record["realtime_factor"] is not None for record in files)
+    summary = records[-1]
+    assert summary["event"] == "summary" and summary["files"] == 2 and summary["stages"]["write:txt"]["runs"] == 2
+    assert events[-1]["metrics"]["files"] == 2
+    # only the matching file was profiled, next to the log
+    assert os.path.exists(tmp_path / "profile-b.wav.prof") and not os.path.exists(tmp_path / "profile-a.wav.prof")
+    assert metrics.active is None
+
+
+def test_encoder_and_decoder_are_timed():
+    torch = pytest.importorskip("torch")
+    if not hasattr(getattr(torch, "nn", None), "Module"):
+        pytest.skip("needs the real torch")
+
+    class Model(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.encoder = torch.nn.Linear(4, 4)
+            self.decoder = torch.nn.Linear(4, 4)
+
+    model = Model()
+    metrics.instrument_model(model)
+    metrics.instrument_model(model)  # once only
+    metrics.start()
+    try:
+        model.decoder(model.encoder(torch.zeros(1, 4)))
+        model.decoder(torch.zeros(1, 4))
+    finally:
+        summary = metrics.stop()
+    assert summary["stages"]["encoder"]["runs"] == 1 and summary["stages"]["decoder"]["runs"] == 2
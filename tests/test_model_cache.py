@@ -0,0 +1,96 @@
+import sys
+import types
+
+import pytest
+
+import transcribe
+
+
+class Tensor:
+    def __init__(self, numel):
+        self.count = numel
+
+    def numel(self):
+        return self.count
+
+    def element_size(self):
+        return 4
+
+
+class Model:
+    # what the cache looks at: the size of its parameters and buffers
+    def __init__(self, name, parameters):
+        self.name = name
+        self.tensors = [Tensor(parameters)]
+
+    def parameters(self):
+        return self.tensors
+
+    def buffers(self):
+        return []
+
+    def modules(self):
+        return [self]
+
+
+@pytest.fixture
+def loaded(monkeypatch):
+    # whisper.load_model stand-in: every model is 100 bytes, the names of the loaded ones are kept
+    loads = []
+    whisper = types.ModuleType("whisper")
+    whisper.load_model = lambda name, device=None: loads.append(name) or Model(name, 25)
+    monkeypatch.setitem(sys.modules, "whisper", whisper)
+    monkeypatch.setattr(transcribe, "model_cache", transcribe.OrderedDict())
+    monkeypatch.setattr(transcribe, "model_cache_budget_bytes", None)
+    monkeypatch.setattr(transcribe, "model_cache_stats", {"loads": 0, "hits": 0, "evictions": 0, "load_time": 0.0})
+    return loads
+
+
+def test_models_are_loaded_once_and_counted(loaded):
+    first = transcribe.get_model("tiny", device="cpu")
+    assert transcribe.get_model("tiny", device="cpu") is first
+    transcribe.get_model("base", device="cpu")
+    assert loaded == ["tiny", "base"]
+    stats = transcribe.model_cache_stats
+    assert (stats["loads"], stats["hits"], stats["evictions"]) == (2, 1, 0)
+    assert list(transcribe.model_cache) == [("tiny", "cpu", "fp32"), ("base", "cpu", "fp32")]
+    assert transcribe.model_cache[("tiny", "cpu", "fp32")][1] == 100
+
+
+def test_least_recently_used_models_are_evicted(loaded):
+    transcribe.set_model_cache_budget(200)
+    transcribe.get_model("tiny", device="cpu")
+    transcribe.get_model("base", device="cpu")
+    transcribe.get_model("tiny", device="cpu")  # base is now the least recently used
+    transcribe.get_model("small", device="cpu")
+    assert [key[0] for key in transcribe.model_cache] == ["tiny", "small"]
+    assert transcribe.model_cache_stats["evictions"] == 1
+
+    transcribe.get_model("base", device="cpu")
+    assert loaded == ["tiny", "base", "small", "base"]
+    assert [key[0] for key in transcribe.model_cache] == ["small", "base"]
+
+
+def test_the_model_about_to_be_used_is_never_evicted(loaded):
+    transcribe.set_model_cache_budget(50)  # smaller than any model
+    transcribe.get_model("tiny", device="cpu")
+    assert [key[0] for key in transcribe.model_cache] == ["tiny"]
+    transcribe.get_model("base", device="cpu")
+    assert [key[0] for key in transcribe.model_cache] == ["base"]
+
+    # lowering the budget evicts right away, but not the most recently used model
+    transcribe.set_model_cache_budget(None)
+    transcribe.get_model("tiny", device="cpu")
+    transcribe.set_model_cache_budget(150)
+    assert [key[0] for key in transcribe.model_cache] == ["tiny"]
+    transcribe.set_model_cache_budget(0)
+    assert [key[0] for key in transcribe.model_cache] == ["tiny"]
+
+
+def test_invalid_precisions_are_refused_before_loading(loaded):
+    transcribe.get_model("tiny", device="cpu")
+    with pytest.raises(ValueError):
+        transcribe.get_model("tiny", device="cpu", precision="fp16")
+    with pytest.raises(ValueError):
+        transcribe.get_model("tiny", device="cpu", precision="fp64")
+    assert loaded == ["tiny"]
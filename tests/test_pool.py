@@ -0,0 +1,106 @@
+import os
+import time
+import contextlib
+
+import pytest
+
+import transcribe
+from manifest import Manifest
+
+# The pool runs in spawned processes: the stand-ins below are module level functions, pickled by
+# reference and imported again by every worker.
+
+
+def no_threads(threads):
+    pass
+
+
+def stub_worker(args):
+    file = args[0]
+    time.sleep(0.05)
+    if file == "broken":
+        raise RuntimeError("Failed to load audio")
+    model, language = args[1], args[3]
+    detection = None
+    if args[9]:  # detect: the files named after a language are in that language
+        language = os.path.basename(file).split("-")[0]
+        model = args[10] if args[10] and language == "en" else model
+        detection = (language, 0.9, 0.01, model)
+    return file, {"text": " " + file, "model": model, "language": language}, os.getpid(), \
+        {"loads": 1, "hits": 0, "evictions": 0, "load_time": 0.5}, detection
+
+
+@pytest.fixture
+def stub_pool(monkeypatch):
+    monkeypatch.setattr(transcribe, "transcribe_in_worker", stub_worker)
+    monkeypatch.setattr(transcribe, "init_transcription_worker", no_threads)
+    transcribe.close_worker_pool()
+    yield
+    transcribe.close_worker_pool()
+
+
+def test_files_are_taken_only_when_a_worker_is_free(stub_pool):
+    done = []
+
+    def files():
+        for index in range(6):
+            # the file is claimed just before it is handed to a free worker
+            assert index - len(done) < 2
+            yield f"file{index}"
+
+    results = {}
+    for file, transcription_result in transcribe.transcribe_in_pool(files(), "tiny", "", "en", 2):
+        done.append(file)
+        results[file] = transcription_result
+    assert sorted(results) == [f"file{index}" for index in range(6)]
+    assert results["file3"] == {"text": " file3", "model": "tiny", "language": "en"}
+    # the cache stats of every worker, by pid, none of them this process
+    assert 1 <= len(transcribe.worker_cache_stats) <= 2
+    assert os.getpid() not in transcribe.worker_cache_stats
+
+
+def test_pool_is_kept_between_runs(stub_pool):
+    pool = transcribe.get_worker_pool(2)
+    assert list(transcribe.transcribe_in_pool(iter(["a"]), "tiny", "", "en", 2)) == [("a", {"text": " a", "model": "tiny", "language": "en"})]
+    assert transcribe.get_worker_pool(2) is pool
+    assert transcribe.get_worker_pool(3) is not pool
+
+
+def test_pool_is_terminated_when_a_file_fails(stub_pool):
+    with pytest.raises(RuntimeError, match="Failed to load audio"):
+        list(transcribe.transcribe_in_pool(iter(["a", "broken", "b"]), "tiny", "", "en", 2))
+    assert transcribe.worker_pool is None
+
+
+def test_failed_files_are_handed_over_and_the_others_go_on(stub_pool):
+    failed = []
+    results = list(transcribe.transcribe_in_pool(iter(["a", "broken", "b"]), "tiny", "", "en", 2,
+                                                 failed=lambda file, error: failed.append((file, str(error)))))
+    assert sorted(file for file, transcription_result in results) == ["a", "b"]
+    assert failed == [("broken", "Failed to load audio")]
+    assert transcribe.worker_pool is not None
+
+
+def test_languages_are_detected_by_the_workers(stub_pool):
+    detected = []
+    routes = {"it-known": ("tiny", "it")}
+    results = dict(transcribe.transcribe_in_pool(iter(["en-talk", "it-known", "de-vortrag"]), "tiny", "", "None", 2, routes=routes,
+                                                 detected=lambda file, *detection: detected.append((file,) + detection), english_model="tiny.en"))
+    assert sorted(detected) == [("de-vortrag", "de", 0.9, 0.01, "tiny"), ("en-talk", "en", 0.9, 0.01, "tiny.en")]
+    assert results["en-talk"]["model"] == "tiny.en" and results["it-known"]["language"] == "it"
+
+
+def test_the_parent_loads_no_model_to_detect_languages(stub_pool, tmp_path, monkeypatch):
+    monkeypatch.setattr(transcribe, "get_model", lambda *args, **kwargs: 1 / 0)
+    for name in ("en-talk.wav", "de-vortrag.wav"):
+        (tmp_path / name).write_bytes(name.encode())
+    events = []
+    monkeypatch.setattr(transcribe, "decoding_progress", lambda on_update: contextlib.nullcontext())
+
+    transcribe.perform_transcription(str(tmp_path), "tiny", {}, ["json"], "", "None", workers=2, english_model="tiny.en",
+                                     search_index=False, progress=events.append)
+    manifest = Manifest(str(tmp_path))
+    assert manifest.lookup(str(tmp_path / "en-talk.wav"))["model"] == "tiny.en"
+    assert manifest.cached_language(str(tmp_path / "de-vortrag.wav"), os.stat(tmp_path / "de-vortrag.wav"))["language"] == "de"
+    manifest.close()
+    assert events[-1]["event"] == "finished"
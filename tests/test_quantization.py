@@ -0,0 +1,27 @@
+import pytest
+
+import quantization
+import transcribe
+
+
+@pytest.mark.parametrize("reference, hypothesis, rate", [
+    ("the cat sat on the mat", "The cat sat on the mat.", 0.0),
+    ("the cat sat on the mat", "the cat sat on mat", 1 / 6),
+    ("the cat sat", "a cat sat down", 2 / 3),
+    ("", "", 0.0),
+    ("", "noise", 1.0),
+])
+def test_word_error_rate(reference, hypothesis, rate):
+    assert quantization.word_error_rate(reference, hypothesis) == pytest.approx(rate)
+
+
+def test_int8_is_cpu_only():
+    with pytest.raises(ValueError):
+        transcribe.get_model("tiny", device="cuda", precision="int8")
+
+
+def test_compare_precisions_arguments(tmp_path):
+    arguments = transcribe.parse_arguments([str(tmp_path), "--compare-precisions", "int8,bf16", "--compare-files", "3"])
+    assert arguments.compared_precisions == ["int8", "bf16"]
+    with pytest.raises(SystemExit):
+        transcribe.parse_arguments([str(tmp_path), "--compare-precisions", "int4"])
@@ -0,0 +1,96 @@
+import os
+import wave
+import contextlib
+import concurrent.futures
+
+import scheduling
+import transcribe
+from manifest import Manifest
+
+
+def make_wav(path, seconds, rate=8000):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(b"\0\0" * int(seconds * rate))
+    return str(path)
+
+
+def test_wav_durations_come_from_the_header_and_are_cached(tmp_path, monkeypatch):
+    media = make_wav(tmp_path / "a.wav", 2.5)
+    records = Manifest(str(tmp_path))
+    assert scheduling.probe_durations([media], records) == {media: 2.5}
+
+    monkeypatch.setattr(scheduling, "probe_duration", lambda file: 99.0)
+    assert scheduling.probe_durations([media], records) == {media: 2.5}
+    make_wav(tmp_path / "a.wav", 4)
+    os.utime(media, ns=(1, 1))
+    assert scheduling.probe_durations([media], records) == {media: 99.0}
+    records.close()
+
+
+def test_unreadable_media_has_no_duration(tmp_path):
+    media = tmp_path / "broken.mp3"
+    media.write_bytes(b"not audio")
+    assert scheduling.probe_duration(str(media)) is None
+
+
+def test_policies():
+    durations = {"/r/a": 30.0, "/r/b": 5.0, "/r/c": None, "/r/d": 600.0}
+    files = list(durations)
+    assert scheduling.schedule(files, "walk", durations) == files
+    assert scheduling.schedule(files, "shortest", durations) == ["/r/b", "/r/a", "/r/d", "/r/c"]
+    assert scheduling.schedule(files, "longest", durations) == ["/r/d", "/r/a", "/r/b", "/r/c"]
+
+
+def test_priority_by_subdirectory():
+    root = os.path.join(os.sep, "r")
+    files = [os.path.join(root, *parts) for parts in [("a.wav",), ("urgent", "b.wav"), ("clients", "x", "long.wav"),
+                                                      ("clients", "x", "c.wav"), ("urgent", "deep", "d.wav")]]
+    durations = dict(zip(files, [1.0, 50.0, 100.0, 10.0, 20.0]))
+    ordered = scheduling.schedule(files, "priority", durations, root, ["urgent", "clients/*"])
+    assert [os.path.relpath(file, root).replace(os.sep, "/") for file in ordered] == [
+        "urgent/deep/d.wav", "urgent/b.wav", "clients/x/c.wav", "clients/x/long.wav", "a.wav"]
+
+
+def test_estimate_from_measured_realtime_factors(tmp_path):
+    path = str(tmp_path / "factors.json")
+    assert scheduling.estimate([3600.0, None], "small", "int8", path=path) == (3600.0, None)
+    scheduling.record_realtime_factor("small", "int8", 10.0, 100.0, path=path)  # too short to learn from
+    scheduling.record_realtime_factor("small", "int8", 1000.0, 500.0, path=path)
+    scheduling.record_realtime_factor("small", "int8", 1000.0, 300.0, path=path)
+    assert scheduling.realtime_factor("small", "int8", path=path) == 0.4
+    assert scheduling.estimate([3600.0, None], "small", "int8", workers=2, path=path) == (3600.0, 720.0)
+
+
+
+def test_concurrent_runs_keep_every_measurement(tmp_path):
+    path = str(tmp_path / "factors.json")
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda run: scheduling.record_realtime_factor("tiny", "fp32", 100.0, 10.0, path=path), range(40)))
+    assert scheduling.load_realtime_factors(path)["tiny/fp32"]["audio_seconds"] == 4000.0
+    assert os.listdir(tmp_path) == ["factors.json"]
+
+    # a lock left by a process that died is broken
+    with open(path + ".lock", "w"):
+        pass
+    os.utime(path + ".lock", (0, 0))
+    scheduling.record_realtime_factor("tiny", "fp32", 100.0, 10.0, path=path)
+    assert scheduling.realtime_factor("tiny", "fp32", path=path) == 0.1
+
+def test_shortest_files_are_transcribed_first(tmp_path, monkeypatch):
+    monkeypatch.setattr(scheduling, "realtime_factors_path", str(tmp_path / "factors.json"))
+    media = tmp_path / "media"
+    long, short, medium = make_wav(media / "long.wav", 3), make_wav(media / "sub" / "short.wav", 1), make_wav(media / "medium.wav", 2)
+    transcribed = []
+    monkeypatch.setattr(transcribe, "transcribe_file", lambda file, *args: transcribed.append(file) or
+                        {"text": " hi", "language": "en", "segments": [{"id": 0, "start": 0.0, "end": 1.0, "text": " hi"}]})
+    monkeypatch.setattr(transcribe, "decoding_progress", lambda on_update: contextlib.nullcontext())
+    events = []
+
+    transcribe.perform_transcription(str(media), "tiny", {}, ["txt"], "", "en", schedule_policy="shortest", progress=events.append)
+
+    assert transcribed == [short, medium, long]
+    assert events[0] == {"event": "estimate", "files": 3, "audio_seconds": 6.0, "eta": None}
@@ -0,0 +1,97 @@
+import os
+import json
+import time
+
+import pytest
+
+import search
+import transcribe
+from search import SearchIndex
+
+
+def result(*texts, language="en"):
+    segments = [{"id": index, "start": index * 2.5, "end": index * 2.5 + 2.0, "text": " " + text}
+                for index, text in enumerate(texts)]
+    return {"text": "".join(segment["text"] for segment in segments), "segments": segments, "language": language}
+
+
+def write_json(path, transcription_result):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(transcription_result, f)
+    return str(path)
+
+
+def test_matching_segments_come_with_their_times(tmp_path):
+    write_json(tmp_path / "a.json", result("welcome to the course", "today we talk about entropy"))
+    write_json(tmp_path / "sub" / "b.json", result("la entropia è alta", language="it"))
+    (tmp_path / "sub" / "b.mp3").write_bytes(b"audio")
+    index = SearchIndex(str(tmp_path))
+    assert index.update() == (2, 0)
+
+    matches = index.search("entropy")
+    assert [(match["start_ms"], match["end_ms"], match["text"]) for match in matches] == [(2500, 4500, "today we talk about entropy")]
+    assert matches[0]["file"] == os.path.join(str(tmp_path), "a.json")  # no media next to it
+
+    # diacritics and case are ignored, punctuation in the query is not FTS5 syntax
+    italian = index.search("ENTROPIA e", language="it")
+    assert [match["file"] for match in italian] == [os.path.join(str(tmp_path), "sub", "b.mp3")]
+    assert index.search("entropia", language="en") == []
+    assert index.search("talk about", phrase=True) and not index.search("about talk", phrase=True)
+    assert index.search('"unbalanced (quote') == []
+    index.close()
+
+
+def test_update_reads_only_what_changed(tmp_path, monkeypatch):
+    first = write_json(tmp_path / "a.json", result("first version"))
+    write_json(tmp_path / "b.json", result("untouched"))
+    write_json(tmp_path / "old.json", [{"id": 0, "start": 0.0, "end": 1.0, "text": "first format"}])
+    index = SearchIndex(str(tmp_path))
+    index.update()
+
+    added = []
+    real_add = SearchIndex.add
+    monkeypatch.setattr(SearchIndex, "add", lambda self, path, *args, **kwargs: added.append(os.path.basename(path)) or real_add(self, path, *args, **kwargs))
+    assert index.update() == (0, 0)
+    assert added == []
+
+    write_json(tmp_path / "a.json", result("second version"))
+    os.utime(first, ns=(time.time_ns(), time.time_ns() + 10**9))
+    os.remove(tmp_path / "b.json")
+    index.update()
+    assert added == ["a.json"]
+    assert index.search("first") == [] and index.search("second")
+    assert index.search("untouched") == []
+    # the old segments of a.json are gone from the full-text index too
+    assert index.connection.execute("SELECT COUNT(*) FROM segments_text WHERE segments_text MATCH 'version'").fetchone()[0] == 1
+    index.close()
+
+
+def test_transcribed_files_are_indexed(tmp_path, monkeypatch):
+    media = tmp_path / "lecture.mp3"
+    media.write_bytes(b"audio")
+    monkeypatch.setattr(transcribe, "transcribe_file", lambda file, *args: result("the mitochondria is the powerhouse"))
+
+    transcribe.perform_transcription(str(tmp_path), "tiny", {}, ["txt", "json"], "", "en", background_writes=False)
+
+    index = SearchIndex(str(tmp_path))
+    assert [(match["file"], match["start_ms"]) for match in index.search("powerhouse")] == [(str(media), 0)]
+    index.close()
+
+
+def test_query_command(tmp_path, capsys):
+    write_json(tmp_path / "talk.json", result("nothing here", "a long silence", "then applause"))
+    matches = search.main([str(tmp_path), "applause", "--update"])
+    assert [match["start_ms"] for match in matches] == [5000]
+    assert "00:00:05.000 --> 00:00:07.000] then applause" in capsys.readouterr().out
+
+
+def test_empty_query_is_refused(tmp_path, capsys):
+    write_json(tmp_path / "talk.json", result("something"))
+    with pytest.raises(SystemExit):
+        search.main([str(tmp_path), "  ", "--update"])
+    assert "the query is empty" in capsys.readouterr().err
+    index = SearchIndex(str(tmp_path))
+    with pytest.raises(ValueError):
+        index.search("", phrase=True)
+    index.close()
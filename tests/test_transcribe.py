@@ -0,0 +1,133 @@
+import os
+import time
+import threading
+
+import pytest
+
+import leases
+import transcribe
+
+
+def fake_result(text=" hello"):
+    return {"text": text, "language": "en",
+            "segments": [{"id": 0, "start": 0.0, "end": 2.0, "text": text,
+                          "words": [{"word": text, "start": 0.0, "end": 2.0}]}]}
+
+
+def make_media(directory, *names):
+    paths = []
+    for name in names:
+        path = directory / name
+        path.write_bytes(b"not really audio " + name.encode())
+        paths.append(str(path))
+    return paths
+
+
+def test_file_leased_by_another_node_is_skipped(tmp_path, monkeypatch):
+    free, taken = make_media(tmp_path, "free.wav", "taken.wav")
+    with monkeypatch.context() as patch:
+        patch.setattr(leases, "lease_host", "other-node")
+        patch.setattr(leases, "lease_node", "other-node")
+        assert leases.claim_file(taken) is not None
+    transcribed = []
+    monkeypatch.setattr(transcribe, "transcribe_file", lambda file, *args: transcribed.append(file) or fake_result())
+
+    transcribe.perform_transcription(str(tmp_path), "tiny", {}, ["txt", "json"], "", "en", use_manifest=False)
+
+    assert transcribed == [free]
+    assert os.path.exists(tmp_path / "free.txt") and os.path.exists(tmp_path / "free.json")
+    assert not os.path.exists(tmp_path / "taken.txt")
+    assert not os.path.exists(leases.lock_path(free))
+    assert leases.read_lease(taken)["host"] == "other-node"
+
+
+def test_results_are_not_written_after_the_lease_was_reclaimed(tmp_path, monkeypatch):
+    media, = make_media(tmp_path, "slow.wav")
+
+    def stalled_transcription(file, *args):
+        # this process stalls past the timeout and another node takes the file over
+        old = time.time() - leases.lease_timeout - 1
+        os.utime(leases.lock_path(file), (old, old))
+        with monkeypatch.context() as patch:
+            patch.setattr(leases, "lease_host", "other-node")
+            patch.setattr(leases, "lease_node", "other-node")
+            assert leases.claim_file(file) is not None
+        return fake_result()
+
+    monkeypatch.setattr(transcribe, "transcribe_file", stalled_transcription)
+
+    transcribe.perform_transcription(str(tmp_path), "tiny", {}, ["txt", "json"], "", "en", use_manifest=False)
+
+    assert not os.path.exists(tmp_path / "slow.txt")
+    assert not os.path.exists(tmp_path / "slow.json")
+    assert leases.read_lease(media)["host"] == "other-node"
+
+
+def test_manifest_skips_done_files_and_redoes_changed_ones(tmp_path, monkeypatch):
+    media, = make_media(tmp_path, "a.wav")
+    transcribed = []
+    monkeypatch.setattr(transcribe, "transcribe_file", lambda file, *args: transcribed.append(file) or fake_result())
+
+    transcribe.perform_transcription(str(tmp_path), "tiny", {}, ["txt", "json"], "", "en")
+    transcribe.perform_transcription(str(tmp_path), "tiny", {}, ["txt", "json"], "", "en")
+    assert transcribed == [media]
+
+    with open(media, "wb") as f:
+        f.write(b"a different recording")
+    transcribe.perform_transcription(str(tmp_path), "tiny", {}, ["txt", "json"], "", "en")
+    assert transcribed == [media, media]
+    assert os.path.exists(tmp_path / "a.json.stale") and os.path.exists(tmp_path / "a.json")
+
+
+def decoding_transcription(file, *args):
+    # decodes three 30 second windows, reporting them to whisper's progress bar like model.transcribe
+    import whisper.transcribe
+    with whisper.transcribe.tqdm.tqdm(total=9000, unit="frames") as pbar:
+        for _ in range(3):
+            pbar.update(3000)
+    return fake_result()
+
+
+def test_progress_events_and_cancel_after_the_current_window(tmp_path, monkeypatch):
+    pytest.importorskip("whisper")
+    make_media(tmp_path, "a.wav", "b.wav")
+    monkeypatch.setattr(transcribe, "transcribe_file", decoding_transcription)
+    control = transcribe.TranscriptionControl()
+    events = []
+
+    def progress(event):
+        events.append(event)
+        if event["event"] == "audio" and len([event for event in events if event["event"] == "done"]) == 1:
+            control.cancel()
+
+    transcribe.perform_transcription(str(tmp_path), "tiny", {}, ["txt"], "", "en", use_manifest=False,
+                                     progress=progress, control=control)
+
+    assert [event["percent"] for event in events if event["event"] == "audio"] == [100 / 3, 200 / 3, 100.0, 100 / 3]
+    first, second = [event["file"] for event in events if event["event"] == "file"]
+    assert [event["file"] for event in events if event["event"] == "done"] == [first]
+    assert events[-1]["event"] == "cancelled" and events[-1]["audio_seconds"] == 2.0
+    assert os.path.exists(os.path.splitext(first)[0] + ".txt") and not os.path.exists(os.path.splitext(second)[0] + ".txt")
+    assert not os.path.exists(leases.lock_path(second))
+
+
+def test_paused_transcription_waits_for_resume(tmp_path, monkeypatch):
+    pytest.importorskip("whisper")
+    make_media(tmp_path, "a.wav")
+    monkeypatch.setattr(transcribe, "transcribe_file", decoding_transcription)
+    control = transcribe.TranscriptionControl()
+    events = []
+
+    def progress(event):
+        events.append(event)
+        if event["event"] == "audio" and event["percent"] < 50:
+            control.pause()
+            threading.Timer(0.2, control.resume).start()
+
+    start = time.perf_counter()
+    transcribe.perform_transcription(str(tmp_path), "tiny", {}, ["txt"], "", "en", use_manifest=False,
+                                     progress=progress, control=control)
+
+    assert time.perf_counter() - start >= 0.2
+    assert events[-1]["event"] == "finished"
+    assert os.path.exists(tmp_path / "a.txt")
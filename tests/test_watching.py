@@ -0,0 +1,122 @@
+import os
+import time
+import wave
+import contextlib
+import threading
+
+import transcribe
+import watching
+from watching import DirectoryScanner, Watcher
+
+
+def make_wav(path, seconds=0.5, rate=8000):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(b"\1\0" * int(seconds * rate))
+    return str(path)
+
+
+def take(iterator, count, timeout=10):
+    # the first count items of iterator, read on a thread not to hang the tests
+    items = []
+
+    def read():
+        for item in iterator:
+            items.append(item)
+            if len(items) == count:
+                return
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    reader.join(timeout)
+    return items
+
+
+def test_scanner_lists_only_changed_directories(tmp_path):
+    first = make_wav(tmp_path / "a.wav")
+    scanner = DirectoryScanner(str(tmp_path))
+    assert scanner.scan() == [first]
+    assert scanner.scan() == []
+
+    second = make_wav(tmp_path / "sub" / "b.wav")
+    (tmp_path / "sub" / "notes.txt").write_text("not media")
+    assert scanner.scan() == [second]
+
+    # rewritten in place: its directory does not change, only a full scan sees it
+    directory_mtime = os.stat(tmp_path).st_mtime_ns
+    make_wav(tmp_path / "a.wav", seconds=1)
+    os.utime(tmp_path, ns=(directory_mtime, directory_mtime))
+    assert scanner.scan() == []
+    assert scanner.scan(full=True) == [first]
+
+
+def test_files_are_handed_over_once_their_writes_are_over(tmp_path):
+    watcher = Watcher(str(tmp_path), polling=True, stability=0.5, interval=0.05).start()
+    try:
+        path = tmp_path / "upload.wav"
+        with open(path, "wb") as f:
+            for _ in range(10):
+                f.write(b"\0" * 1000)
+                f.flush()
+                time.sleep(0.1)
+        written = time.monotonic()
+        assert take(watcher, 1) == [str(path)]
+        assert time.monotonic() - written >= 0.3  # not before it stopped changing
+        assert take(watcher, 1, timeout=1) == []  # once
+    finally:
+        watcher.stop()
+
+
+def test_bursts_wait_behind_the_bounded_queue(tmp_path):
+    for index in range(12):
+        make_wav(tmp_path / f"{index:02d}.wav")
+    watcher = Watcher(str(tmp_path), maxsize=3, polling=True, stability=0.1, interval=0.05).start()
+    try:
+        time.sleep(0.5)
+        assert watcher.queue.qsize() == 3
+        assert watcher.pending() == 12
+        files = take(watcher, 12)
+        assert sorted(files) == sorted(str(tmp_path / f"{index:02d}.wav") for index in range(12))
+    finally:
+        watcher.stop()
+
+
+def test_watch_mode_transcribes_new_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(transcribe, "transcribe_file", lambda file, *args: {
+        "text": " hi", "language": "en", "segments": [{"id": 0, "start": 0.0, "end": 1.0, "text": " hi"}]})
+    make_wav(tmp_path / "old.wav")
+    watcher = Watcher(str(tmp_path), polling=True, stability=0.1, interval=0.05).start()
+    run = threading.Thread(target=transcribe.perform_transcription, daemon=True,
+                           args=(str(tmp_path), "tiny", {}, ["txt"], "", "en"), kwargs=dict(files=watcher, background_writes=False))
+    run.start()
+    try:
+        make_wav(tmp_path / "new" / "fresh.wav")
+        deadline = time.monotonic() + 10
+        while not (os.path.exists(tmp_path / "new" / "fresh.txt") and os.path.exists(tmp_path / "old.txt")):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+    finally:
+        watcher.stop()
+        run.join(10)
+    assert not run.is_alive()
+
+
+def test_watch_mode_goes_on_after_a_failed_or_vanished_file(tmp_path, monkeypatch):
+    def transcribe_file(file, *args):
+        if "broken" in file:
+            raise RuntimeError("Failed to load audio")
+        return {"text": " hi", "language": "en", "segments": [{"id": 0, "start": 0.0, "end": 1.0, "text": " hi"}]}
+    monkeypatch.setattr(transcribe, "transcribe_file", transcribe_file)
+    monkeypatch.setattr(transcribe, "decoding_progress", lambda on_update: contextlib.nullcontext())
+    queued = [make_wav(tmp_path / name, seconds) for name, seconds in (("broken.wav", 0.5), ("deleted.wav", 1.0), ("fine.wav", 1.5))]
+    os.remove(queued[1])  # deleted while it was waiting in the queue
+    events = []
+
+    transcribe.perform_transcription(str(tmp_path), "tiny", {}, ["txt"], "", "en", files=iter(queued), background_writes=False,
+                                     keep_going=True, progress=events.append)
+    assert os.path.exists(tmp_path / "fine.txt") and not os.path.exists(tmp_path / "broken.txt")
+    assert [(event["file"], event["error"]) for event in events if event["event"] == "failed"] == [(queued[0], "Failed to load audio")]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".lock")]
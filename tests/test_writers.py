@@ -0,0 +1,86 @@
+import os
+import random
+
+import pytest
+
+import writers
+
+
+def synthetic_result(segments=40, words_per_segment=12, seed=0):
+    generator = random.Random(seed)
+    vocabulary = ["hello", "world", "ciao", "tab\there", "arrow-->", "très", "un", "mot", "ok,", "yes."]
+    result_segments = []
+    position = 0.0
+    for index in range(segments):
+        words = []
+        for _ in range(words_per_segment):
+            start = position + generator.choice([0.0, 0.05, 0.2, 3.5])
+            end = start + generator.uniform(0.1, 0.6)
+            words.append({"word": " " + generator.choice(vocabulary), "start": round(start, 2), "end": round(end, 2)})
+            position = end
+        text = "".join(word["word"] for word in words)
+        result_segments.append({"id": index, "start": words[0]["start"], "end": words[-1]["end"], "text": text, "words": words})
+    return {"text": "".join(segment["text"] for segment in result_segments), "segments": result_segments, "language": "en"}
+
+
+option_sets = [
+    {},
+    {"max_words_per_line": 5, "highlight_words": False, "max_line_count": 1},
+    {"max_line_width": 20, "max_line_count": 2},
+    {"max_line_width": 30, "max_line_count": 1, "highlight_words": True},
+]
+
+
+@pytest.mark.parametrize("options", option_sets)
+@pytest.mark.parametrize("with_words", [True, False])
+def test_outputs_match_the_whisper_writers(tmp_path, options, with_words):
+    utils = pytest.importorskip("whisper.utils")
+    result = synthetic_result()
+    if not with_words:
+        for segment in result["segments"]:
+            del segment["words"]
+    ours, theirs = tmp_path / "ours", tmp_path / "theirs"
+    ours.mkdir()
+    theirs.mkdir()
+    audio = str(tmp_path / "talk.mp3")
+
+    writers.write_outputs(audio, result, {fmt: options for fmt in writers.output_formats}, writers.output_formats, str(ours))
+    for fmt in writers.output_formats:
+        utils.get_writer(fmt, str(theirs))(result, audio, options)
+
+    for fmt in writers.output_formats:
+        assert (ours / f"talk.{fmt}").read_bytes() == (theirs / f"talk.{fmt}").read_bytes(), fmt
+
+
+def test_existing_outputs_are_kept_and_nothing_is_left_behind(tmp_path):
+    audio = str(tmp_path / "talk.wav")
+    (tmp_path / "talk.txt").write_text("edited by hand\n")
+    (tmp_path / "talk.srt").write_text("")
+
+    written = writers.write_outputs(audio, synthetic_result(), {}, ["txt", "srt"])
+
+    assert written == [str(tmp_path / "talk.srt")]
+    assert (tmp_path / "talk.txt").read_text() == "edited by hand\n"
+    assert (tmp_path / "talk.srt").read_text().startswith("1\n00:00:03,500 --> ")
+    assert sorted(os.listdir(tmp_path)) == ["talk.srt", "talk.txt"]
+
+
+def test_failed_write_keeps_the_previous_file(tmp_path, monkeypatch):
+    path = tmp_path / "talk.txt"
+    path.write_text("old\n")
+
+    def broken_fsync(descriptor):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "fsync", broken_fsync)
+    with pytest.raises(OSError):
+        writers.atomic_write(str(path), "new\n")
+    assert path.read_text() == "old\n"
+    assert os.listdir(tmp_path) == ["talk.txt"]
+
+
+def test_background_writer_returns_the_written_paths(tmp_path):
+    audio = str(tmp_path / "talk.wav")
+    with writers.OutputWriter() as output_writer:
+        written = output_writer.submit(audio, synthetic_result(), {}, ["txt", "json"])
+    assert written.result() == [str(tmp_path / "talk.txt"), str(tmp_path / "talk.json")]
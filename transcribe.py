@@ -1,11 +1,29 @@
 import os
-import tkinter as tk
-from tkinter import filedialog, ttk
-from whisper import load_model, transcribe, available_models
-from whisper.utils import get_writer
 import time
 import json
-from langdetect import detect  
+import atexit
+import argparse
+import multiprocessing
+import queue
+import types
+import threading
+import contextlib
+from collections import OrderedDict
+from leases import LeaseKeeper, read_lease, describe_lease
+from manifest import Manifest
+from discovery import transcribable_extensions, list_transcribable_files, Discovery
+from writers import write_outputs, OutputWriter
+from quantization import inference_context
+from scheduling import schedule_policies, schedule, probe_durations, estimate, record_realtime_factor
+from dedup import Deduplicator
+from journal import Journal, remove_journal, window_context
+from search import SearchIndex
+from languages import LanguageResolver, detect_file_language
+import metrics
+
+# whisper, torch, numpy, langdetect and tkinter are slow to import: they are imported
+# where they are used, so that the command line (and --help) starts right away and
+# the module can be used without a display
 
 output_formats = ['txt', 'srt', 'vtt', 'tsv', 'json']
 
@@ -118,9 +136,6 @@ def invert_dict(d):
 
 LANGUAGES_CODES = invert_dict(LANGUAGES)
 
-
-# Define a list of transcribable file extensions
-transcribable_extensions = ['.mp3', '.wav', '.m4a', '.mp4', '.mkv', '.avi']
 whisper_models = {
     "tiny": "Fastest model, minimal hardware requirements, suitable for quick tasks.",
     "small": "Mid-sized model, improved accuracy for complex audio, requires moderate hardware.",
@@ -147,350 +162,1127 @@ def is_new_json_format(data):
     return True
 
 def infer_language_from_text(text):
+    from langdetect import detect
     return detect(text)
 
-def is_file_locked(file_path):
-    lock_file = file_path + ".lock"
-
-    # Check if the lock file exists
-    if os.path.exists(lock_file):
-        # Check the age of the lock file
-        lock_age = time.time() - os.path.getmtime(lock_file)
-        if lock_age > 7200:  # 2 hours in seconds
-            os.remove(lock_file)  # Remove stale lock
-            return False  # File was locked, but lock was stale
+# Process-wide registry of loaded models, keyed by (model name, device, precision).
+# Models are loaded lazily the first time they are needed and kept for the whole run,
+# so every perform_transcription started from the same session reuses them.
+# When different models are used the least recently used ones are evicted to stay
+# within the budget set with set_model_cache_budget (None means no limit).
+model_cache = OrderedDict()
+model_cache_budget_bytes = None
+model_cache_stats = {"loads": 0, "hits": 0, "evictions": 0, "load_time": 0.0}
+
+# fp32: full precision weights, fp16: half precision weights (GPU only),
+# bf16: bfloat16 matrix products where the hardware supports them,
+# int8: int8 quantized linear layers (CPU only); see quantization.py
+precisions = ["fp32", "fp16", "bf16", "int8"]
+
+def default_device():
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+def model_size_bytes(model):
+    # parameters and buffers, i.e. what the model keeps resident in memory
+    tensors = list(model.parameters()) + list(model.buffers())
+    # the int8 layers keep their packed weights outside the parameters
+    tensors += [module.weight() for module in model.modules() if hasattr(module, "_packed_params")]
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+def evict_models(budget_bytes, keep=None):
+    # drop least recently used models until the cache fits in the budget
+    if budget_bytes is None:
+        return
+    while model_cache:
+        cached_size = sum(size for _, size in model_cache.values())
+        if cached_size <= budget_bytes:
+            break
+        oldest_key = next(iter(model_cache))
+        if oldest_key == keep:
+            break  # never evict the model that is about to be used
+        del model_cache[oldest_key]
+        model_cache_stats["evictions"] += 1
+        print(f"Evicted model {oldest_key[0]} ({oldest_key[1]}, {oldest_key[2]}) from the cache")
+
+def set_model_cache_budget(budget_bytes):
+    # None means no limit; lowering the budget evicts right away
+    global model_cache_budget_bytes
+    model_cache_budget_bytes = budget_bytes
+    evict_models(budget_bytes, keep=next(reversed(model_cache), None))
+
+def get_model(model_name, device=None, precision="fp32"):
+    if device is None:
+        device = "cpu" if precision == "int8" else default_device()
+    if precision not in precisions:
+        raise ValueError(f"Unknown precision {precision}, expected one of {precisions}")
+    if precision == "fp16" and device == "cpu":
+        raise ValueError("fp16 needs a GPU, use fp32 on the CPU")
+    if precision == "int8" and device != "cpu":
+        raise ValueError("int8 runs on the CPU only")
+    if precision == "bf16":
+        from quantization import bf16_supported
+        if not bf16_supported(device):
+            raise ValueError(f"bf16 is not supported on this {device}, use fp32")
+    key = (model_name, device, precision)
+    if key in model_cache:
+        model_cache.move_to_end(key)
+        model_cache_stats["hits"] += 1
+        if metrics.active is not None:
+            metrics.instrument_model(model_cache[key][0])
+        return model_cache[key][0]
+
+    start = time.perf_counter()
+    with metrics.stage("model_load"):
+        if precision == "int8":
+            from quantization import load_quantized_model
+            model = load_quantized_model(model_name)
         else:
-            return True  # File is actively locked
-    return False  # No lock exists
-
-def unlock_file(file_path):
-    lock_file = file_path + ".lock"
-    try:
-        os.remove(lock_file)  # Remove the lock file
-    except FileNotFoundError:
-        pass
-
-def choose_directory():
-    # Initialize the Tkinter root element
-    desktop_path = os.path.join(os.path.expanduser('~'), 'Desktop')
-    root = tk.Tk()
-    root.withdraw()  # Hide the main window
-    # Open a dialog window for choosing a directory
-    directory_path = filedialog.askdirectory(initialdir=desktop_path)
-    return directory_path
-
-def transcribe_file(file_path, model_name,prompt_to_send="",selected_language_code="None"):
-    model = load_model(model_name)  # Using the base model for demonstration; adjust as needed
-    result = model.transcribe(file_path, verbose=True, word_timestamps=True,fp16=False, task="transcribe", initial_prompt=prompt_to_send,language=selected_language_code)
-    return result
+            from whisper import load_model
+            model = load_model(model_name, device=device)
+        if precision == "fp16":
+            model = model.half()
+    model_cache_stats["load_time"] += time.perf_counter() - start
+    model_cache_stats["loads"] += 1
+
+    model_cache[key] = (model, model_size_bytes(model))
+    evict_models(model_cache_budget_bytes, keep=key)
+    if metrics.active is not None:
+        metrics.instrument_model(model)
+    return model
+
+def clear_model_cache():
+    model_cache.clear()
+
+def print_model_cache_stats():
+    stats = model_cache_stats
+    if stats["loads"] or stats["hits"]:
+        print(f"Model cache: {stats['loads']} loads ({stats['load_time']:.1f}s), {stats['hits']} hits, {stats['evictions']} evictions")
+    if worker_cache_stats:
+        totals = {name: sum(worker[name] for worker in worker_cache_stats.values()) for name in stats}
+        print(f"Model cache of {len(worker_cache_stats)} worker processes (since they started): "
+              f"{totals['loads']} loads ({totals['load_time']:.1f}s), {totals['hits']} hits, {totals['evictions']} evictions")
+
+def read_audio(file_path, audio_cache=False):
+    # decoded 16 kHz audio, from the on-disk cache if it is enabled
+    with metrics.stage("decode", file_path):
+        if audio_cache:
+            from audio import load_audio_cached
+            return load_audio_cached(file_path)
+        from whisper import load_audio
+        return load_audio(file_path)
+
+def whisper_options(prompt_to_send="", precision="fp32"):
+    # the options of every model.transcribe call
+    return dict(verbose=True, word_timestamps=True,fp16=precision == "fp16", task="transcribe", initial_prompt=prompt_to_send)
+
+def transcribe_file(file_path, model_name,prompt_to_send="",selected_language_code="None",precision="fp32",vad=False,audio_cache=False,checkpoint=False):
+    # checkpoint transcribes long files window by window, keeping a journal to resume from (see journal.py)
+    model = get_model(model_name, precision=precision)
+    # "None" is how the UI says "find out automatically"
+    language = None if selected_language_code == "None" else selected_language_code
+    transcribe_options = whisper_options(prompt_to_send, precision)
+    audio = None
+    if checkpoint:
+        from audio import split_into_windows
+        audio = read_audio(file_path, audio_cache)
+        windows, cuts = split_into_windows(audio)
+        if len(windows) > 1:
+            settings = dict(model=model_name, precision=precision, language=selected_language_code,
+                            prompt=prompt_to_send, vad=vad, windows=windows, conditioned=True)
+            return transcribe_windows_with_journal(file_path, model, audio, windows, cuts, settings)
+    with inference_context(precision, model.device):
+        if not vad:
+            # decoded here rather than inside model.transcribe when its time is measured
+            if audio is None:
+                audio = read_audio(file_path, audio_cache) if audio_cache or metrics.active is not None else file_path
+            return model.transcribe(audio, language=language, **transcribe_options)
+
+        return transcribe_audio_without_silence(model, audio if audio is not None else read_audio(file_path, audio_cache), language, transcribe_options)
+
+def transcribe_windows_with_journal(file_path, model, audio, windows, cuts, settings):
+    # Transcribes the windows one after the other, each conditioned on the text of the previous
+    # one, skipping the windows found in the journal of an interrupted run
+    from audio import SAMPLE_RATE, HOP_LENGTH, stitch_results
+    language = None if settings["language"] == "None" else settings["language"]
+    with Journal(file_path, settings) as journal:
+        if journal.windows:
+            print(f"Resuming {file_path}: {len(journal.windows)} of {len(windows)} windows were transcribed by an earlier run")
+        for index, (start, end) in enumerate(windows):
+            if index in journal.windows:
+                continue
+            context = journal.windows[index - 1][1] if index else ""
+            # without a language chosen, the one detected in the first window is used
+            window_language = language or (journal.windows[0][0].get("language") if 0 in journal.windows else None)
+            transcribe_options = whisper_options(" ".join(filter(None, [settings["prompt"], context])), settings["precision"])
+            print(f"Window {index + 1} of {len(windows)} ({start / SAMPLE_RATE / 60:.0f} to {end / SAMPLE_RATE / 60:.0f} minutes)")
+            with inference_context(settings["precision"], model.device), \
+                    decoding_part(start // HOP_LENGTH, end // HOP_LENGTH - start // HOP_LENGTH, len(audio) // HOP_LENGTH):
+                if settings["vad"]:
+                    transcription_result = transcribe_audio_without_silence(model, audio[start:end], window_language, transcribe_options)
+                else:
+                    transcription_result = model.transcribe(audio[start:end], language=window_language, **transcribe_options)
+            journal.append(index, transcription_result, window_context(transcription_result))
+        parts = [(start / SAMPLE_RATE, journal.windows[index][0]) for index, (start, end) in enumerate(windows)]
+    return stitch_results(parts, cuts, language)
+
+def transcribe_audio_without_silence(model, audio, language, transcribe_options):
+    # only the regions with speech are sent to whisper: faster, and no text hallucinated in the silence
+    from audio import SAMPLE_RATE, detect_speech_regions, speech_fraction, transcribe_speech_regions
+    regions = detect_speech_regions(audio)
+    if not regions:
+        # rather than an empty transcription that would leave the file without outputs
+        print(f"Voice activity: no speech regions found in {len(audio) / SAMPLE_RATE:.0f}s of audio, transcribing all of it")
+        return model.transcribe(audio, language=language, **transcribe_options)
+    fraction = speech_fraction(regions, len(audio))
+    print(f"Voice activity: {len(regions)} speech regions, skipping {1 - fraction:.0%} of {len(audio) / SAMPLE_RATE:.0f}s of audio")
+    return transcribe_speech_regions(model, audio, regions, language, **transcribe_options)
 
 def write_srt(file,transcription_result,file_directory="",options={}):
-    if not file_directory:
-        file_directory=os.path.dirname(file)
-    #checking if file already exists and in case skipping it
-    srt_file = os.path.splitext(file)[0] + ".srt"
-    if os.path.exists(srt_file) and os.path.getsize(srt_file) > 0:
-        print(f"Skipping {srt_file} because it already exists and is not empty")
-        return
-    writer_srt = get_writer("srt", file_directory) # get srt writer for the current directory
-    writer_srt(transcription_result, file, options) # add empty dictionary for 'options'
+    write_outputs(file, transcription_result, {"srt": options}, ["srt"], file_directory)
 
 def write_txt(file,transcription_result,file_directory="",options={}):
-    if not file_directory:
-        file_directory=os.path.dirname(file)
-    #checking if file already exists and in case skipping it
-    text_file = os.path.splitext(file)[0] + ".txt"
-    if os.path.exists(text_file) and os.path.getsize(text_file) > 0:
-        print(f"Skipping {text_file} because it already exists and is not empty")
-        return
-    writer_txt = get_writer("txt", file_directory) # get srt writer for the current directory
-    writer_txt(transcription_result, file, options) # add empty dictionary for 'options'
+    write_outputs(file, transcription_result, {"txt": options}, ["txt"], file_directory)
 
 def write_vtt(file,transcription_result,file_directory="",options={}):
-    if not file_directory:
-        file_directory=os.path.dirname(file)
-    #checking if file already exists and in case skipping it
-    vtt_file = os.path.splitext(file)[0] + ".vtt"
-    if os.path.exists(vtt_file) and os.path.getsize(vtt_file) > 0:
-        print(f"Skipping {vtt_file} because it already exists and is not empty")
-        return
-    writer_vtt = get_writer("vtt", file_directory) # get srt writer for the current directory
-    writer_vtt(transcription_result, file, options) # add empty dictionary for 'options'
+    write_outputs(file, transcription_result, {"vtt": options}, ["vtt"], file_directory)
 
 def write_tsv(file,transcription_result,file_directory="",options={}):
-    if not file_directory:
-        file_directory=os.path.dirname(file)
-    #checking if file already exists and in case skipping it
-    tsv_file = os.path.splitext(file)[0] + ".tsv"
-    if os.path.exists(tsv_file) and os.path.getsize(tsv_file) > 0:
-        print(f"Skipping {tsv_file} because it already exists and is not empty")
-        return
-    writer_tsv = get_writer("tsv", file_directory) # 
-    writer_tsv(transcription_result, file, options) # add empty dictionary for 'options'
+    write_outputs(file, transcription_result, {"tsv": options}, ["tsv"], file_directory)
 
 def write_json(file,transcription_result,file_directory="",options={}):
-   
-
-    if not file_directory:
-        file_directory=os.path.dirname(file)
-    #checking if file already exists and in case skipping it
-    json_file = os.path.splitext(file)[0] + ".json"
-    if os.path.exists(json_file) and os.path.getsize(json_file) > 0:
-        print(f"Skipping {json_file} because it already exists and is not empty")
-        return
-    writer_json = get_writer("json", file_directory) # 
-    writer_json(transcription_result, file, options) # not sure what are the options for json
+    write_outputs(file, transcription_result, {"json": options}, ["json"], file_directory)
 
 def write_files(file,transcription_result,file_directory="",options={},selected_formats=['txt', 'srt', 'vtt', 'tsv', 'json']):
-    if not file_directory:
-        file_directory = os.path.dirname(file)
-
-    if 'json' in selected_formats:
-        json_options = options.get("json", {})
-        write_json(file, transcription_result, file_directory, json_options)
-
-    if 'srt' in selected_formats:
-        srt_options = options.get("srt", {})
-        write_srt(file, transcription_result, file_directory, srt_options)
-
-    if 'txt' in selected_formats:
-        txt_options = options.get("txt", {})
-        write_txt(file, transcription_result, file_directory, txt_options)
+    # all the selected formats are rendered from one pass over the result, and the outputs
+    # that already exist are skipped (see writers.py)
+    return write_outputs(file, transcription_result, options, selected_formats, file_directory)
+
+def audio_duration(transcription_result):
+    # duration of the audio covered by a transcription, taken from its last segment
+    segments = transcription_result.get("segments") or []
+    if not segments or not isinstance(segments[-1], dict):
+        return 0.0
+    return segments[-1].get("end", 0.0)
+
+def write_existing_json(file, json_file, file_directory, options, selected_formats):
+    #reading the json file and placing it in the data variable
+    data=json.decoder.JSONDecoder().decode(open(json_file).read())
+
+    if is_old_json_format(data):
+        text_file = os.path.splitext(file)[0] + ".txt"
+
+        #reading the old text file
+        old_text=open(text_file).read()
+        old_json=data.copy()
+
+        language=infer_language_from_text(old_text)
+        new_data={}
+        new_data["text"]=old_text
+        new_data["segments"]=old_json
+        new_data["language"]=language
+
+        #rename json file into .old.json
+        os.rename(json_file, json_file+".old")
+
+        #write the new files
+        write_files(file,new_data,file_directory,options, selected_formats)
+        return new_data
+
+    else:
+        if is_new_json_format(data):
+            write_files(file,data,file_directory,options, selected_formats)
+            return data
+        else:
+            print(f"{json_file} not in the expected format, please delete it manually if you want me to continue")
+            exit(1)
 
-    if 'vtt' in selected_formats:
-        vtt_options = options.get("vtt", {})
-        write_vtt(file,transcription_result,file_directory,vtt_options)
+def write_transcription(file, transcription_result, options, selected_formats):
+    transcribed_text =transcription_result['text']
 
-    if 'tsv' in selected_formats:
-        tsv_options = options.get("tsv", {})
-        write_tsv(file,transcription_result,file_directory,tsv_options)
+    # Check if the transcribed text is empty
+    if not transcribed_text:
+        print(f"Transcribed text is empty. Skipping {file}")
+        return False
+    write_files(file,transcription_result,os.path.dirname(file),options, selected_formats)
+    return True
 
-# Function to list transcribable files in a directory
-def list_transcribable_files(directory):
-    transcribable_files = []
+def set_aside_outputs(file):
+    # the media file changed: keep its stale outputs as .stale instead of skipping over them
+    # (not .old, that is where the json migration keeps the old format)
+    for fmt in output_formats:
+        output_file = os.path.splitext(file)[0] + "." + fmt
+        if os.path.exists(output_file):
+            os.replace(output_file, output_file + ".stale")
+
+# The worker pool is kept alive across perform_transcription runs, so the models cached
+# inside the workers are reused by the next run started from the same session
+worker_pool = None
+worker_pool_size = 0
+worker_cache_stats = {}  # model cache counters of every worker process, by pid
+
+def init_transcription_worker(threads):
+    # every worker gets its share of the cores for intra-op parallelism
+    import torch
+    torch.set_num_threads(threads)
+
+def transcribe_in_worker(args):
+    file, model_name, prompt, selected_language_code, precision, model_cache_budget, vad, audio_cache, checkpoint, detect, english_model = args
+    # the model is loaded once per worker process and then reused through the model cache
+    set_model_cache_budget(model_cache_budget)
+    # with detect the language is detected here first, with the same model (see languages.py), and
+    # the files in english go to english_model if there is one
+    detection = None
+    if detect:
+        start = time.perf_counter()
+        try:
+            language, probability = detect_file_language(file, lambda: get_model(model_name, precision=precision), precision)
+        except (RuntimeError, OSError) as error:  # transcription will say why
+            print(f"Cannot detect the language of {file}: {error}")
+        else:
+            if language is not None:
+                selected_language_code = language
+                if english_model and language == "en":
+                    model_name = english_model
+            detection = (language, probability, time.perf_counter() - start, model_name)
+    transcription_result = transcribe_file(file, model_name, prompt, selected_language_code, precision, vad, audio_cache, checkpoint)
+    return file, transcription_result, os.getpid(), dict(model_cache_stats), detection
+
+def detect_language_in_worker(args):
+    # (language code, probability) of a file, detected by a worker process with its cached model
+    file, model_name, precision, model_cache_budget = args
+    set_model_cache_budget(model_cache_budget)
+    return detect_file_language(file, lambda: get_model(model_name, precision=precision), precision)
+
+def transcribe_window_in_worker(args):
+    # transcribes one window of a long file, see transcribe_in_chunks
+    audio, model_name, prompt, language, precision, model_cache_budget, vad = args
+    set_model_cache_budget(model_cache_budget)
+    model = get_model(model_name, precision=precision)
+    transcribe_options = dict(verbose=False, word_timestamps=True, fp16=precision == "fp16", task="transcribe", initial_prompt=prompt)
+    with inference_context(precision, model.device):
+        if vad:
+            transcription_result = transcribe_audio_without_silence(model, audio, language, transcribe_options)
+        else:
+            transcription_result = model.transcribe(audio, language=language, **transcribe_options)
+    return transcription_result, os.getpid(), dict(model_cache_stats)
+
+def get_worker_pool(workers):
+    global worker_pool, worker_pool_size
+    if worker_pool is not None and worker_pool_size == workers:
+        return worker_pool
+    close_worker_pool()
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"Starting {workers} worker processes, {threads} threads each")
+    context = multiprocessing.get_context("spawn")  # forking a process that already uses torch is not safe
+    worker_pool = context.Pool(workers, initializer=init_transcription_worker, initargs=(threads,))
+    worker_pool_size = workers
+    worker_cache_stats.clear()
+    return worker_pool
+
+def close_worker_pool(terminate=False):
+    global worker_pool
+    if worker_pool is None:
+        return
+    if terminate:
+        worker_pool.terminate()
+    else:
+        worker_pool.close()
+    worker_pool.join()
+    worker_pool = None
+
+atexit.register(close_worker_pool)
+
+def transcribe_in_pool(files, model_name, prompt, selected_language_code, workers, precision="fp32", model_cache_budget=None, vad=False, audio_cache=False, checkpoint=False, routes=None, failed=None, detected=None, english_model=None):
+    # Transcribes the files on a pool of worker processes, yielding (file, result) as they finish.
+    # Files are taken from the iterable only when a worker is free, so they are claimed just in time.
+    # routes: file -> (model name, language code) of the files not transcribed with model_name and selected_language_code
+    # failed, if given, is called with (file, error) for the files that could not be transcribed, and
+    # the others go on; without it the first error is raised
+    # detected, if given, has the workers detect the language of the files without a route before
+    # transcribing them (english ones with english_model), and is called with (file, language,
+    # probability, seconds, model name) for each of them
+    pool = get_worker_pool(workers)
+    results = queue.Queue()
+    in_flight = 0
+
+    def next_results():
+        result = results.get()
+        if len(result) == 2:
+            file, error = result
+            if failed is None:
+                raise error
+            failed(file, error)
+            return
+        file, transcription_result, pid, stats, detection = result
+        worker_cache_stats[pid] = stats
+        if detection is not None:
+            detected(file, *detection)
+        yield file, transcription_result
 
-    # Walk through the directory
-    for root, dirs, files in os.walk(directory):
+    try:
+        for file in files:
+            file_model, file_language = (routes or {}).get(file, (model_name, selected_language_code))
+            detect = detected is not None and file not in (routes or {})
+            task = (file, file_model, prompt, file_language, precision, model_cache_budget, vad, audio_cache, checkpoint, detect, english_model)
+            pool.apply_async(transcribe_in_worker, (task,), callback=results.put,
+                             error_callback=lambda error, file=file: results.put((file, error)))
+            in_flight += 1
+            while in_flight >= workers or (in_flight and not results.empty()):
+                in_flight -= 1
+                yield from next_results()
+        while in_flight:
+            in_flight -= 1
+            yield from next_results()
+    except BaseException:
+        # the tasks still running would deliver their results to nobody, start afresh next time
+        close_worker_pool(terminate=True)
+        raise
+
+def transcribe_in_chunks(file, model_name, prompt, selected_language_code, workers, precision="fp32", model_cache_budget=None, vad=False, audio_cache=False, checkpoint=False):
+    # Splits one long file into overlapping windows cut at silences, transcribes the windows in
+    # parallel on the worker pool and stitches them back into a single result
+    from audio import SAMPLE_RATE, split_into_windows, stitch_results
+    audio = read_audio(file, audio_cache)
+    windows, cuts = split_into_windows(audio)
+    print(f"Transcribing {len(audio) / SAMPLE_RATE / 60:.0f} minutes of audio in {len(windows)} windows on {workers} workers")
+    language = None if selected_language_code == "None" else selected_language_code
+    pool = get_worker_pool(workers)
+    # with checkpoint every window is journaled as soon as it is done, in the order of the windows
+    journal = None
+    if checkpoint and len(windows) > 1:
+        journal = Journal(file, dict(model=model_name, precision=precision, language=selected_language_code,
+                                     prompt=prompt, vad=vad, windows=windows, conditioned=False))
+        if journal.open():
+            print(f"Resuming {file}: {len(journal.windows)} of {len(windows)} windows were transcribed by an earlier run")
+    done = journal.windows if journal is not None else {}
+    missing = [index for index in range(len(windows)) if index not in done]
+    tasks = [(audio[windows[index][0]:windows[index][1]], model_name, prompt, language, precision, model_cache_budget, vad) for index in missing]
+    results = {index: result for index, (result, context) in done.items()}
+    try:
+        for index, (transcription_result, pid, stats) in zip(missing, pool.imap(transcribe_window_in_worker, tasks, chunksize=1)):
+            worker_cache_stats[pid] = stats
+            results[index] = transcription_result
+            if journal is not None:
+                journal.append(index, transcription_result)
+    except BaseException:
+        close_worker_pool(terminate=True)
+        raise
+    finally:
+        if journal is not None:
+            journal.close()
+    parts = [(start / SAMPLE_RATE, results[index]) for index, (start, end) in enumerate(windows)]
+    # without a language chosen, the one detected in the first window is used
+    return stitch_results(parts, cuts, language)
+
+def transcribe_in_batches(files, model_name, prompt, selected_language_code, batch_size, precision="fp32", audio_cache=False, routes=None, failed=None):
+    # Transcribes the files in the current process, yielding (file, result). The clips short enough
+    # for a single whisper window are gathered, grouped by length and decoded batch_size at a time;
+    # longer files, and the clips the batch decoding did not get right, go through transcribe_file.
+    # routes and failed as in transcribe_in_pool: a batch only holds clips of the same model and
+    # language, and when a batch fails all of its files do.
+    from batching import SAMPLE_RATE, batch_max_seconds, batch_group_batches, group_by_length, transcribe_batch
+    pending = {}  # (model name, language code): [(file, audio)]
+
+    def give_up(files, error):
+        if failed is None:
+            raise error
         for file in files:
-            if file.startswith('.'):
+            failed(file, error)
+
+    def transcribe_pending(route):
+        file_model, file_language = route
+        language = None if file_language == "None" else file_language
+        model = get_model(file_model, precision=precision)
+        for batch in group_by_length(pending.pop(route), batch_size):
+            print(f"Transcribing a batch of {len(batch)} clips")
+            try:
+                with inference_context(precision, model.device):
+                    results = transcribe_batch(model, [audio for file, audio in batch], language, prompt, fp16=precision == "fp16")
+            except Exception as error:
+                give_up([file for file, audio in batch], error)
                 continue
-            # Check if the file has a transcribable extension
-            if any(file.lower().endswith(ext) for ext in transcribable_extensions):
-                # Add the file to the list
-                transcribable_files.append(os.path.join(root, file))
-    return transcribable_files
-
-
-def perform_transcription(directory_to_transcribe, selected_model, options, selected_formats, prompt,selected_language_code):
-
-    # Get the list of transcribable files
-    files_to_transcribe = list_transcribable_files(directory_to_transcribe)
-
-    # Print the list of files
-    print("Files that can be transcribed:")
-    for file in files_to_transcribe:
-        print(file)
-
-
-    for file in files_to_transcribe:
-        print(f"Transcribing {file}...")
-        file_directory=os.path.dirname(file)
-
-        # the whole system of lock-unlock is being eliminated because whisper does not get better running multiple processes
-        if is_file_locked(file):   unlock_file(file)
-
-        # Check if the json file already exists and if it is old, new, or something else
-        json_file = os.path.splitext(file)[0] + ".json"
-
-        #check if the json file exists
-        if os.path.exists(json_file):
-            #reading the json file and placing it in the data variable
-            data=json.decoder.JSONDecoder().decode(open(json_file).read())
-
-            if is_old_json_format(data):
-                text_file = os.path.splitext(file)[0] + ".txt"
-
-                #reading the old text file
-                old_text=open(text_file).read()
-                old_json=data.copy()
-
-                language=infer_language_from_text(old_text)
-                new_data={}
-                new_data["text"]=old_text
-                new_data["segments"]=old_json
-                new_data["language"]=language
-
-                #rename json file into .old.json
-                os.rename(json_file, json_file+".old")
-
-                #write the new files
-                write_files(file,new_data,file_directory,options, selected_formats)
-
+            for (file, audio), transcription_result in zip(batch, results):
+                if transcription_result is None:
+                    print(f"Transcribing {file} again on its own")
+                    try:
+                        with inference_context(precision, model.device):
+                            transcription_result = model.transcribe(audio, language=language, **whisper_options(prompt, precision))
+                    except Exception as error:
+                        give_up([file], error)
+                        continue
+                yield file, transcription_result
+
+    for file in files:
+        route = (routes or {}).get(file, (model_name, selected_language_code))
+        try:
+            audio = read_audio(file, audio_cache)
+        except Exception as error:
+            give_up([file], error)
+            continue
+        if len(audio) > batch_max_seconds * SAMPLE_RATE:
+            file_model, file_language = route
+            model = get_model(file_model, precision=precision)
+            try:
+                with inference_context(precision, model.device):
+                    transcription_result = model.transcribe(audio, language=None if file_language == "None" else file_language, **whisper_options(prompt, precision))
+            except Exception as error:
+                give_up([file], error)
+                continue
+            yield file, transcription_result
+            continue
+        pending.setdefault(route, []).append((file, audio))
+        if len(pending[route]) >= batch_size * batch_group_batches:
+            yield from transcribe_pending(route)
+    for route in list(pending):
+        yield from transcribe_pending(route)
+
+class TranscriptionCancelled(Exception):
+    pass
+
+class TranscriptionControl:
+    # Lets another thread (e.g. the UI) pause or cancel a running perform_transcription.
+    # The transcription stops at the next checkpoint: between two files, and when
+    # transcribing on one process also after every 30 second window whisper decodes.
+    # With worker processes, cancelling abandons the files the workers are transcribing.
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.running = threading.Event()
+        self.running.set()
+
+    def cancel(self):
+        self.cancelled.set()
+        self.running.set()
+
+    def pause(self):
+        self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    def is_paused(self):
+        return not self.running.is_set()
+
+    def checkpoint(self):
+        # blocks while paused, raises TranscriptionCancelled once cancelled
+        self.running.wait()
+        if self.cancelled.is_set():
+            raise TranscriptionCancelled()
+
+# (first frame, frames, frames of the whole file) of the part of a file that the model.transcribe
+# calls decode, when a file takes several of them (see decoding_part)
+decoding_window = None
+
+@contextlib.contextmanager
+def decoding_part(first_frame, frames, total_frames):
+    # the model.transcribe calls in the block decode frames first_frame to first_frame + frames
+    # of a file: their progress is reported as progress through the whole file, rather than
+    # starting over from 0 with every call
+    global decoding_window
+    previous = decoding_window
+    decoding_window = (first_frame, frames, total_frames)
+    try:
+        yield
+    finally:
+        decoding_window = previous
+
+@contextlib.contextmanager
+def decoding_progress(on_update):
+    # whisper tells how far it got through the audio only to its tqdm progress bar:
+    # stand in for it, calling on_update(decoded_frames, total_frames) after every window
+    import whisper.transcribe as whisper_transcribe
+
+    class ProgressBar:
+        def __init__(self, total=None, **kwargs):
+            self.total = total
+            self.n = 0
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            return False
+
+        def update(self, n):
+            self.n += n
+            if decoding_window is None or not self.total:
+                on_update(self.n, self.total)
             else:
-                if is_new_json_format(data):
-                    write_files(file,data,file_directory,options, selected_formats)
-                else:
-                    print(f"{json_file} not in the expected format, please delete it manually if you want me to continue")
-                    exit(1)
-        else:
-
-            transcription_result=transcribe_file(file, selected_model,prompt,selected_language_code)
-            transcribed_text =transcription_result['text']
+                first_frame, frames, total_frames = decoding_window
+                on_update(first_frame + frames * min(self.n, self.total) // self.total, total_frames)
 
-            # Check if the transcribed text is empty
-            if not transcribed_text:
-                print(f"Transcribed text is empty. Skipping {file}")
+    original = whisper_transcribe.tqdm
+    whisper_transcribe.tqdm = types.SimpleNamespace(tqdm=ProgressBar)
+    try:
+        yield
+    finally:
+        whisper_transcribe.tqdm = original
+
+def perform_transcription(directory_to_transcribe, selected_model, options, selected_formats, prompt,selected_language_code, workers=1, use_manifest=True, precision="fp32", model_cache_budget=None, vad=False, split_long_files=False, audio_cache=False, progress=None, control=None, background_writes=True, batch_size=1, schedule_policy="walk", priorities=None, files=None, deduplicate=True, audio_dedup=False, metrics_path=None, profile_pattern=None, profiler="cprofile", checkpoint=True, search_index=True, language_detection=True, english_model=None, keep_going=False):
+    # progress, if given, is called with a dict for every event of the run:
+    #   {"event": "estimate", "files", "audio_seconds", "eta"}  what is left to do, before starting (not with walk)
+    #   {"event": "file", "file", "index", "found"}       a file is being looked at (found ends with + during the walk)
+    #   {"event": "audio", "file", "percent", "realtime_factor", "eta"}  decoding progress (one process only)
+    #   {"event": "done", "file", "audio_seconds", "seconds"}  a file was transcribed (seconds is None with a pool)
+    #   {"event": "failed", "file", "error"}            a file could not be transcribed (only with keep_going)
+    #   {"event": "finished" or "cancelled", "audio_seconds", "seconds", "deduplicated_seconds", "language_seconds", "metrics"}
+    # control, a TranscriptionControl, pauses or cancels the run
+    # background_writes writes the outputs of a file on a thread while the next one is transcribed
+    # batch_size > 1 (on one process) decodes the clips of up to 30 seconds batch_size at a time
+    # schedule_policy orders the files (see scheduling.py), priorities are the subdirectories (patterns) of the priority policy
+    # deduplicate writes the outputs of the copies of a file from its transcription (see dedup.py),
+    # audio_dedup also recognizes the same recording encoded differently
+    # metrics_path, if given, is the JSON lines log of the time taken by every stage (see metrics.py),
+    # the files matching profile_pattern are transcribed under the profiler
+    # checkpoint journals the windows of long files as they are done, a rerun after a crash resumes from them (see journal.py)
+    # search_index adds the json outputs written to the full-text index of the directory (see search.py)
+    # language_detection detects the language of every file once, when none is chosen, and remembers it (see languages.py);
+    # english_model, if given, transcribes the files in english (detected or chosen) instead of selected_model
+    # keep_going logs the files that cannot be transcribed or written and goes on with the others (watch
+    # mode: they are left to a later run, not tried again in a loop), instead of stopping at the first one
+    start_time = time.perf_counter()
+    instrumented = metrics_path is not None or profile_pattern is not None
+    run_metrics = None
+    if instrumented:
+        metrics.start(metrics_path, profile_pattern, profiler)
+    set_model_cache_budget(model_cache_budget)
+    transcribed_audio = 0.0
+    transcribing_seconds = 0.0  # spent in the transcription of the files, when it is measured (one file at a time)
+    # whisper's progress is only followed when somebody is listening to it
+    follow_decoding = progress is not None or control is not None
+    report = progress or (lambda event: None)
+    control = control or TranscriptionControl()
+
+    # The files are transcribed while the tree is still being walked, unless they are to be scheduled.
+    # files, if given, replaces the walk (e.g. a Watcher, see watching.py)
+    discovery = Discovery(directory_to_transcribe) if files is None else None
+    source = discovery if files is None else files
+    found = discovery.progress if discovery is not None else lambda: "?"
+
+    # Several processes, possibly on different hosts sharing the directory, can work on it together:
+    # a file is only worked on by the process holding its lease
+    lease_keeper = LeaseKeeper().start()
+
+    # The manifest remembers what was done in earlier runs, so completed files are skipped
+    # without probing their outputs
+    manifest = Manifest(directory_to_transcribe) if use_manifest else None
+    file_stats = {}
+    transcript_index = SearchIndex(directory_to_transcribe) if search_index else None
+
+    # The language of every file, detected before transcribing it, and the model it goes to. With
+    # worker processes it is detected by one of them, with its cached model: this process loads none.
+    languages = None
+    if language_detection and selected_language_code == "None" and not selected_model.endswith(".en"):
+        detect = None
+        if workers > 1 and split_long_files:
+            # one file at a time, before it is spread over the pool
+            detect = lambda file: get_worker_pool(workers).apply(detect_language_in_worker, ((file, selected_model, precision, model_cache_budget),))
+        languages = LanguageResolver(lambda: get_model(selected_model, precision=precision), manifest, precision, detect=detect)
+    # with a pool of workers transcribing a file each, the worker taking a file detects its language
+    workers_detect = languages is not None and workers > 1 and not split_long_files
+    routes = {}  # file: (model, language code), once they are known
+
+    def route(file):
+        if languages is None:
+            language = selected_language_code
+        elif workers_detect:
+            cached = languages.cached(file, file_stats.get(file))
+            if cached is None:
+                return  # see worker_detected
+            language = cached["language"]
+        else:
+            language = languages.language(file, file_stats.get(file))
+        model = english_model if english_model and language == "en" else selected_model
+        routes[file] = (model, language or "None")
+
+    def worker_detected(file, language, probability, seconds, model):
+        languages.record(file, file_stats.get(file), language, probability, seconds)
+        routes[file] = (model, language or "None")
+
+    def model_of(file):
+        return routes.get(file, (selected_model, None))[0]
+
+    def index_outputs(file, transcription_result):
+        if transcript_index is not None:
+            with metrics.stage("index", file):
+                transcript_index.add_outputs(file, transcription_result)
+
+    # Copies of a file are not transcribed again: their outputs come from the json of the file or,
+    # if it is being transcribed in this run, from its result once it is there
+    deduplicator = Deduplicator(manifest, audio_dedup, lambda file: read_audio(file, audio_cache)) if deduplicate else None
+    copies = {}  # file being transcribed: its copies, waiting for its result
+    deduplicated_audio = 0.0
+
+    def scheduled_files():
+        # the files in the order of schedule_policy: as they are found, or all of them once ordered
+        if schedule_policy == "walk":
+            yield from source
+            return
+        listed = list(source)
+        durations = probe_durations(listed, manifest)
+        # the files with a json only need their missing formats written
+        to_transcribe = [file for file in listed if not os.path.exists(os.path.splitext(file)[0] + ".json")]
+        audio_seconds, expected_seconds = estimate([durations[file] for file in to_transcribe], selected_model, precision, workers)
+        unknown = sum(1 for file in to_transcribe if durations[file] is None)
+        print(f"{len(to_transcribe)} files to transcribe, {audio_seconds / 3600:.2f} audio hours"
+              + (f" ({unknown} of unknown duration)" if unknown else ""))
+        if expected_seconds is None:
+            print(f"No measured real-time factor of {selected_model} ({precision}) on this machine yet, no estimate of the time needed")
+        else:
+            print(f"Expected to take {expected_seconds / 3600:.2f} hours with {selected_model} ({precision}) on {workers} workers")
+        report({"event": "estimate", "files": len(to_transcribe), "audio_seconds": audio_seconds, "eta": expected_seconds})
+        yield from schedule(listed, schedule_policy, durations, directory_to_transcribe, priorities or ())
+
+    def files_needing_transcription():
+        # handles the files that already have a json, yields the ones to transcribe (claimed)
+        upcoming = scheduled_files()
+        index = 0
+        while True:
+            with metrics.stage("discovery"):
+                file = next(upcoming, None)
+            if file is None:
+                break
+            index += 1
+            control.checkpoint()
+            print(f"[{index}/{found()}] {file}")
+            report({"event": "file", "file": file, "index": index, "found": found()})
+            if manifest is not None:
+                try:
+                    with metrics.stage("probe", file):
+                        state, entry = manifest.check(file, os.stat(file), selected_formats)
+                except FileNotFoundError:
+                    vanished(file)
+                    continue
+                if state == "complete":
+                    print(f"Skipping {file}, already done")
+                    continue
+
+            if not lease_keeper.claim(file):
+                print(f"Skipping {file}, it is being transcribed by {describe_lease(read_lease(file))}")
                 continue
-            write_files(file,transcription_result,file_directory,options, selected_formats)            
-        print()
 
+            if manifest is not None:
+                # another node may have finished the file between the check and the claim
+                try:
+                    file_stats[file] = os.stat(file)
+                    state, entry = manifest.check(file, file_stats[file], selected_formats)
+                except FileNotFoundError:
+                    vanished(file)
+                    continue
+                if state == "complete":
+                    print(f"Skipping {file}, already done")
+                    file_stats.pop(file)
+                    lease_keeper.release(file)
+                    continue
+
+            print(f"Transcribing {file}...")
+            file_directory=os.path.dirname(file)
+
+            if manifest is not None and state == "changed":
+                print(f"{file} changed since it was transcribed, transcribing it again")
+                set_aside_outputs(file)
+
+            # Check if the json file already exists and if it is old, new, or something else
+            json_file = os.path.splitext(file)[0] + ".json"
+
+            #check if the json file exists
+            if os.path.exists(json_file):
+                with metrics.stage("migration", file):
+                    data = write_existing_json(file, json_file, file_directory, options, selected_formats)
+                if manifest is not None:
+                    manifest.record(file, file_stats.pop(file), selected_formats, language=data.get("language"))
+                index_outputs(file, data)
+                if deduplicator is not None:
+                    deduplicator.add(file)
+                lease_keeper.release(file)
+                print()
+                continue
 
-def start_ui():
-    def open_directory_selector():
-        selected_directory = filedialog.askdirectory()  # Apre il dialogo di selezione directory
-        if selected_directory:  # Se l'utente seleziona una directory
-            directory_path.set(selected_directory)  # Aggiorna la variabile legata all'edit box
-            directory_entry.delete(0, tk.END)  # Rimuove il testo attuale dall'edit box
-            directory_entry.insert(tk.END, selected_directory)  # Inserisce il nuovo percorso nella edit box 
-            transcription_button.config(state=tk.NORMAL)  # Enable the transcription button
-  
-
-    def start_transcription():
-        # Logica per iniziare la trascrizione
-        print("Inizio trascrizione...")
-
-        chosen_model = selected_model.get()
-        print("Selected model:", chosen_model)
-
-        if chosen_model[-3:] == ".en":      selected_language = "english"
-        else:                               selected_language = language.get()
-        selected_language_code=LANGUAGES_CODES[selected_language]
-        print(f"language {selected_language_code} ({selected_language}) with the model: {selected_model.get()}")
-
-        selected_formats = [fmt for fmt, var in format_vars.items() if var.get()]
-        print("selected_formats:", selected_formats)
-
-        directory_to_check = directory_entry.get()
-        print("directory_to_check:", directory_to_check)
-
-        prompt_to_send = prompt_entry.get()
-        print("prompt_to_send:", prompt_to_send)            
-        # Initialize the options dictionary
-        options = {}
-        # Gather options for each selected format
-        for fmt in selected_formats:
-            # Initialize options for the current format
-            format_options = {}
-            if fmt in ["srt","vtt"]:
-                # Get the max line width from the corresponding entry widget
-                max_line_width = max_line_width_entries[fmt].get()
-                # Add options to the format dictionary
-                format_options["max_words_per_line"] = int(max_line_width)
-                format_options["highlight_words"] = False  # Default value, can be adjusted as needed
-                format_options["max_line_count"] = 1    
-            # Store the format options in the main options dictionary
-            options[fmt] = format_options
-
-        # Print the options for debugging
-        print("Options:", options)
-        perform_transcription(directory_to_check, chosen_model, options, selected_formats,prompt_to_send,selected_language_code)
-        print("Trascrizione completata")
-
-        
-    # Inizializza l'interfaccia grafica principale
-    root = tk.Tk()
-    root.title("Trascrittore Whisper")
-
-    # Directory frame
-    directory_frame = tk.Frame(root)
-    directory_frame.pack(pady=10)
-    directory_path = tk.StringVar()
-    tk.Label(directory_frame, text="Directory:").pack(side=tk.LEFT)
-    directory_entry = tk.Entry(directory_frame, textvariable=directory_path, width=50)
-    directory_entry.pack(side=tk.LEFT)
-    tk.Button(directory_frame, text="Sfoglia", command=open_directory_selector).pack(side=tk.LEFT)
-
-    # Model frame
-    model_frame = tk.Frame(root)
-    model_frame.pack(pady=10)
-    selected_model = tk.StringVar(value="medium.en")
-
-    standard_models_frame = tk.LabelFrame(model_frame, text="Standard models")
-    standard_models_frame.pack(side=tk.LEFT, padx=10)
-    english_models_frame = tk.LabelFrame(model_frame, text="English models")
-    english_models_frame.pack(side=tk.LEFT, padx=10)
-
-    models = [("tiny", standard_models_frame), ("small", standard_models_frame), 
-              ("base", standard_models_frame), ("medium", standard_models_frame), 
-              ("large", standard_models_frame), ("tiny.en", english_models_frame), 
-              ("small.en", english_models_frame), ("base.en", english_models_frame), 
-              ("medium.en", english_models_frame)]
-    
-    for model, frame in models:
-        tk.Radiobutton(frame, text=model, variable=selected_model, value=model).pack(anchor=tk.W)
-
-
-    # Elenco delle lingue supportate
-
-    selected_language = tk.StringVar()
-
-
-    # Menu a discesa per la selezione della lingua
-    language_frame = tk.Frame(standard_models_frame)
-    language_frame.pack(fill=tk.X, expand=True)
-    #    tk.Label(language_frame, text="Language:").pack(side=tk.LEFT)
-    language = tk.StringVar()
-    language_combobox = ttk.Combobox(language_frame, textvariable=language, state="readonly")
-    # Usa i nomi completi delle lingue come valori nel menu a discesa
-    language_combobox['values'] = list(LANGUAGES.values())
-    language_combobox.pack(side=tk.LEFT, fill=tk.X, expand=True)
-    language_combobox.set('italian')  # Imposta un valore predefinito, se necessario
-
-    # Format frame
-    format_frame = tk.LabelFrame(root, text="Output Formats")
-    format_frame.pack(pady=10)
-    formats = ["txt", "srt", "vtt", "tsv", "json"]
-    format_vars = {fmt: tk.BooleanVar(value=True) for fmt in formats}
-    max_line_width_entries = {}  # Dictionary to hold max line width entry widgets
-
-    feedback_frame = tk.Frame(root)
-    feedback_frame.pack(pady=10, fill=tk.BOTH, expand=True)
-    feedback_text = tk.Text(feedback_frame, height=10)
-    feedback_text.pack(fill=tk.BOTH, expand=True)
-
-    for fmt in formats:
-        checkbox_frame = tk.Frame(format_frame)
-        checkbox_frame.pack(anchor=tk.W)
-
-        checkbox = tk.Checkbutton(checkbox_frame, text=fmt.upper(), variable=format_vars[fmt])
-        checkbox.pack(side=tk.LEFT)
+            original = None
+            if deduplicator is not None:
+                try:
+                    with metrics.stage("dedup", file):
+                        original = deduplicator.original(file)
+                except FileNotFoundError:
+                    vanished(file)
+                    continue
+            if original in copies:
+                print(f"{file} is a copy of {original}, its outputs are written with the transcription of {original}")
+                copies[original].append(file)
+            elif original is not None and write_copy(file, original):
+                lease_keeper.release(file)
+                print()
+            else:
+                if deduplicator is not None:
+                    deduplicator.add(file)
+                    copies[file] = []
+                route(file)
+                yield file
+
+    def vanished(file):
+        # removed (or renamed away) since it was found, or while it waited in the queue of a watcher
+        print(f"Skipping {file}, it no longer exists")
+        file_stats.pop(file, None)
+        lease_keeper.release(file)
+
+    def failed(file, error):
+        # with keep_going the file is given back and left to a later run
+        if not keep_going:
+            raise error
+        print(f"Could not transcribe {file}: {error}")
+        report({"event": "failed", "file": file, "error": str(error)})
+        finish_copies(file)
+        file_stats.pop(file, None)
+        routes.pop(file, None)
+        lease_keeper.release(file)
+        print()
 
+    def write_copy(file, original, transcription_result=None):
+        # writes the missing outputs of file from the transcription of original (its json if
+        # transcription_result is not given), False if there is none
+        nonlocal deduplicated_audio
+        if transcription_result is None:
+            original_json = os.path.splitext(original)[0] + ".json"
+            try:
+                with open(original_json) as f:
+                    transcription_result = json.load(f)
+            except (OSError, ValueError):
+                return False
+            if not is_new_json_format(transcription_result):
+                return False
+            print(f"{file} is a copy of {original}, writing its outputs from {original_json}")
+        write_files(file, transcription_result, os.path.dirname(file), options, selected_formats)
+        if manifest is not None:
+            entry = manifest.lookup(original)
+            manifest.record(file, file_stats.pop(file, None) or os.stat(file), selected_formats,
+                            entry["model"] if entry else selected_model, transcription_result.get("language"))
+        index_outputs(file, transcription_result)
+        deduplicated_audio += audio_duration(transcription_result)
+        return True
+
+    def finish_copies(file, transcription_result=None):
+        # the copies of a file are written with its result, or given back if it has none
+        for copy in copies.pop(file, []):
+            if transcription_result is not None:
+                write_copy(copy, file, transcription_result)
+            file_stats.pop(copy, None)
+            lease_keeper.release(copy)
+
+    def write_transcribed(file, transcription_result, file_start=None):
+        nonlocal transcribing_seconds
+        seconds = None if file_start is None else time.perf_counter() - file_start
+        transcribing_seconds += seconds or 0.0
+        report({"event": "done", "file": file, "audio_seconds": audio_duration(transcription_result), "seconds": seconds})
+        metrics.file_done(file, audio_duration(transcription_result), seconds)
+        if not lease_keeper.holds(file):
+            print(f"Lost the lease on {file} while transcribing it, not writing the results")
+            finish_copies(file)
+            routes.pop(file, None)
+            return 0.0
+        if not transcription_result['text']:
+            print(f"Transcribed text is empty. Skipping {file}")
+            finish_copies(file)
+            remove_journal(file)
+            routes.pop(file, None)
+            lease_keeper.release(file)
+        else:
+            # written in the background while the next file is transcribed, the file keeps its lease until then
+            pending_writes.append((file, transcription_result, output_writer.submit(file, transcription_result, options, selected_formats)))
+            finish_writes()
+        print()
+        return audio_duration(transcription_result)
+
+    def finish_writes(wait=False):
+        # records the files whose outputs are on disk (all of them with wait) and gives their leases back
+        while pending_writes and (wait or pending_writes[0][2].done()):
+            file, transcription_result, written = pending_writes.pop(0)
+            try:
+                written.result()  # raises if the outputs could not be written
+            except Exception as error:
+                failed(file, error)
+                continue
+            if manifest is not None:
+                manifest.record(file, file_stats.pop(file), selected_formats, model_of(file), transcription_result.get("language"))
+            index_outputs(file, transcription_result)
+            finish_copies(file, transcription_result)
+            remove_journal(file)
+            routes.pop(file, None)
+            lease_keeper.release(file)
+
+    def decoding_update(file, file_start):
+        def on_update(decoded_frames, total_frames):
+            elapsed = time.perf_counter() - file_start
+            decoded_seconds = decoded_frames / 100  # whisper counts mel frames, 100 per second
+            realtime_factor = elapsed / decoded_seconds if decoded_seconds else None
+            eta = elapsed * (total_frames - decoded_frames) / decoded_frames if decoded_frames else None
+            report({"event": "audio", "file": file, "percent": 100 * decoded_frames / total_frames if total_frames else 100.0,
+                    "realtime_factor": realtime_factor, "eta": eta})
+            control.checkpoint()
+        return on_update
+
+    cancelled = False
+    pending_writes = []
+    output_writer = OutputWriter(background=background_writes)
+    try:
+        try:
+            if workers == 1 and batch_size > 1:
+                for file, transcription_result in transcribe_in_batches(files_needing_transcription(), selected_model, prompt, selected_language_code, batch_size, precision, audio_cache, routes, failed):
+                    transcribed_audio += write_transcribed(file, transcription_result)
+            elif workers > 1 and split_long_files:
+                # one file at a time, each spread over all the workers
+                for file in files_needing_transcription():
+                    file_start = time.perf_counter()
+                    file_model, file_language = routes.get(file, (selected_model, selected_language_code))
+                    try:
+                        with metrics.profiling(file):
+                            transcription_result=transcribe_in_chunks(file, file_model, prompt, file_language, workers, precision, model_cache_budget, vad, audio_cache, checkpoint)
+                    except Exception as error:
+                        failed(file, error)
+                        continue
+                    transcribed_audio += write_transcribed(file, transcription_result, file_start)
+            elif workers > 1:
+                for file, transcription_result in transcribe_in_pool(files_needing_transcription(), selected_model, prompt, selected_language_code, workers, precision, model_cache_budget, vad, audio_cache, checkpoint, routes, failed,
+                                                                     worker_detected if workers_detect else None, english_model):
+                    print(f"Transcribed {file}")
+                    transcribed_audio += write_transcribed(file, transcription_result)
+            else:
+                for file in files_needing_transcription():
+                    file_start = time.perf_counter()
+                    file_model, file_language = routes.get(file, (selected_model, selected_language_code))
+                    try:
+                        with metrics.profiling(file):
+                            if follow_decoding:
+                                with decoding_progress(decoding_update(file, file_start)):
+                                    transcription_result=transcribe_file(file, file_model,prompt,file_language,precision,vad,audio_cache,checkpoint)
+                            else:
+                                transcription_result=transcribe_file(file, file_model,prompt,file_language,precision,vad,audio_cache,checkpoint)
+                    except TranscriptionCancelled:
+                        raise
+                    except Exception as error:
+                        failed(file, error)
+                        continue
+                    transcribed_audio += write_transcribed(file, transcription_result, file_start)
+        except TranscriptionCancelled:
+            # the file being transcribed is left alone, its lease is released below
+            print("Transcription cancelled")
+            cancelled = True
+        finish_writes(wait=True)
+    finally:
+        output_writer.close()
+        if discovery is not None:
+            discovery.stop()
+        lease_keeper.stop()
+        if manifest is not None:
+            manifest.close()
+        if transcript_index is not None:
+            transcript_index.close()
+        if instrumented:
+            run_metrics = metrics.stop()
+
+    elapsed = time.perf_counter() - start_time
+    if transcribed_audio > 0 and elapsed > 0:
+        print(f"Transcribed {transcribed_audio / 3600:.2f} audio hours in {elapsed / 3600:.2f} hours "
+              f"({transcribed_audio / elapsed:.1f} audio hours per wall-clock hour)")
+    if deduplicate:
+        print(f"Deduplicated {deduplicated_audio / 3600:.2f} audio hours")
+    language_seconds = languages.seconds if languages is not None else 0.0
+    if languages is not None and languages.languages:
+        print("Languages: " + ", ".join(f"{language or 'no speech'} {count}" for language, count in
+                                        sorted(languages.languages.items(), key=lambda item: -item[1])))
+        against = f"{transcribing_seconds:.1f}s transcribing them" if transcribing_seconds else f"a run of {elapsed:.1f}s"
+        print(f"Detected the language of {languages.detected} files in {language_seconds:.1f}s, against {against} "
+              f"({languages.reused} more were known from earlier runs)")
+    print_model_cache_stats()
+    if not cancelled:
+        record_realtime_factor(selected_model, precision, transcribed_audio, elapsed * workers)
+    report({"event": "cancelled" if cancelled else "finished", "audio_seconds": transcribed_audio, "seconds": elapsed,
+            "deduplicated_seconds": deduplicated_audio, "language_seconds": language_seconds, "metrics": run_metrics})
+
+
+def compare_precisions(directory, model_name, compared_precisions, selected_language_code="None", sample_size=5):
+    # Transcribes a sample of the files of directory in fp32 and in each of the other precisions,
+    # reporting for each the word error rate against the fp32 transcripts, the real-time factor
+    # (seconds of computation per second of audio) and the memory taken by the model.
+    # Nothing is written next to the files.
+    from quantization import word_errors
+    files = list_transcribable_files(directory)[:sample_size]
+    if not files:
+        raise ValueError(f"No transcribable files in {directory}")
+    audios = [read_audio(file) for file in files]
+    audio_seconds = sum(len(audio) for audio in audios) / 16000
+    language = None if selected_language_code == "None" else selected_language_code
+    print(f"Comparing precisions on {len(files)} files, {audio_seconds / 60:.1f} minutes of audio")
+
+    report = {}
+    references = None
+    for precision in ["fp32"] + [precision for precision in compared_precisions if precision != "fp32"]:
+        clear_model_cache()  # one model in memory at a time
+        try:
+            model = get_model(model_name, precision=precision)
+        except ValueError as error:
+            report[precision] = {"error": str(error)}
+            print(f"{precision}: {error}")
+            continue
+        texts = []
+        start = time.perf_counter()
+        with inference_context(precision, model.device):
+            for audio in audios:
+                options = dict(whisper_options("", precision), verbose=None)
+                texts.append(model.transcribe(audio, language=language, **options)["text"])
+        elapsed = time.perf_counter() - start
+        if references is None:
+            references = texts
+        errors, words = map(sum, zip(*(word_errors(reference, text) for reference, text in zip(references, texts))))
+        report[precision] = {"wer": errors / words if words else 0.0, "realtime_factor": elapsed / audio_seconds,
+                             "model_bytes": model_size_bytes(model)}
+        print(f"{precision}: WER {report[precision]['wer']:.1%} against fp32, real-time factor "
+              f"{report[precision]['realtime_factor']:.2f}, model {report[precision]['model_bytes'] / 1024**2:.0f} MB")
+    clear_model_cache()
+    return report
+
+def format_options(selected_formats, max_words_per_line):
+    # Writer options for every selected format; max_words_per_line maps "srt"/"vtt" to the
+    # maximum number of words per subtitle line
+    options = {}
+    for fmt in selected_formats:
+        format_options = {}
         if fmt in ["srt","vtt"]:
-            max_line_width_var = tk.StringVar(value="35")  # Default max line width
-            tk.Label(checkbox_frame, text="Max words per line:").pack(side=tk.LEFT)
-            max_line_width_entry = tk.Entry(checkbox_frame, textvariable=max_line_width_var, width=5)
-            max_line_width_entry.pack(side=tk.LEFT)
-            max_line_width_entries[fmt] = max_line_width_entry  # Store entry widget in dictionary
-
-    #feedback_frame.pack(pady=10, fill=tk.BOTH, expand=True)
-    #feedback_text = tk.Text(feedback_frame, height=10)
-    #feedback_text.pack(fill=tk.BOTH, expand=True)
-
-    # Prompt frame
-    prompt_frame = tk.Frame(root)
-    prompt_frame.pack(pady=10)
-    prompt_text = tk.StringVar()
-    tk.Label(prompt_frame, text="Prompt:").pack(side=tk.LEFT)
-    prompt_entry = tk.Entry(prompt_frame, textvariable=prompt_text, width=50)
-    prompt_entry.pack(side=tk.LEFT)
-
-    # Transcription button
-    transcription_button = tk.Button(root, text="Start Transcription", command=start_transcription)
-    transcription_button.pack(pady=10)
-    transcription_button.config(state=tk.DISABLED)  # Disable the transcription button initially
-
-    root.mainloop()
-
-
-# Chiamata alla funzione per avviare l'interfaccia utente
-start_ui()
+            format_options["max_words_per_line"] = int(max_words_per_line.get(fmt, 35))
+            format_options["highlight_words"] = False  # Default value, can be adjusted as needed
+            format_options["max_line_count"] = 1
+        options[fmt] = format_options
+    return options
+
+def language_code(language, model_name):
+    # accepts a language code, a language name or "auto"; the .en models only do english
+    if model_name.endswith(".en"):
+        return "en"
+    if language in (None, "", "auto", "None", LANGUAGES["None"]):
+        return "None"
+    if language in LANGUAGES:
+        return language
+    if language.lower() in LANGUAGES_CODES:
+        return LANGUAGES_CODES[language.lower()]
+    raise ValueError(f"Unknown language {language}")
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Transcribes the audio and video files of a directory and its subdirectories with Whisper. "
+                    "Without a directory the graphical interface is started.")
+    parser.add_argument("directory", nargs="?", help="directory to transcribe")
+    parser.add_argument("--gui", action="store_true", help="start the graphical interface")
+    parser.add_argument("--model", default="medium.en", choices=list(whisper_models), help="Whisper model (default: %(default)s)")
+    parser.add_argument("--language", default="auto", help="language code or name, or auto to detect it (default: %(default)s)")
+    parser.add_argument("--formats", default=",".join(output_formats),
+                        help="comma separated output formats among " + ", ".join(output_formats) + " (default: all)")
+    parser.add_argument("--srt-max-words-per-line", type=int, default=35, metavar="N", help="(default: %(default)s)")
+    parser.add_argument("--vtt-max-words-per-line", type=int, default=35, metavar="N", help="(default: %(default)s)")
+    parser.add_argument("--prompt", default="", help="initial prompt given to Whisper")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes (default: %(default)s)")
+    parser.add_argument("--precision", default="fp32", choices=precisions, help="(default: %(default)s)")
+    parser.add_argument("--model-memory", type=float, metavar="GB", help="memory budget for the cached models")
+    parser.add_argument("--vad", action="store_true", help="skip the silence, transcribing only the speech")
+    parser.add_argument("--split-long-files", action="store_true", help="spread every file over all the workers")
+    parser.add_argument("--audio-cache", action="store_true", help="cache the decoded audio on disk")
+    parser.add_argument("--batch-size", type=int, default=1, metavar="N",
+                        help="decode the clips of up to 30 seconds N at a time, with one worker (default: %(default)s)")
+    parser.add_argument("--no-manifest", action="store_true", help="do not use the manifest of completed files")
+    parser.add_argument("--no-checkpoint", action="store_true",
+                        help="transcribe long files in one go, without the journal a rerun resumes from after a crash")
+    parser.add_argument("--english-model", choices=[model for model in whisper_models if model.endswith(".en")],
+                        help="transcribe the files in english with this english-only model (e.g. medium.en), the others with --model")
+    parser.add_argument("--no-language-detection", action="store_true",
+                        help="with --language auto, leave the detection to whisper on every transcription instead of detecting "
+                             "the language of every file once and remembering it")
+    parser.add_argument("--no-search-index", action="store_true",
+                        help="do not add the transcripts to the full-text index searched with search.py")
+    parser.add_argument("--no-dedup", action="store_true", help="transcribe the copies of a file again instead of reusing its transcription")
+    parser.add_argument("--dedup-audio", action="store_true",
+                        help="also recognize copies encoded differently by fingerprinting their audio (decodes every new file)")
+    parser.add_argument("--schedule", default="walk", choices=schedule_policies,
+                        help="order of the files: as found, shortest or longest first, or by subdirectory priority (default: %(default)s)")
+    parser.add_argument("--priority", default="", metavar="DIRS",
+                        help="comma separated subdirectories (or patterns) transcribed first, in this order, with --schedule priority")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running, transcribing the files that appear or change in the directory")
+    parser.add_argument("--poll", action="store_true", help="with --watch, poll the directory instead of using inotify (network mounts)")
+    parser.add_argument("--stability", type=float, default=5.0, metavar="SECONDS",
+                        help="with --watch, how long a file must stay unchanged before it is transcribed (default: %(default)s)")
+    parser.add_argument("--metrics", metavar="FILE", help="log the time taken by every stage to this JSON lines file, with a summary at the end")
+    parser.add_argument("--profile", metavar="PATTERN", help="profile the transcription of the files whose name matches PATTERN")
+    parser.add_argument("--profiler", default="cprofile", choices=metrics.profilers, help="(default: %(default)s)")
+    parser.add_argument("--compare-precisions", metavar="LIST",
+                        help="instead of transcribing, compare the comma separated precisions with fp32 on a sample of the files")
+    parser.add_argument("--compare-files", type=int, default=5, metavar="N", help="size of that sample (default: %(default)s)")
+    arguments = parser.parse_args(argv)
+
+    selected_formats = [fmt.strip() for fmt in arguments.formats.split(",") if fmt.strip()]
+    for fmt in selected_formats:
+        if fmt not in output_formats:
+            parser.error(f"unknown format {fmt}")
+    try:
+        arguments.language_code = language_code(arguments.language, arguments.model)
+    except ValueError as error:
+        parser.error(str(error))
+    arguments.selected_formats = selected_formats
+    arguments.options = format_options(selected_formats, {"srt": arguments.srt_max_words_per_line, "vtt": arguments.vtt_max_words_per_line})
+    if arguments.directory and not os.path.isdir(arguments.directory):
+        parser.error(f"{arguments.directory} is not a directory")
+    if arguments.dedup_audio and arguments.no_dedup:
+        parser.error("--dedup-audio and --no-dedup exclude each other")
+    if arguments.watch and (arguments.schedule != "walk" or arguments.batch_size > 1):
+        parser.error("--watch transcribes the files as they come, without --schedule or --batch-size")
+    arguments.compared_precisions = None
+    if arguments.compare_precisions:
+        arguments.compared_precisions = [precision.strip() for precision in arguments.compare_precisions.split(",") if precision.strip()]
+        for precision in arguments.compared_precisions:
+            if precision not in precisions:
+                parser.error(f"unknown precision {precision}")
+        if not arguments.directory:
+            parser.error("--compare-precisions needs a directory")
+    return arguments
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    if arguments.gui or not arguments.directory:
+        from gui import start_ui
+        start_ui()
+        return
+    if arguments.compared_precisions:
+        compare_precisions(arguments.directory, arguments.model, arguments.compared_precisions,
+                           arguments.language_code, max(1, arguments.compare_files))
+        return
+    model_cache_budget = int(arguments.model_memory * 1024**3) if arguments.model_memory else None
+    workers = max(1, arguments.workers)
+    settings = dict(use_manifest=not arguments.no_manifest, checkpoint=not arguments.no_checkpoint, deduplicate=not arguments.no_dedup, audio_dedup=arguments.dedup_audio,
+                    search_index=not arguments.no_search_index, language_detection=not arguments.no_language_detection,
+                    english_model=arguments.english_model,
+                    precision=arguments.precision,
+                    model_cache_budget=model_cache_budget, vad=arguments.vad,
+                    split_long_files=arguments.split_long_files, audio_cache=arguments.audio_cache,
+                    batch_size=max(1, arguments.batch_size), schedule_policy=arguments.schedule,
+                    metrics_path=arguments.metrics, profile_pattern=arguments.profile, profiler=arguments.profiler,
+                    priorities=[directory.strip() for directory in arguments.priority.split(",") if directory.strip()])
+    if not arguments.watch:
+        perform_transcription(arguments.directory, arguments.model, arguments.options, arguments.selected_formats,
+                              arguments.prompt, arguments.language_code, workers, **settings)
+        return
+
+    # While waiting for the next file nothing may be left half done: the outputs are written before
+    # moving on, and several workers share each file instead of each taking one
+    from watching import Watcher
+    settings.update(background_writes=False, split_long_files=True, keep_going=True)
+    watcher = Watcher(arguments.directory, polling=True if arguments.poll else None, stability=arguments.stability).start()
+    print(f"Watching {arguments.directory}, press Ctrl+C to stop")
+    try:
+        perform_transcription(arguments.directory, arguments.model, arguments.options, arguments.selected_formats,
+                              arguments.prompt, arguments.language_code, workers, files=watcher, **settings)
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    finally:
+        watcher.stop()
+
+# (only when run as a script: the worker processes import this module)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import os
+import time
+import queue
+import threading
+
+from discovery import ignored_directories, is_transcribable, iter_transcribable_files
+
+# Watch mode: instead of walking the tree once, the media files that appear or change under
+# the root are handed over for transcription as long as the process runs.
+# Changes are noticed through inotify (with the optional watchdog package) or, on network
+# mounts where inotify does not see the writes of other machines, by polling. A file is only
+# handed over once its size and mtime have not changed for stability_seconds, i.e. once it
+# has been completely uploaded.
+
+stability_seconds = 5.0
+poll_interval = 10.0
+full_scan_every = 30  # polls; in between only the directories whose mtime changed are listed again
+
+
+def is_watched_directory(name):
+    return not name.startswith('.') and name not in ignored_directories
+
+
+class DirectoryScanner:
+    # Incremental polling of a tree: remembers every directory's mtime, subdirectories and
+    # media files, so that a scan only lists again the directories that changed (a file added,
+    # removed or renamed changes the mtime of its directory) and only stats the files in them.
+    # Files rewritten in place do not change their directory: full scans catch them.
+
+    def __init__(self, root):
+        self.root = root
+        self.directories = {}  # path: (mtime_ns, subdirectories, media files)
+        self.files = {}  # path: (size, mtime_ns)
+
+    def scan(self, full=False):
+        # Returns the media files that are new or changed since the previous scan
+        changed = []
+        seen_directories = set()
+        stack = [self.root]
+        while stack:
+            directory = stack.pop()
+            seen_directories.add(directory)
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            cached = self.directories.get(directory)
+            if cached is not None and cached[0] == mtime_ns and not full:
+                stack.extend(cached[1])
+                continue
+            subdirectories, files = [], []
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if is_watched_directory(entry.name):
+                                    subdirectories.append(entry.path)
+                            elif is_transcribable(entry.name):
+                                stat = entry.stat()
+                                files.append(entry.path)
+                                if self.files.get(entry.path) != (stat.st_size, stat.st_mtime_ns):
+                                    self.files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+                                    changed.append(entry.path)
+                        except OSError:
+                            continue
+            except OSError as error:
+                print(f"Cannot read {directory}: {error}")
+                continue
+            if cached is not None:
+                for removed in set(cached[2]) - set(files):
+                    self.files.pop(removed, None)
+            self.directories[directory] = (mtime_ns, subdirectories, files)
+            stack.extend(reversed(subdirectories))
+        for removed in set(self.directories) - seen_directories:
+            for file in self.directories.pop(removed)[2]:
+                self.files.pop(file, None)
+        return changed
+
+
+class Watcher:
+    # Iterating over a Watcher yields the new or changed media files under root once they are
+    # stable, until stop() is called. The files already there when it starts are yielded too.
+    # Stable files wait in a queue of at most maxsize files: while it is full (transcription is
+    # behind) they stay in the candidates and are offered again later.
+
+    def __init__(self, root, maxsize=100, polling=None, stability=None, interval=None):
+        self.root = root
+        self.queue = queue.Queue(maxsize)
+        self.stability = stability_seconds if stability is None else stability
+        self.interval = poll_interval if interval is None else interval
+        self.polling = polling
+        self.candidates = {}  # path: (size, mtime_ns, since) of the files waiting to be stable
+        self.queued = set()
+        self.handed_over = {}  # path: (size, mtime_ns) of the version last queued
+        self.mutex = threading.Lock()
+        self.stopped = threading.Event()
+        self.threads = []
+        self.observer = None
+
+    def start(self):
+        if not self.polling:
+            try:
+                self.start_observer()
+            except ImportError:
+                if self.polling is False:
+                    raise
+                print("watchdog is not installed, polling the directory instead")
+            except OSError as error:
+                # e.g. too many directories for the inotify watch limit
+                print(f"Cannot watch {self.root} ({error}), polling it instead")
+        if self.observer is None:
+            self.threads.append(threading.Thread(target=self.poll, daemon=True))
+        else:
+            self.threads.append(threading.Thread(target=self.catch_up, daemon=True))
+        self.threads.append(threading.Thread(target=self.settle, daemon=True))
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def start_observer(self):
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                path = getattr(event, "dest_path", "") or event.src_path
+                if event.event_type not in ("created", "modified", "moved", "closed"):
+                    return
+                if event.is_directory:
+                    if event.event_type in ("created", "moved"):
+                        # a directory moved in arrives with its content
+                        for file in iter_transcribable_files(path):
+                            watcher.notice(file)
+                else:
+                    watcher.notice(path)
+
+        observer = Observer()
+        observer.schedule(Handler(), self.root, recursive=True)
+        observer.start()
+        self.observer = observer
+
+    def notice(self, path):
+        # a file may have changed: it becomes a candidate, timed from its next look
+        relative = os.path.relpath(path, self.root)
+        parts = relative.split(os.sep)
+        if relative.startswith("..") or not is_transcribable(parts[-1]) or not all(is_watched_directory(part) for part in parts[:-1]):
+            return
+        with self.mutex:
+            self.candidates.setdefault(path, None)
+
+    def catch_up(self):
+        # the files that were already there when the observer started
+        for file in iter_transcribable_files(self.root):
+            if self.stopped.is_set():
+                return
+            self.notice(file)
+
+    def poll(self):
+        scanner = DirectoryScanner(self.root)
+        polls = 0
+        while not self.stopped.is_set():
+            for file in scanner.scan(full=polls % full_scan_every == 0):
+                self.notice(file)
+            polls += 1
+            self.stopped.wait(self.interval)
+
+    def settle(self):
+        # moves the candidates that stopped changing to the queue
+        while not self.stopped.wait(min(1.0, self.stability / 4)):
+            now = time.monotonic()
+            with self.mutex:
+                candidates = list(self.candidates.items())
+            for path, seen in candidates:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    with self.mutex:
+                        self.candidates.pop(path, None)  # gone (or renamed, the new name is noticed)
+                    continue
+                if seen is None or seen[:2] != (stat.st_size, stat.st_mtime_ns):
+                    with self.mutex:
+                        self.candidates[path] = (stat.st_size, stat.st_mtime_ns, now)
+                    continue
+                if now - seen[2] < self.stability or stat.st_size == 0:
+                    continue
+                version = seen[:2]
+                with self.mutex:
+                    if self.handed_over.get(path) == version:
+                        # noticed again without changing (e.g. by a full scan)
+                        if self.candidates.get(path) == seen:
+                            del self.candidates[path]
+                        continue
+                    if path in self.queued:
+                        continue  # still waiting for transcription, offered again once it is taken
+                try:
+                    self.queue.put_nowait(path)
+                except queue.Full:
+                    break  # back-pressure: try again at the next round
+                with self.mutex:
+                    self.queued.add(path)
+                    self.handed_over[path] = version
+                    if self.candidates.get(path) == seen:
+                        del self.candidates[path]
+
+    def __iter__(self):
+        while not self.stopped.is_set():
+            try:
+                path = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            with self.mutex:
+                self.queued.discard(path)
+            yield path
+
+    def pending(self):
+        # files noticed but not yet handed over
+        with self.mutex:
+            return len(self.candidates) + len(self.queued)
+
+    def stop(self):
+        self.stopped.set()
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+        for thread in self.threads:
+            thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,271 @@
+import os
+import re
+import json
+import time
+import tempfile
+import contextlib
+import concurrent.futures
+
+import metrics
+
+# Output engine: renders every selected format of a transcription from a single pass over
+# its segments and words, producing byte for byte what whisper's writers (whisper.utils)
+# produce, and writes each file aside then renames it, so that a crash never leaves a
+# truncated output behind (which a rerun would otherwise skip as done).
+
+output_formats = ["txt", "srt", "vtt", "tsv", "json"]
+output_extensions = {fmt: "." + fmt for fmt in output_formats}
+
+# flush every output to disk before renaming it; on slow network storage this is the
+# most expensive part of writing, turn it off to trade crash safety for speed
+fsync_outputs = True
+
+
+def default_file_mode():
+    # the permissions open() would give a new file (mkstemp creates them private)
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+file_mode = default_file_mode()
+
+# small files rewritten by several processes (read, updated, replaced) are locked meanwhile;
+# holding the lock takes milliseconds, one older than stale_lock_seconds is abandoned
+lock_timeout = 30
+stale_lock_seconds = 60
+
+
+def format_timestamp(seconds, always_include_hours=False, decimal_marker="."):
+    # same as whisper.utils.format_timestamp
+    milliseconds = round(seconds * 1000.0)
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    seconds, milliseconds = divmod(milliseconds, 1_000)
+    hours_marker = f"{hours:02d}:" if always_include_hours or hours > 0 else ""
+    return f"{hours_marker}{minutes:02d}:{seconds:02d}{decimal_marker}{milliseconds:03d}"
+
+def srt_timestamp(seconds):
+    return format_timestamp(seconds, always_include_hours=True, decimal_marker=",")
+
+def vtt_timestamp(seconds):
+    return format_timestamp(seconds)
+
+
+def subtitle_options(options):
+    # the options that decide how subtitles are broken into lines, as a hashable key
+    options = options or {}
+    return (options.get("max_line_width"), options.get("max_line_count"),
+            bool(options.get("highlight_words", False)), options.get("max_words_per_line"))
+
+def iterate_subtitles(segments, max_line_width=None, max_line_count=None, max_words_per_line=None):
+    # Groups the word timings into subtitles (lists of word timings, "\n" marking line
+    # breaks) with the rules of whisper's SubtitlesWriter.iterate_result
+    preserve_segments = max_line_count is None or max_line_width is None
+    max_line_width = max_line_width or 1000
+    max_words_per_line = max_words_per_line or 1000
+    line_len = 0
+    line_count = 1
+    subtitle = []
+    last = next((word["start"] for segment in segments for word in segment["words"]),
+                segments[0]["start"] if segments else None) or 0.0
+    for segment in segments:
+        words = segment["words"]
+        for chunk_index in range(0, len(words), max_words_per_line):
+            for i, original_timing in enumerate(words[chunk_index:chunk_index + max_words_per_line]):
+                timing = dict(original_timing)
+                long_pause = not preserve_segments and timing["start"] - last > 3.0
+                has_room = line_len + len(timing["word"]) <= max_line_width
+                seg_break = i == 0 and len(subtitle) > 0 and preserve_segments
+                if line_len > 0 and has_room and not long_pause and not seg_break:
+                    # line continuation
+                    line_len += len(timing["word"])
+                else:
+                    # new line
+                    timing["word"] = timing["word"].strip()
+                    if len(subtitle) > 0 and max_line_count is not None and (long_pause or line_count >= max_line_count) or seg_break:
+                        # subtitle break
+                        yield subtitle
+                        subtitle = []
+                        line_count = 1
+                    elif line_len > 0:
+                        # line break
+                        line_count += 1
+                        timing["word"] = "\n" + timing["word"]
+                    line_len = len(timing["word"].strip())
+                subtitle.append(timing)
+                last = timing["start"]
+    if len(subtitle) > 0:
+        yield subtitle
+
+def subtitle_cues(result, options=None):
+    # Returns the (start, end, text) cues of the subtitles, times in seconds: shared by srt
+    # and vtt, which only differ in how they print the times
+    max_line_width, max_line_count, highlight_words, max_words_per_line = subtitle_options(options)
+    segments = result["segments"]
+    cues = []
+    if len(segments) > 0 and "words" in segments[0]:
+        for subtitle in iterate_subtitles(segments, max_line_width, max_line_count, max_words_per_line):
+            subtitle_text = "".join(word["word"] for word in subtitle)
+            if highlight_words:
+                # whisper compares the printed times, i.e. to the millisecond
+                last = subtitle[0]["start"]
+                all_words = [timing["word"] for timing in subtitle]
+                for i, this_word in enumerate(subtitle):
+                    if round(last * 1000) != round(this_word["start"] * 1000):
+                        cues.append((last, this_word["start"], subtitle_text))
+                    highlighted = "".join(re.sub(r"^(\s*)(.*)$", r"\1<u>\2</u>", word) if j == i else word
+                                          for j, word in enumerate(all_words))
+                    cues.append((this_word["start"], this_word["end"], highlighted))
+                    last = this_word["end"]
+            else:
+                cues.append((subtitle[0]["start"], subtitle[-1]["end"], subtitle_text))
+    else:
+        for segment in segments:
+            cues.append((segment["start"], segment["end"], segment["text"].strip().replace("-->", "->")))
+    return cues
+
+
+def render_txt(result, cues=None):
+    return "".join(segment["text"].strip() + "\n" for segment in result["segments"])
+
+def render_tsv(result, cues=None):
+    lines = ["start\tend\ttext\n"]
+    for segment in result["segments"]:
+        lines.append(f"{round(1000 * segment['start'])}\t{round(1000 * segment['end'])}\t"
+                     f"{segment['text'].strip().replace(chr(9), ' ')}\n")
+    return "".join(lines)
+
+def render_json(result, cues=None):
+    return json.dumps(result)
+
+def render_srt(result, cues):
+    return "".join(f"{index}\n{srt_timestamp(start)} --> {srt_timestamp(end)}\n{text}\n\n"
+                   for index, (start, end, text) in enumerate(cues, start=1))
+
+def render_vtt(result, cues):
+    return "WEBVTT\n\n" + "".join(f"{vtt_timestamp(start)} --> {vtt_timestamp(end)}\n{text}\n\n"
+                                  for start, end, text in cues)
+
+renderers = {"txt": render_txt, "srt": render_srt, "vtt": render_vtt, "tsv": render_tsv, "json": render_json}
+subtitle_formats = {"srt", "vtt"}
+
+
+def output_path(file, fmt, file_directory=""):
+    base = os.path.splitext(os.path.basename(file))[0]
+    return os.path.join(file_directory or os.path.dirname(file), base + output_extensions[fmt])
+
+def render_outputs(file, result, options={}, selected_formats=output_formats, file_directory=""):
+    # Returns {path: text} for the selected formats whose output does not exist yet (or is empty).
+    # The subtitles are broken into lines once for all the formats sharing the same options.
+    outputs = {}
+    cues = {}
+    for fmt in output_formats:
+        if fmt not in selected_formats:
+            continue
+        path = output_path(file, fmt, file_directory)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            print(f"Skipping {path} because it already exists and is not empty")
+            continue
+        with metrics.stage("render:" + fmt, file):
+            format_cues = None
+            if fmt in subtitle_formats:
+                key = subtitle_options(options.get(fmt))
+                if key not in cues:
+                    cues[key] = subtitle_cues(result, options.get(fmt))
+                format_cues = cues[key]
+            outputs[path] = renderers[fmt](result, format_cues)
+    return outputs
+
+@contextlib.contextmanager
+def atomic_file(path, mode="w", encoding=None, fsync=False):
+    # A file object on a temporary file next to path, renamed over path when the block ends
+    # (and removed if it raises): whoever reads path sees the old file or the new one, never
+    # half of one
+    descriptor, temporary_file = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".", suffix=".tmp")
+    try:
+        os.chmod(temporary_file, file_mode)
+        with os.fdopen(descriptor, mode, encoding=encoding) as f:
+            yield f
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temporary_file, path)
+    except BaseException:
+        try:
+            os.remove(temporary_file)
+        except FileNotFoundError:
+            pass
+        raise
+
+def atomic_write(path, text):
+    # writes text to a temporary file next to path and renames it over path
+    with atomic_file(path, "w", encoding="utf-8", fsync=fsync_outputs) as f:
+        f.write(text)
+
+@contextlib.contextmanager
+def exclusive_lock(path, timeout=lock_timeout):
+    # Serializes a read-modify-write of path between processes (and hosts sharing the
+    # filesystem) through a "<path>.lock" created with O_EXCL. A lock older than
+    # stale_lock_seconds was left by a process that died holding it and is broken.
+    lock_file = path + ".lock"
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            os.close(os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            break
+        except FileExistsError:
+            pass
+        try:
+            if time.time() - os.path.getmtime(lock_file) > stale_lock_seconds:
+                os.remove(lock_file)
+                continue
+        except FileNotFoundError:
+            continue  # released meanwhile
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{lock_file} is still held after {timeout}s")
+        time.sleep(0.05)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(lock_file)
+        except FileNotFoundError:
+            pass
+
+def write_outputs(file, result, options={}, selected_formats=output_formats, file_directory=""):
+    # Renders and writes the selected formats of a transcription, returns the paths written
+    outputs = render_outputs(file, result, options, selected_formats, file_directory)
+    for path, text in outputs.items():
+        with metrics.stage("write:" + path.rsplit(".", 1)[-1], file):
+            atomic_write(path, text)
+    return list(outputs)
+
+
+class OutputWriter:
+    # Writes the outputs on a background thread, so that the next file can be transcribed
+    # while the outputs of the previous one go to (slow) storage. submit returns a future
+    # of the paths written; with background=False the work is done in submit itself.
+
+    def __init__(self, background=True):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1) if background else None
+
+    def submit(self, file, result, options={}, selected_formats=output_formats, file_directory=""):
+        if self.executor is not None:
+            return self.executor.submit(write_outputs, file, result, options, selected_formats, file_directory)
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(write_outputs(file, result, options, selected_formats, file_directory))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+    def close(self):
+        # waits for the pending writes
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()